@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Literal
-import os
 import geopandas as gpd
-import pickle
-from app.api.utils.constants import DATA_PATH
+from app.api.utils import artifacts, build_pipeline, matrix_store
+from app.api.utils.matrix_formats import MEDIA_TYPES, STREAMERS, negotiate_format
+from app.api.utils.matrix_queries import sub_matrix, k_nearest
+from app.api.schemes.enums import MatrixFormat
 
 router = APIRouter(tags=["Accessibility Matrix"])
 
@@ -13,25 +15,68 @@ class AccessibilityMatrixModel(BaseModel):
     columns: list[int]
     values: list[list[float]]
 
+class NearestDestinationsModel(BaseModel):
+    origin: int
+    destinations: list[int]
+    times: list[float]
+
 
 def load_matrix(region_id: int, graph_type: Literal['car', 'inter']):
-    matrix_path = os.path.join(DATA_PATH, f'matrices/{region_id}_{graph_type}_matrix.pickle')
-    
     try:
-        with open(matrix_path, 'rb') as f:
-            matrix = pickle.load(f)
-        return matrix
+        build_pipeline.ensure(region_id, [f'{graph_type}_matrix'])
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        return artifacts.load_matrix(region_id, graph_type)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"{graph_type.capitalize()} matrix file not found for region {region_id}")
 
-@router.get('/{region_id}/get_matrix', response_model=AccessibilityMatrixModel)
-def get_accessibility_matrix(region_id: int, graph_type: Literal['car', 'inter']) -> AccessibilityMatrixModel:
+def load_matrix_slice(region_id: int, graph_type: Literal['car', 'inter'], origins: list[int] | None, destinations: list[int] | None):
+    # a tiled matrix is read only where the requested rows and columns are
+    tiled = matrix_store.open_tiled(region_id, graph_type)
+    if tiled is None:
+        return load_matrix(region_id, graph_type)
+    return tiled.frame(origins, destinations)
+
+@router.get('/{region_id}/get_matrix', response_model=AccessibilityMatrixModel, responses={
+    200: {'content': {media_type: {} for media_type in MEDIA_TYPES.values()}}
+})
+def get_accessibility_matrix(region_id: int, graph_type: Literal['car', 'inter'], matrix_format: MatrixFormat | None = Query(None, alias='format'), accept: str | None = Header(None)):
+    """
+    Matrix format is chosen by `format` or, if it is omitted, by the Accept header (json by default).
+    Every format is streamed chunk by chunk straight from the stored matrix.
+    """
     matrix = load_matrix(region_id, graph_type)
-    
-    res = {
-        'index': matrix.index,
-        'columns': matrix.columns,
-        'values': matrix.values
-    }
-
-    return res
\ No newline at end of file
+    return _matrix_response(matrix, region_id, graph_type, negotiate_format(matrix_format, accept))
+
+def _matrix_response(matrix, region_id: int, graph_type: str, matrix_format: MatrixFormat) -> StreamingResponse:
+    headers = {}
+    if matrix_format not in (MatrixFormat.json, MatrixFormat.ndjson):
+        headers['Content-Disposition'] = f'attachment; filename="{region_id}_{graph_type}_matrix.{matrix_format.value}"'
+
+    return StreamingResponse(STREAMERS[matrix_format](matrix), media_type=MEDIA_TYPES[matrix_format], headers=headers)
+
+@router.get('/{region_id}/get_submatrix', response_model=AccessibilityMatrixModel, responses={
+    200: {'content': {media_type: {} for media_type in MEDIA_TYPES.values()}}
+})
+def get_accessibility_submatrix(region_id: int, graph_type: Literal['car', 'inter'],
+                                origins: list[int] | None = Query(None), destinations: list[int] | None = Query(None),
+                                max_time: float | None = Query(None, gt=0, description='Pairs slower than this (minutes) are returned as null'),
+                                matrix_format: MatrixFormat | None = Query(None, alias='format'), accept: str | None = Header(None)):
+    try:
+        matrix = load_matrix_slice(region_id, graph_type, origins, destinations)
+        result = sub_matrix(matrix, origins, destinations, max_time)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Settlements not found in {graph_type} matrix: {e.args[0]}")
+    return _matrix_response(result, region_id, graph_type, negotiate_format(matrix_format, accept))
+
+@router.get('/{region_id}/get_nearest', response_model=list[NearestDestinationsModel])
+def get_nearest_destinations(region_id: int, graph_type: Literal['car', 'inter'], origins: list[int] = Query(...),
+                             k: int = Query(10, ge=1), destinations: list[int] | None = Query(None),
+                             max_time: float | None = Query(None, gt=0),
+                             exclude_self: bool = Query(True, description='Skip the origin itself when it is among the destinations')) -> list[NearestDestinationsModel]:
+    try:
+        matrix = load_matrix_slice(region_id, graph_type, origins, destinations)
+        return k_nearest(matrix, origins, k, destinations, max_time, exclude_self)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Settlements not found in {graph_type} matrix: {e.args[0]}")
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException
+from app.api.utils import jobs
+
+router = APIRouter(tags=["Jobs"])
+
+@router.get('/jobs')
+def list_jobs(status: str | None = None, region_id: int | None = None) -> list[dict]:
+    """
+    Known jobs (the latest finished ones and everything queued or running), oldest first
+    """
+    return [job.as_dict() for job in jobs.list_jobs(status, region_id)]
+
+@router.get('/jobs/{job_id}')
+def get_job(job_id: str) -> dict:
+    """
+    Status of a job with its timings: seconds spent in the queue and running, result or error
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.as_dict()
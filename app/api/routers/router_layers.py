@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, BackgroundTasks
+from app.api.utils.constants import REGIONS_DICT
+from app.api.utils import layer_store
+
+router = APIRouter(tags=["Service Layers"])
+
+@router.get('/{region_id}/layers')
+def get_layers_manifest(region_id: int) -> dict[str, dict]:
+    """
+    Locally mirrored layers of the region with the time each one was fetched
+    """
+    return layer_store.read_manifest(region_id)
+
+@router.put('/{region_id}/layers/refresh')
+def refresh_layers(region_id: int, background_tasks: BackgroundTasks, layers: list[str] | None = None) -> dict[str, str]:
+    unknown = [layer for layer in layers or [] if layer not in layer_store.LAYER_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown layers: {unknown}. Available: {list(layer_store.LAYER_SOURCES)}")
+    if region_id not in REGIONS_DICT:
+        raise HTTPException(status_code=404, detail=f"Region {region_id} is not configured")
+    background_tasks.add_task(layer_store.refresh_region, region_id, layers)
+    return {layer: 'scheduled' for layer in layers or layer_store.LAYER_SOURCES}
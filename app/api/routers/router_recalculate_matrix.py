@@ -1,10 +1,12 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
 from typing import Literal
-import os
 from loguru import logger
-from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, DATA_PATH
-from app.api.utils.get_matrix import load_graph, load_settlement_points, to_pickle, calculate_accessibility_matrix
+from app.api.utils.constants import REGIONS_DICT
+from app.api.utils.get_matrix import update_matrix
+from app.api.utils.matrix_store import matrix_path
+import app.api.utils.urban_api as ua
+from app.api.utils import jobs
 
 router = APIRouter(tags=["Accessibility Matrix"])
 
@@ -14,29 +16,39 @@ class RecalculateMatrixResponse(BaseModel):
     graph_type: str
     message: str
     matrix_file: str
+    job_id: str
+    job_status: str
 
-def calc_matrix(region_id: int, graph_type: str, matrix_file: str):
+def calc_matrix(region_id: int, graph_type: str, full: bool = False) -> str:
     region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
     
     try:
-        graph = load_graph(region_id, graph_type)
-        points = load_settlement_points(region_id)
-        local_crs = REGIONS_CRS[region_id]
-        acc_matrix = calculate_accessibility_matrix(graph, points, local_crs, region_id, graph_type)
-        to_pickle(acc_matrix, matrix_file)
-        logger.success(f'{graph_type.capitalize()} matrix for {region_name} has been successfully created.')
+        # recalculation is about the current settlements, not the cached ones
+        ua.fetch_territories.cache.invalidate()
+        return update_matrix(region_id, graph_type, full)
     except Exception as e:
         logger.error(f"Error while recalculating the {graph_type} matrix for region {region_name}: {str(e)}")
+        raise
 
 @router.put('/{region_id}/recalculate_matrix', response_model=RecalculateMatrixResponse)
-def recalculate_accessibility_matrix(region_id: int, graph_type: Literal['car', 'inter'], background_tasks: BackgroundTasks) -> RecalculateMatrixResponse:
-    matrix_file = os.path.join(DATA_PATH, f'matrices/{region_id}_{graph_type}_matrix.pickle')
-    background_tasks.add_task(calc_matrix, region_id, graph_type, matrix_file)
-    
+def recalculate_accessibility_matrix(response: Response, region_id: int, graph_type: Literal['car', 'inter'], mode: Literal['incremental', 'full'] = 'incremental') -> RecalculateMatrixResponse:
+    """
+    Incremental mode routes only settlements added or moved since the last build and drops deleted ones;
+    it falls back to a full rebuild when the graph was rebuilt in between.
+    `status` stays 'in_progress' as before, the queued job is in `job_id`/`job_status` and the Location header.
+    """
+    matrix_file = matrix_path(region_id, graph_type)
+    # a repeated request joins the running recalculation of the same mode
+    job = jobs.submit('recalculate_matrix', region_id, calc_matrix, region_id, graph_type, mode == 'full',
+                      key=('recalculate_matrix', region_id, graph_type, mode), steps=['graph'])
+    response.headers.update(jobs.headers(job))
+
     return RecalculateMatrixResponse(
-        status="in_progress",
+        status='in_progress',
         region_id=region_id,
         graph_type=graph_type,
-        message=f"Matrix recalculation for region {region_id} and graph type '{graph_type}' has started.",
-        matrix_file=matrix_file
+        message=f"Matrix recalculation ({mode}) for region {region_id} and graph type '{graph_type}' has started.",
+        matrix_file=matrix_file,
+        job_id=job.id,
+        job_status=job.status
     )
\ No newline at end of file
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from app.api.utils import build_pipeline, ttl_cache, indicator_outbox
+from app.api.utils.result_cache import criteria_cache
+
+router = APIRouter(tags=["Service Status"])
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    regions: dict[int, dict[str, str]]
+
+@router.get('/ping')
+def ping() -> dict[str, str]:
+    return {'ping': 'pong!'}
+
+@router.get('/ready', response_model=ReadinessResponse)
+def readiness() -> ReadinessResponse:
+    """
+    Per-region state of every artifact: missing, building, ready, failed or skipped.
+    Readiness covers the artifacts built at startup; on-demand ones (the grade grid unless
+    FRAME_GRADE_SOURCE=grid) show up once requested.
+    The service accepts requests regardless, missing artifacts are built on first use.
+    """
+    regions = build_pipeline.region_status()
+    ready = all(status == 'ready' for steps in regions.values()
+                for step, status in steps.items() if step in build_pipeline.STARTUP_STEPS)
+    return ReadinessResponse(ready=ready, regions=regions)
+
+@router.post('/cache/invalidate')
+def invalidate_cache(name: str | None = None) -> list[str]:
+    """
+    Drop cached Urban API reference data (regions, territories, territory types), all of it by default
+    """
+    if name is not None and name not in ttl_cache.cache_names():
+        raise HTTPException(status_code=404, detail=f"Cache {name} not found. Available: {ttl_cache.cache_names()}")
+    return ttl_cache.invalidate(name)
+
+@router.get('/outbox')
+def outbox_stats() -> dict[str, int]:
+    """
+    Indicator values waiting for delivery (pending), given up after too many attempts (dead) and delivered (sent)
+    """
+    return indicator_outbox.stats()
+
+@router.get('/cache/criteria')
+def criteria_cache_stats() -> dict[str, int]:
+    """
+    Size and hit rate of the /transport_criteria result cache
+    """
+    return criteria_cache.stats()
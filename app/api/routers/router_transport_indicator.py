@@ -1,18 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+import io
 import json
 from loguru import logger
 import shapely
-import os
 import pandas as pd
 import geopandas as gpd
 import networkx as nx
-import pickle
 from transport_frames.framebuilder.frame import Frame
 from transport_frames.frame_grader.advanced_grade import AdvancedGrader
 from transport_frames.indicators.indicator_terr import indicator_territory
 from transport_frames.indicators.utils import create_service_dict
-from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, DATA_PATH, RESPONSE_MESSAGE
+from app.api.utils.constants import REGIONS_CRS, RESPONSE_MESSAGE, FRAME_GRADE_SOURCE, ACCESSIBILITY_ENGINE
 import app.api.utils.urban_api as ua
+from app.api.utils import layer_store, indicator_writer, indicator_outbox
+from app.api.utils import artifacts, build_pipeline, jobs
+from app.api.utils.gather import gather
+from app.api.utils.assessment_context import AssessmentContext
+from app.api.utils.result_cache import criteria_cache, geometry_hash
+from app.api.utils import facility_engine, grade_grid
 from enum import Enum
 
 class Indicator(Enum):
@@ -75,61 +82,47 @@ INDICATORS_IDS = {
 router = APIRouter(tags=["Territory Calculation"])
 
 def load_frame(region_id: int) -> nx.MultiDiGraph:
-    frame_path = os.path.join(DATA_PATH, f'frames/{region_id}_frame.pickle')
-    if not os.path.exists(frame_path):
+    try:
+        return artifacts.load_frame(region_id)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Frame for region {region_id} not found.")
-    with open(frame_path, 'rb') as f:
-        frame = pickle.load(f)
-    return frame
-
-def load_graph(region_id: int):
-    graph_file = os.path.join(DATA_PATH, f'graphs/{region_id}_car_graph.pickle')
-    if not os.path.exists(graph_file):
-        region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
-        raise FileNotFoundError(f"Car graph for {region_name} not found.")
-    
-    with open(graph_file, "rb") as f:
-        graph = pickle.load(f)
-    
-    return graph
-
-def load_matrices(region_id: int):
-    car_matrix_path = os.path.join(DATA_PATH, f'matrices/{region_id}_car_matrix.pickle')
-    inter_matrix_path = os.path.join(DATA_PATH, f'matrices/{region_id}_inter_matrix.pickle')
-
-    with open(car_matrix_path, 'rb') as f:
-        matrix_car = pickle.load(f)
-    with open(inter_matrix_path, 'rb') as f:
-        matrix_inter = pickle.load(f)
 
-    return matrix_car, matrix_inter
+def ensure_artifacts(region_id: int, steps: list[str]) -> None:
+    try:
+        build_pipeline.ensure(region_id, steps)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 def _gpsp_from_units_gdfs(units_gdfs : dict[int, gpd.GeoDataFrame]) -> gpd.GeoDataFrame:
     deepest_level = max(units_gdfs.keys())
     return units_gdfs[deepest_level]
 
 
-def _assess_criteria(region_id : int, projects_gdf : gpd.GeoDataFrame, regional_scenario_id : int | None = None) -> gpd.GeoDataFrame:
-    
+def _assess_criteria(region_id : int, projects_gdf : gpd.GeoDataFrame, regional_scenario_id : int | None = None,
+                     context : AssessmentContext | None = None) -> gpd.GeoDataFrame:
+    context = context or AssessmentContext(region_id)
     projects_gdf['name'] = ''
+    ensure_artifacts(region_id, ['frame', 'car_matrix', 'inter_matrix'])
     # загружаем фрейм и оцениваем каждый полигон гдфа по каркасу
-    frame = load_frame(region_id)
-    graded_territory = Frame.grade_territory(frame, projects_gdf)
+    if FRAME_GRADE_SOURCE == 'grid':
+        ensure_artifacts(region_id, ['grade_grid'])
+        graded_territory = grade_grid.grade_territory(region_id, projects_gdf)
+    else:
+        graded_territory = Frame.grade_territory(context.frame(), projects_gdf)
 
     # получаем количество сервисов
-    bus_stops = ua.get_bus_stops(region_id)
-    train_stations = ua.get_train_stations(region_id)
-    airports = ua.get_airports(region_id)
-    ports = ua.get_ports(region_id)
+    bus_stops = context.layer('bus_stops')
+    train_stations = context.layer('train_stations')
+    airports = context.layer('airports')
+    ports = context.layer('ports')
     
-    units_gdfs, towns_gdfs = ua.fetch_territories(region_id)
-    towns_gdfs['geometry'] = towns_gdfs['geometry'].representative_point()
+    units_gdfs, towns_gdfs = context.territories()
     settlements_polygons = _gpsp_from_units_gdfs(units_gdfs)
     if settlements_polygons is None:
         raise HTTPException(status_code=404, detail="Administrative units not found")
     
     # загружаем матрички по региону
-    matrix_car, matrix_inter = load_matrices(region_id)
+    matrix_car, matrix_inter = context.matrices()
 
     local_crs = REGIONS_CRS[region_id] # local_crs = settlements_points.estimate_utm_crs()
     grader = AdvancedGrader(local_crs)
@@ -149,39 +142,20 @@ def _assess_criteria(region_id : int, projects_gdf : gpd.GeoDataFrame, regional_
     )
     return cri
 
-def _assess_indicator(region_id : int, projects_gdf : gpd.GeoDataFrame, regional_scenario_id : int | None = None) -> gpd.GeoDataFrame:
-
-    # загружаем необходимые данные с бд
-    railway_stations = ua.get_train_stations(region_id)
-    railway_paths = ua.get_train_paths(region_id)
-    bus_stops = ua.get_bus_stops(region_id)
-    bus_routes = ua.get_bus_routes(region_id)
-    fuel_stations = ua.get_fuel_stations(region_id)
-    local_aerodrome = ua.get_airports(region_id)
-    international_aerodrome = ua.get_international_airports(region_id)
-    water_objects = ua.get_water_objects(region_id)
-    nature_reserve = ua.get_protected_areas(region_id)
-
-    region_admin_center = ua.get_region_admin_center(region_id)
+def _assess_indicator(region_id : int, projects_gdf : gpd.GeoDataFrame, regional_scenario_id : int | None = None,
+                      context : AssessmentContext | None = None) -> gpd.GeoDataFrame:
+    context = context or AssessmentContext(region_id)
+    ensure_artifacts(region_id, ['graph'])
+    # загружаем необходимые данные с бд (параллельно)
+    layers = context.service_layers()
+    region_admin_center = context.region_admin_center()
     local_crs = REGIONS_CRS[region_id]
 
-    services = create_service_dict(
-                                railway_stations=railway_stations,
-                                railway_paths=railway_paths,
-                                bus_stops=bus_stops,
-                                bus_routes=bus_routes,
-                                fuel_stations=fuel_stations,
-                                local_aerodrome=local_aerodrome,
-                                international_aerodrome=international_aerodrome,
-                                water_objects=water_objects,
-                                nature_reserve=nature_reserve,          
-                                local_crs=local_crs)
+    services = create_service_dict(**layers, local_crs=local_crs)
     
-    graph = load_graph(region_id)
-    graph.graph['crs'] = int(graph.graph['crs'])
+    graph = context.graph()
 
-    units_gdfs, towns_gdfs = ua.fetch_territories(region_id)
-    towns_gdfs['geometry'] = towns_gdfs['geometry'].representative_point()
+    units_gdfs, towns_gdfs = context.territories()
     district_points = ua.get_admin_centers(units_gdfs,towns_gdfs,3)
     settlement_points = ua.get_admin_centers(units_gdfs,towns_gdfs,4)
     districts_polygons = units_gdfs[3]
@@ -195,6 +169,11 @@ def _assess_indicator(region_id : int, projects_gdf : gpd.GeoDataFrame, regional
                         districts = districts_polygons,
                         local_crs = local_crs
                         )
+    if ACCESSIBILITY_ENGINE == 'nearest_facility':
+        point_services = {name: services.get(name) for name in facility_engine.POINT_SERVICES}
+        values = facility_engine.territory_accessibility(region_id, projects_gdf, point_services)
+        for column in values.columns:
+            ind[column] = values[column].replace(float('inf'), float('nan')).to_numpy()
     return ind
 
 
@@ -204,9 +183,12 @@ def assess_geojson(region_id : int, geojson : dict, regional_scenario_id : int |
     # перевод геоджсона в гдф
     gdf = gpd.GeoDataFrame.from_features(geojson['features'], crs=4326)
 
-    cri = _assess_criteria(region_id, gdf, regional_scenario_id)
-
-    return cri['overall_assessment'].tolist()
+    # the same polygons against the same frame, matrices and layers give the same answer
+    ensure_artifacts(region_id, ['frame', 'car_matrix', 'inter_matrix'])
+    key = (region_id, regional_scenario_id, geometry_hash(gdf),
+           artifacts.artifacts_version(region_id, ['frame', 'car_matrix', 'inter_matrix']),
+           layer_store.layers_version(region_id))
+    return criteria_cache.get(key, lambda: _assess_criteria(region_id, gdf, regional_scenario_id)['overall_assessment'].tolist())
 
 def _get_project_geometry(project_scenario_id : int, token : str):
     scenario_info = ua.get_scenario_by_id(project_scenario_id, token)
@@ -218,66 +200,76 @@ def _get_project_geometry(project_scenario_id : int, token : str):
 def _get_regional_scenario_id(project_scenario_id : int, token : str):
     return None
 
-def safe_cast(value, to_type, default=None):
-    if pd.isna(value): 
-        return default
-    return to_type(value)
+CRITERIA_COLUMNS = {
+    Indicator.FRAME_GRADE: ('grade', float),
+    Indicator.OVERALL_ASSESSMENT: ('overall_assessment', float),
+}
+
+INDICATOR_COLUMNS = {
+    Indicator.TO_REGION_ADMIN_CENTER: ('to_region_admin_center_km', float),
+    Indicator.TO_REG1: ('to_reg_1_km', float),
+    Indicator.FUEL_STATIONS_ACCESSIBILITY: ('fuel_stations_accessibility_min', float),
+    Indicator.NUMBER_OF_FUEL_STATIONS: ('number_of_fuel_stations', int),
+    Indicator.LOCAL_AERODROME_ACCESSIBILITY: ('local_aerodrome_accessibility_min', float),
+    Indicator.NUMBER_OF_LOCAL_AERODROME: ('number_of_local_aerodrome', int),
+    Indicator.INTERNATIONAL_AERODROME_ACCESSIBILITY: ('international_aerodrome_accessibility_min', float),
+    Indicator.NUMBER_OF_INTERNATIONAL_AERODROME: ('number_of_international_aerodrome', int),
+    Indicator.RAILWAY_STATIONS_ACCESSIBILITY: ('railway_stations_accessibility_min', float),
+    Indicator.NUMBER_OF_RAILWAY_STATIONS: ('number_of_railway_stations', int),
+    # Indicator.PORTS_ACCESSIBILITY: ('ports_accessibility_min', float),
+    Indicator.NUMBER_OF_PORTS: ('number_of_ports', int),
+    # Indicator.BUS_STOPS_ACCESSIBILITY: ('bus_stops_accessibility_min', float),
+    Indicator.NUMBER_OF_BUS_STOPS: ('number_of_bus_stops', int),
+    # Indicator.NUMBER_OF_WATER_OBJECTS: ('number_of_water_objects', float),
+    Indicator.WATER_OBJECTS_ACCESSIBILITY: ('water_objects_accessibility_min', float),
+    # Indicator.NUMBER_OF_NATURE_RESERVE: ('number_of_nature_reserve', int),
+    Indicator.NATURE_RESERVE_ACCESSIBILITY: ('nature_reserve_accessibility_min', float),
+    Indicator.TRAIN_PATHS_LENGTH: ('train_path_length_km', float),
+    Indicator.NUMBER_OF_BUS_ROUTES: ('number_of_bus_routes', int),
+    Indicator.TO_NEARESRT_DISTRICT_CENTER: ('to_nearest_district_center_km', float),
+    Indicator.TO_NEAREST_SETTLEMENT: ('to_nearest_settlement_km', float),
+    Indicator.ROAD_DENSITY: ('road_density_km/km2', float)
+}
 
-def _save_indicators(project_scenario_id : int, cri : gpd.GeoDataFrame, ind : gpd.GeoDataFrame, token : str):
-    ... # im saving something
+def _save_indicators(project_scenario_id : int, cri : gpd.GeoDataFrame, ind : gpd.GeoDataFrame, token : str) -> indicator_writer.WriteSummary:
     # интерпретацию сохранять в поле commentary
     text = AdvancedGrader.interpret_gdf(cri)   
     overall_assessment_comment = str.join(' ', text[0][1])
     result_cri = cri.iloc[0]
     result_ind = ind.iloc[0]
-    indicators = {
-        Indicator.FRAME_GRADE: safe_cast(result_cri['grade'], float),
-        Indicator.OVERALL_ASSESSMENT: safe_cast(result_cri['overall_assessment'], float),
-        Indicator.TO_REGION_ADMIN_CENTER: safe_cast(result_ind['to_region_admin_center_km'], float),
-        Indicator.TO_REG1: safe_cast(result_ind['to_reg_1_km'], float),
-        Indicator.FUEL_STATIONS_ACCESSIBILITY: safe_cast(result_ind['fuel_stations_accessibility_min'], float),
-        Indicator.NUMBER_OF_FUEL_STATIONS: safe_cast(result_ind['number_of_fuel_stations'], int),
-        Indicator.LOCAL_AERODROME_ACCESSIBILITY: safe_cast(result_ind['local_aerodrome_accessibility_min'], float),
-        Indicator.NUMBER_OF_LOCAL_AERODROME: safe_cast(result_ind['number_of_local_aerodrome'], int),
-        Indicator.INTERNATIONAL_AERODROME_ACCESSIBILITY: safe_cast(result_ind['international_aerodrome_accessibility_min'], float),
-        Indicator.NUMBER_OF_INTERNATIONAL_AERODROME: safe_cast(result_ind['number_of_international_aerodrome'], int),
-        Indicator.RAILWAY_STATIONS_ACCESSIBILITY: safe_cast(result_ind['railway_stations_accessibility_min'], float),
-        Indicator.NUMBER_OF_RAILWAY_STATIONS: safe_cast(result_ind['number_of_railway_stations'], int),
-        # Indicator.PORTS_ACCESSIBILITY: safe_cast(result_ind['ports_accessibility_min'], float),
-        Indicator.NUMBER_OF_PORTS: safe_cast(result_ind['number_of_ports'], int),
-        # Indicator.BUS_STOPS_ACCESSIBILITY: safe_cast(result_ind['bus_stops_accessibility_min'], float),
-        Indicator.NUMBER_OF_BUS_STOPS: safe_cast(result_ind['number_of_bus_stops'], int),
-        # Indicator.NUMBER_OF_WATER_OBJECTS: safe_cast(result_ind['number_of_water_objects'], float),
-        Indicator.WATER_OBJECTS_ACCESSIBILITY: safe_cast(result_ind['water_objects_accessibility_min'], float),
-        # Indicator.NUMBER_OF_NATURE_RESERVE: safe_cast(result_ind['number_of_nature_reserve'], int),
-        Indicator.NATURE_RESERVE_ACCESSIBILITY: safe_cast(result_ind['nature_reserve_accessibility_min'], float),
-        Indicator.TRAIN_PATHS_LENGTH: safe_cast(result_ind['train_path_length_km'], float),
-        Indicator.NUMBER_OF_BUS_ROUTES: safe_cast(result_ind['number_of_bus_routes'], int),
-        Indicator.TO_NEARESRT_DISTRICT_CENTER: safe_cast(result_ind['to_nearest_district_center_km'], float),
-        Indicator.TO_NEAREST_SETTLEMENT: safe_cast(result_ind['to_nearest_settlement_km'], float),
-        Indicator.ROAD_DENSITY: safe_cast(result_ind['road_density_km/km2'], float)
-    }
-
-    for indicator, value in indicators.items():
-        indicator_id = INDICATORS_IDS[indicator]
-        comment = overall_assessment_comment if indicator == Indicator.OVERALL_ASSESSMENT else "-"
-        ua.post_scenario_indicator(indicator_id, project_scenario_id, value, token, comment)
-        logger.success(f'ind={indicator} id={indicator_id} v={value}')
+    comments = {INDICATORS_IDS[Indicator.OVERALL_ASSESSMENT]: overall_assessment_comment}
+
+    values = indicator_writer.scenario_values(result_cri, project_scenario_id,
+                                              {INDICATORS_IDS[i]: spec for i, spec in CRITERIA_COLUMNS.items()}, comments)
+    values += indicator_writer.scenario_values(result_ind, project_scenario_id,
+                                               {INDICATORS_IDS[i]: spec for i, spec in INDICATOR_COLUMNS.items()})
+    # stored first, so a failed upload is retried by the outbox flusher instead of recomputed
+    row_ids = indicator_outbox.enqueue(values, token)
+    summary = indicator_outbox.flush(row_ids)
 
     for i in result_cri.index:
         logger.success(f'{i} : {result_cri.loc[i]}')
     for i in result_ind.index:
         logger.success(f'{i} : {result_ind.loc[i]}')
-    # { scenario_id : project_scenario_id, commentary : my_interpr, value : foobar }
-    return logger.success('Calculations completed')
+    logger.success('Calculations completed')
+    return summary
 
-def _assess_and_save(region_id : int, project_scenario_id : int, token : str):
+def _assess_and_save(region_id : int, project_scenario_id : int, token : str, cancel : jobs.CancelToken | None = None) -> indicator_writer.WriteSummary:
+    # a newer submission for the same scenario cancels this one between stages
+    check = cancel.check if cancel is not None else lambda stage: None
+    check('fetch')
     project_geometry = _get_project_geometry(project_scenario_id, token)
     regional_scenario_id = _get_regional_scenario_id(project_scenario_id, token)
     project_gdf = gpd.GeoDataFrame(geometry=[project_geometry], crs=4326)
-    cri = _assess_criteria(region_id, project_gdf, regional_scenario_id)
-    ind = _assess_indicator(region_id, project_gdf, regional_scenario_id)
-    _save_indicators(project_scenario_id, cri, ind, token) # im saving something to somewhere
+    # territories, layers and the graph are fetched once for both stages
+    context = AssessmentContext(region_id)
+    check('criteria')
+    cri = _assess_criteria(region_id, project_gdf, regional_scenario_id, context)
+    check('indicators')
+    ind = _assess_indicator(region_id, project_gdf, regional_scenario_id, context)
+    context.log_report()
+    check('save')
+    return _save_indicators(project_scenario_id, cri, ind, token) # im saving something to somewhere
 
 def _get_token_from_request(request : Request) -> str:
     auth_header = request.headers.get('Authorization')
@@ -306,7 +298,92 @@ def _get_token_from_request(request : Request) -> str:
 
 
 @router.post('/{region_id}/transport_criteria_project')
-def assess_project(request : Request, region_id : int, project_scenario_id : int, background_tasks: BackgroundTasks):
+def assess_project(request : Request, response : Response, region_id : int, project_scenario_id : int) -> str:
+    """
+    Runs as a job; the body is the same message as before, the job is in the Location and X-Job-Id headers
+    """
     token = _get_token_from_request(request)
-    background_tasks.add_task(_assess_and_save, region_id, project_scenario_id, token)
-    return RESPONSE_MESSAGE
\ No newline at end of file
+    job = jobs.submit('transport_criteria_project', region_id, _assess_and_save, region_id, project_scenario_id, token,
+                      key=('transport_criteria_project', project_scenario_id),
+                      steps=['graph', 'frame', 'car_matrix', 'inter_matrix'], supersede=True)
+    response.headers.update(jobs.headers(job))
+    return RESPONSE_MESSAGE
+
+
+class BatchCriteriaRequest(BaseModel):
+    features: list[dict] = []
+    scenario_ids: list[int] = []
+
+PARQUET_MEDIA_TYPES = {'application/vnd.apache.parquet', 'application/x-parquet', 'application/octet-stream'}
+
+def _criteria_table(region_id : int, ids : list, gdf : gpd.GeoDataFrame, regional_scenario_id : int | None = None) -> list[dict]:
+    duplicated = pd.Index(ids)[pd.Index(ids).duplicated()].unique().tolist()
+    if duplicated:
+        raise HTTPException(status_code=400, detail=f"Territory ids must be unique, repeated: {duplicated[:10]}")
+    # one grade_territory / get_criteria pass over every territory, shared inputs are loaded once
+    cri = _assess_criteria(region_id, gdf.reset_index(drop=True), regional_scenario_id)
+    table = pd.DataFrame(cri.drop(columns=[c for c in ('geometry', 'name') if c in cri.columns]))
+    table = table.astype(object).where(table.notna(), None)
+    # the caller's id comes first and is the only `id` in a row
+    table = table.rename(columns={'id': 'criteria_id'})
+    table.insert(0, 'id', ids)
+    return table.to_dict(orient='records')
+
+def _read_parquet_territories(data : bytes) -> tuple[list, gpd.GeoDataFrame]:
+    """
+    GeoParquet, or plain parquet with WKB in a `geometry` column (EPSG:4326); ids from an `id` column if present
+    """
+    try:
+        gdf = gpd.read_parquet(io.BytesIO(data))
+    except ValueError:
+        # no geo metadata
+        df = pd.read_parquet(io.BytesIO(data))
+        gdf = gpd.GeoDataFrame(df.drop(columns='geometry'), geometry=shapely.from_wkb(df['geometry'].to_numpy()), crs=4326)
+    ids = gdf['id'].tolist() if 'id' in gdf.columns else list(range(len(gdf)))
+    return ids, gpd.GeoDataFrame(geometry=gdf.geometry.values, crs=gdf.crs or 4326)
+
+@router.post('/{region_id}/transport_criteria_batch')
+def assess_batch(request : Request, region_id : int, body : BatchCriteriaRequest, regional_scenario_id : int | None = None) -> list[dict]:
+    """
+    Criteria for many territories at once: GeoJSON features (id from the feature or its position)
+    and/or project scenarios (id is the scenario id, requires the Authorization header)
+    """
+    ids = [feature.get('id', (feature.get('properties') or {}).get('id', i)) for i, feature in enumerate(body.features)]
+    geometries = list(gpd.GeoDataFrame.from_features(body.features, crs=4326).geometry) if body.features else []
+    if body.scenario_ids:
+        token = _get_token_from_request(request)
+        projects = gather({scenario_id: (lambda s=scenario_id: _get_project_geometry(s, token)) for scenario_id in body.scenario_ids})
+        ids += body.scenario_ids
+        geometries += [projects[scenario_id] for scenario_id in body.scenario_ids]
+    if not geometries:
+        raise HTTPException(status_code=400, detail="Nothing to assess: pass features or scenario_ids")
+    return _criteria_table(region_id, ids, gpd.GeoDataFrame(geometry=geometries, crs=4326), regional_scenario_id)
+
+@router.post('/{region_id}/transport_criteria_batch/parquet')
+async def assess_batch_parquet(request : Request, region_id : int, regional_scenario_id : int | None = None) -> list[dict]:
+    """
+    Same as /transport_criteria_batch for large sets: the request body is a (Geo)Parquet file
+    """
+    if request.headers.get('content-type', '').split(';')[0] not in PARQUET_MEDIA_TYPES:
+        raise HTTPException(status_code=415, detail=f"Expected a parquet body: {sorted(PARQUET_MEDIA_TYPES)}")
+    data = await request.body()
+    try:
+        ids, gdf = _read_parquet_territories(data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read territories: {e}")
+    return await run_in_threadpool(_criteria_table, region_id, ids, gdf, regional_scenario_id)
+
+@router.post('/{region_id}/facility_accessibility')
+def assess_facility_accessibility(region_id : int, geojson : dict, layers : list[str] | None = None) -> list[dict]:
+    """
+    Minutes by car from each territory to the nearest object of each mirrored layer, looked up
+    in per-layer nearest-facility fields (one multi-source Dijkstra per layer, shared by all requests)
+    """
+    unknown = [layer for layer in layers or [] if layer not in layer_store.LAYER_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown layers: {unknown}. Available: {list(layer_store.LAYER_SOURCES)}")
+    ensure_artifacts(region_id, ['graph'])
+    gdf = gpd.GeoDataFrame.from_features(geojson['features'], crs=4326)
+    values = facility_engine.territory_accessibility(region_id, gdf, facility_engine.mirrored_layers(region_id, layers))
+    values = values.astype(object).where(values.notna() & (values != float('inf')), None)
+    return values.to_dict(orient='records')
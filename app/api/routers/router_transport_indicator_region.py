@@ -1,16 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import FileResponse
 import json
-from loguru import logger
+from typing import Literal
 import shapely
-import os
-import pandas as pd
 import geopandas as gpd
 import networkx as nx
-import pickle
-from transport_frames.indicators.indicator_area import indicator_area, preprocess_service_accessibility
+from transport_frames.indicators.indicator_area import indicator_area
 from transport_frames.indicators.utils import create_service_dict
-from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, DATA_PATH, RESPONSE_MESSAGE
+from app.api.utils.constants import REGIONS_CRS, RESPONSE_MESSAGE, ACCESSIBILITY_ENGINE
 import app.api.utils.urban_api as ua
+from app.api.utils import layer_store, indicator_writer, indicator_outbox
+from app.api.utils.artifacts import load_graph, load_matrices
+from app.api.utils import build_pipeline, jobs
+from app.api.utils.gather import gather_services
+from app.api.utils import accessibility_store, facility_engine
 from enum import Enum
 
 class Indicator(Enum):
@@ -62,111 +65,125 @@ INDICATORS_IDS = {
 
 router = APIRouter(tags=["Region Calculation"])
 
-def load_graph(region_id: int):
-    graph_file = os.path.join(DATA_PATH, f'graphs/{region_id}_car_graph.pickle')
-    if not os.path.exists(graph_file):
-        region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
-        raise FileNotFoundError(f"Car graph for {region_name} not found.")
-    
-    with open(graph_file, "rb") as f:
-        graph = pickle.load(f)
-    
-    return graph
-
-def load_matrices(region_id: int):
-    car_matrix_path = os.path.join(DATA_PATH, f'matrices/{region_id}_car_matrix.pickle')
-    inter_matrix_path = os.path.join(DATA_PATH, f'matrices/{region_id}_inter_matrix.pickle')
-
-    with open(car_matrix_path, 'rb') as f:
-        matrix_car = pickle.load(f)
-    with open(inter_matrix_path, 'rb') as f:
-        matrix_inter = pickle.load(f)
-
-    return matrix_car, matrix_inter
-
 def _assess_region_indicators(region_id : int) -> list[gpd.GeoDataFrame]:
-    car_graph = load_graph(region_id)
-    car_graph.graph['crs'] = int(car_graph.graph['crs'])
-    matrix_car, matrix_inter = load_matrices(region_id)
-
-    railway_stations = ua.get_train_stations(region_id)
-    railway_paths = ua.get_train_paths(region_id)
-    bus_stops = ua.get_bus_stops(region_id)
-    bus_routes = ua.get_bus_routes(region_id)
-    fuel_stations = ua.get_fuel_stations(region_id)
-    local_aerodrome = ua.get_airports(region_id)
-    international_aerodrome = ua.get_international_airports(region_id)
-    water_objects = ua.get_water_objects(region_id)
-    nature_reserve = ua.get_protected_areas(region_id)
+    build_pipeline.ensure(region_id, ['graph', 'car_matrix', 'inter_matrix'])
+    layers, extra = gather_services(region_id, {
+        'territories': lambda: ua.fetch_territories(region_id),
+        'region_admin_center': lambda: ua.get_region_admin_center(region_id),
+        'car_graph': lambda: load_graph(region_id),
+        'matrices': lambda: load_matrices(region_id),
+    })
+    car_graph = extra['car_graph']
+    matrix_car, matrix_inter = extra['matrices']
     local_crs = REGIONS_CRS[region_id]
 
-    services = create_service_dict(
-                                railway_stations=railway_stations,
-                                railway_paths=railway_paths,
-                                bus_stops=bus_stops,
-                                bus_routes=bus_routes,
-                                fuel_stations=fuel_stations,
-                                local_aerodrome=local_aerodrome,
-                                international_aerodrome=international_aerodrome,
-                                water_objects=water_objects,
-                                nature_reserve=nature_reserve,          
-                                local_crs=local_crs)
+    services = create_service_dict(**layers, local_crs=local_crs)
     
-    units_gdfs, towns_gdfs = ua.fetch_territories(region_id)
+    units_gdfs, towns_gdfs = extra['territories']
     towns_gdfs['geometry'] = towns_gdfs['geometry'].representative_point()
     region_polygon = units_gdfs[2]
     districts_polygons = units_gdfs[3]
     settlements_polygons = units_gdfs[4]
-    region_admin_center = ua.get_region_admin_center(region_id)
+    region_admin_center = extra['region_admin_center']
     
-    preprocessed_accessibility = preprocess_service_accessibility(towns_gdfs, services, car_graph, local_crs)
+    # stored per region and data version, recomputed only when the graph, settlements or a service layer change
+    preprocessed_accessibility = accessibility_store.service_accessibility(region_id, towns_gdfs, services, car_graph, local_crs)
     ind_area = indicator_area(car_graph, [region_polygon, districts_polygons, settlements_polygons], preprocessed_accessibility, services, local_crs, matrix_car, matrix_inter, region_admin_center)
+    if ACCESSIBILITY_ENGINE == 'nearest_facility':
+        _nearest_facility_accessibility(region_id, ind_area, towns_gdfs, services)
 
     return ind_area
 
-def safe_cast(value, to_type, default=None):
-    if pd.isna(value): 
-        return default
-    return to_type(value)
-
-def _save_indicators(ind_area: list[gpd.GeoDataFrame]): 
+def _nearest_facility_accessibility(region_id : int, ind_area : list[gpd.GeoDataFrame], towns_gdfs : gpd.GeoDataFrame,
+                                    services : dict) -> None:
+    # the areas keep the territory ids they went in with, values are aligned on them
+    point_services = {name: services.get(name) for name in facility_engine.POINT_SERVICES}
     for gdf in ind_area:
-        for territory_id, row in gdf.iterrows():  
-            indicators = {
-                Indicator.NUMBER_OF_RAILWAY_STATIONS: safe_cast(row['number_of_railway_stations'], int),
-                Indicator.RAILWAY_STATIONS_ACCESSIBILITY : safe_cast(row['railway_stations_accessibility_min'], float),
-                Indicator.NUMBER_OF_FUEL_STATIONS : safe_cast(row['number_of_fuel_stations'], int),
-                Indicator.FUEL_STATIONS_ACCESSIBILITY : safe_cast(row['fuel_stations_accessibility_min'], float),
-                Indicator.NUMBER_OF_PORTS : safe_cast(row['number_of_ports'], int),
-                Indicator.NUMBER_OF_LOCAL_AERODROME : safe_cast(row['number_of_local_aerodrome'], int),
-                Indicator.LOCAL_AERODROME_ACCESSIBILITY : safe_cast(row['local_aerodrome_accessibility_min'], float),
-                Indicator.NUMBER_OF_INTERNATIONAL_AERODROME : safe_cast(row['number_of_international_aerodrome'], int),
-                Indicator.INTERNATIONAL_AERODROME_ACCESSIBILITY : safe_cast(row['international_aerodrome_accessibility_min'], int),
-                Indicator.NUMBER_OF_BUS_STOPS : safe_cast(row['number_of_bus_stops'], float),
-                Indicator.CONNECTIVITY_DRIVE : safe_cast(row['connectivity_drive_min'], float),
-                Indicator.CONNECTIVITY_INTER : safe_cast(row['connectivity_inter_min'], float),
-                Indicator.TO_REGION_ADMIN_CENTER :safe_cast(row['to_region_admin_center_km'], float),
-                Indicator.TO_REG1 : safe_cast(row['to_reg_1_km'], float),
-                Indicator.TRAIN_PATH_LENGTH : safe_cast(row['train_path_length_km'], float),
-                Indicator.NUMBER_OF_BUS_ROUTES : safe_cast(row['number_of_bus_routes'], int),
-                Indicator.REG1_LENGTH : safe_cast(row['reg1_length_km'], float),
-                Indicator.REG2_LENGTH : safe_cast(row['reg2_length_km'], float),
-                Indicator.REG3_LENGTH : safe_cast(row['reg3_length_km'], float),
-                Indicator.ROAD_DENSITY : safe_cast(row['road_density_km/km2'], float)
-            }
-            for indicator, value in indicators.items():
-                indicator_id = INDICATORS_IDS[indicator]
-                ua.post_territory_indicator(indicator_id, territory_id, value)
-                logger.success('Calculations completed')
-                # logger.info(f'terr={territory_id} ind={indicator} id={indicator_id} v={value}')
-                # ua.save_territory_indicatordfdfsdfsdfs(territory_id, indicator_id, value)
+        values = facility_engine.area_accessibility(region_id, towns_gdfs, gdf, point_services)
+        for column in values.columns:
+            gdf[column] = values[column]
+
+INDICATOR_COLUMNS = {
+    Indicator.NUMBER_OF_RAILWAY_STATIONS: ('number_of_railway_stations', int),
+    Indicator.RAILWAY_STATIONS_ACCESSIBILITY : ('railway_stations_accessibility_min', float),
+    Indicator.NUMBER_OF_FUEL_STATIONS : ('number_of_fuel_stations', int),
+    Indicator.FUEL_STATIONS_ACCESSIBILITY : ('fuel_stations_accessibility_min', float),
+    Indicator.NUMBER_OF_PORTS : ('number_of_ports', int),
+    Indicator.NUMBER_OF_LOCAL_AERODROME : ('number_of_local_aerodrome', int),
+    Indicator.LOCAL_AERODROME_ACCESSIBILITY : ('local_aerodrome_accessibility_min', float),
+    Indicator.NUMBER_OF_INTERNATIONAL_AERODROME : ('number_of_international_aerodrome', int),
+    Indicator.INTERNATIONAL_AERODROME_ACCESSIBILITY : ('international_aerodrome_accessibility_min', int),
+    Indicator.NUMBER_OF_BUS_STOPS : ('number_of_bus_stops', float),
+    Indicator.CONNECTIVITY_DRIVE : ('connectivity_drive_min', float),
+    Indicator.CONNECTIVITY_INTER : ('connectivity_inter_min', float),
+    Indicator.TO_REGION_ADMIN_CENTER : ('to_region_admin_center_km', float),
+    Indicator.TO_REG1 : ('to_reg_1_km', float),
+    Indicator.TRAIN_PATH_LENGTH : ('train_path_length_km', float),
+    Indicator.NUMBER_OF_BUS_ROUTES : ('number_of_bus_routes', int),
+    Indicator.REG1_LENGTH : ('reg1_length_km', float),
+    Indicator.REG2_LENGTH : ('reg2_length_km', float),
+    Indicator.REG3_LENGTH : ('reg3_length_km', float),
+    Indicator.ROAD_DENSITY : ('road_density_km/km2', float)
+}
+
+def _save_indicators(ind_area: list[gpd.GeoDataFrame]) -> indicator_writer.WriteSummary:
+    columns = {INDICATORS_IDS[indicator]: spec for indicator, spec in INDICATOR_COLUMNS.items()}
+    values = indicator_writer.territory_values(ind_area, columns)
+    # stored first, so a failed upload is retried by the outbox flusher instead of recomputed
+    row_ids = indicator_outbox.enqueue(values)
+    return indicator_outbox.flush(row_ids)
 
 
-def _assess_and_save(region_id : int):
+def _assess_and_save(region_id : int) -> indicator_writer.WriteSummary:
     ind_area = _assess_region_indicators(region_id)
-    _save_indicators(ind_area)
+    return _save_indicators(ind_area)
 
 @router.post('/{region_id}/transport_indicator_region')
-def assess_region(region_id : int, background_tasks: BackgroundTasks):
-    background_tasks.add_task(_assess_and_save, region_id)
-    return RESPONSE_MESSAGE
\ No newline at end of file
+def assess_region(response : Response, region_id : int) -> str:
+    """
+    Runs as a job; the body is the same message as before, the job is in the Location and X-Job-Id headers
+    """
+    job = jobs.submit('transport_indicator_region', region_id, _assess_and_save, region_id,
+                      steps=['graph', 'car_matrix', 'inter_matrix'])
+    response.headers.update(jobs.headers(job))
+    return RESPONSE_MESSAGE
+
+@router.get('/{region_id}/service_accessibility')
+def get_service_accessibility(region_id : int, response_format : Literal['geojson', 'parquet'] = Query('geojson', alias='format')):
+    """
+    Settlements with the time and distance to the nearest service of each type, as last computed
+    for the region (GeoJSON, or GeoParquet with format=parquet)
+    """
+    try:
+        gdf = accessibility_store.read_accessibility(region_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Service accessibility for region {region_id} has not been computed yet. Run /{region_id}/transport_indicator_region first.")
+    if response_format == 'parquet':
+        return FileResponse(accessibility_store.accessibility_path(region_id), media_type='application/vnd.apache.parquet',
+                            filename=f'{region_id}_service_accessibility.parquet')
+    return json.loads(gdf.to_json())
+
+@router.get('/{region_id}/facility_accessibility')
+def get_facility_accessibility(region_id : int, layers : list[str] | None = Query(None), level : int | None = None) -> list[dict]:
+    """
+    Minutes by car from every settlement to the nearest object of each mirrored layer,
+    or their mean over the administrative units of `level`
+    """
+    unknown = [layer for layer in layers or [] if layer not in layer_store.LAYER_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown layers: {unknown}. Available: {list(layer_store.LAYER_SOURCES)}")
+    try:
+        build_pipeline.ensure(region_id, ['graph'])
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    units_gdfs, towns_gdfs = ua.fetch_territories(region_id)
+    towns_gdfs = towns_gdfs.assign(geometry=towns_gdfs.geometry.representative_point())
+    values = facility_engine.settlement_accessibility(region_id, towns_gdfs, facility_engine.mirrored_layers(region_id, layers))
+    if level is not None:
+        if level not in units_gdfs:
+            raise HTTPException(status_code=404, detail=f"No administrative units of level {level}. Available: {sorted(units_gdfs)}")
+        units = units_gdfs[level][['geometry']]
+        joined = gpd.sjoin(gpd.GeoDataFrame(values, geometry=towns_gdfs.geometry, crs=towns_gdfs.crs), units.to_crs(towns_gdfs.crs), predicate='within')
+        values = joined.drop(columns='geometry').replace(float('inf'), float('nan')).groupby('index_right').mean(numeric_only=True)
+    values = values.astype(object).where(values.notna() & (values != float('inf')), None)
+    return [{'id': i, **row} for i, row in zip(values.index.tolist(), values.to_dict(orient='records'))]
@@ -15,4 +15,11 @@ class Level(str,Enum):
     region = 'region'
     district = 'districts'
     settlements = 'settlements'
-    territory = 'territory'
\ No newline at end of file
+    territory = 'territory'
+
+class MatrixFormat(str, Enum):
+    json = 'json'
+    ndjson = 'ndjson'
+    npz = 'npz'
+    arrow = 'arrow'
+    parquet = 'parquet'
@@ -0,0 +1,80 @@
+import os
+import json
+import hashlib
+import geopandas as gpd
+import networkx as nx
+from loguru import logger
+from transport_frames.indicators.indicator_area import preprocess_service_accessibility
+from app.api.utils.constants import DATA_PATH
+from app.api.utils import graph_store, layer_store, spatial_index
+from app.api.utils.single_flight import SingleFlight
+
+# Output of preprocess_service_accessibility (settlement -> nearest service of each type) per region:
+#   accessibility/{region_id}_service_accessibility.parquet
+#   accessibility/{region_id}_service_accessibility.meta.json  -> {version, json_columns}
+# The version covers the car graph, the settlements and every service layer, so the artifact
+# is recomputed only when one of them changes.
+
+_flights = SingleFlight()
+
+
+def accessibility_path(region_id : int, part : str = 'parquet') -> str:
+    suffix = 'meta.json' if part == 'meta' else 'parquet'
+    return os.path.join(DATA_PATH, f'accessibility/{region_id}_service_accessibility.{suffix}')
+
+def read_meta(region_id : int) -> dict:
+    try:
+        with open(accessibility_path(region_id, 'meta')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def data_version(region_id : int, towns : gpd.GeoDataFrame, services : dict[str, gpd.GeoDataFrame]) -> str:
+    digest = hashlib.sha1(str(graph_store.graph_version(region_id, 'car')).encode())
+    digest.update(spatial_index.points_version(towns).encode())
+    for name in sorted(services):
+        digest.update(str(name).encode())
+        service = services[name]
+        digest.update((spatial_index.points_version(service) if isinstance(service, gpd.GeoDataFrame) else repr(service)).encode())
+    return digest.hexdigest()
+
+def read_accessibility(region_id : int) -> gpd.GeoDataFrame:
+    meta = read_meta(region_id)
+    if not meta:
+        raise FileNotFoundError(f"Service accessibility for region {region_id} not found.")
+    return layer_store.decode_nested(gpd.read_parquet(accessibility_path(region_id)), meta.get('json_columns', []))
+
+def _save(region_id : int, gdf : gpd.GeoDataFrame, version : str) -> None:
+    os.makedirs(os.path.dirname(accessibility_path(region_id)), exist_ok=True)
+    encoded, json_columns = layer_store.encode_nested(gdf)
+    # the meta goes away first, so a half-replaced artifact never passes as current
+    if os.path.exists(accessibility_path(region_id, 'meta')):
+        os.remove(accessibility_path(region_id, 'meta'))
+    tmp_path = f'{accessibility_path(region_id)}.tmp'
+    encoded.to_parquet(tmp_path)
+    os.replace(tmp_path, accessibility_path(region_id))
+    with open(f'{accessibility_path(region_id, "meta")}.tmp', 'w') as f:
+        json.dump({'version': version, 'json_columns': json_columns}, f)
+    os.replace(f'{accessibility_path(region_id, "meta")}.tmp', accessibility_path(region_id, 'meta'))
+
+def service_accessibility(region_id : int, towns : gpd.GeoDataFrame, services : dict[str, gpd.GeoDataFrame],
+                          graph : nx.MultiDiGraph, local_crs : int) -> gpd.GeoDataFrame:
+    """
+    Stored preprocess_service_accessibility output if it was built for the same data, otherwise computed and stored
+    """
+    version = data_version(region_id, towns, services)
+    if read_meta(region_id).get('version') == version:
+        return read_accessibility(region_id)
+
+    def build():
+        if read_meta(region_id).get('version') == version:
+            return read_accessibility(region_id)
+        logger.info(f'Service accessibility for region {region_id} is outdated, recomputing')
+        gdf = preprocess_service_accessibility(towns, services, graph, local_crs)
+        try:
+            _save(region_id, gdf, version)
+        except Exception as e:
+            logger.error(f'Service accessibility for region {region_id} was not stored: {e}')
+        return gdf
+
+    return _flights.do((region_id, version), build).copy()
@@ -0,0 +1,229 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Literal
+
+import networkx as nx
+import pandas as pd
+from loguru import logger
+
+from app.api.utils.constants import REGIONS_DICT, DATA_PATH, ARTIFACT_CACHE_MB
+from app.api.utils import matrix_store, graph_store
+from app.api.utils.graph_store import CompactGraph
+
+ARTIFACT_PATHS = {
+    'car_graph': 'graphs/{region_id}_car_graph.edges.arrow',
+    'inter_graph': 'graphs/{region_id}_inter_graph.edges.arrow',
+    'frame': 'frames/{region_id}_frame.pickle',
+    'car_matrix': 'matrices/{region_id}_car_matrix',
+    'inter_matrix': 'matrices/{region_id}_inter_matrix',
+}
+
+# memory-mapped artifacts live in the shared page cache and do not count against the budget
+# (unless stored as tiles, which are decoded into memory)
+MAPPED_ARTIFACTS = {'car_matrix', 'inter_matrix'}
+
+ARTIFACT_NAMES = {
+    'car_graph': 'Car graph',
+    'inter_graph': 'Inter graph',
+    'frame': 'Frame',
+    'car_matrix': 'Car matrix',
+    'inter_matrix': 'Inter matrix',
+}
+
+
+def artifact_path(region_id : int, kind : str) -> str:
+    if kind in MAPPED_ARTIFACTS:
+        # values of the live version, .npy or .tiles, whichever layout it was saved in
+        return matrix_store.values_path(region_id, kind[:-len('_matrix')])
+    return os.path.join(DATA_PATH, ARTIFACT_PATHS[kind].format(region_id=region_id))
+
+
+def _read_pickle(file_path : str):
+    with open(file_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _read_artifact(region_id : int, kind : str, file_path : str):
+    if kind.endswith('_matrix'):
+        return matrix_store.read_matrix(region_id, kind[:-len('_matrix')])
+    if kind.endswith('_graph'):
+        return graph_store.read_graph(region_id, kind[:-len('_graph')])
+    return _read_pickle(file_path)
+
+
+def _freeze(obj):
+    """
+    Make a freshly loaded artifact safe to share between requests
+    """
+    if isinstance(obj, nx.Graph):
+        if 'crs' in obj.graph:
+            obj.graph['crs'] = int(obj.graph['crs'])
+        return nx.freeze(obj)
+    if isinstance(obj, pd.DataFrame):
+        values = obj.to_numpy(copy=False)
+        values.flags.writeable = False
+        return pd.DataFrame(values, index=obj.index, columns=obj.columns, copy=False)
+    return obj
+
+
+def _view(obj):
+    # a shallow copy keeps the (read-only) data shared but lets callers
+    # rename or reindex their frame without touching the cached one
+    if isinstance(obj, pd.DataFrame):
+        return obj.copy(deep=False)
+    return obj
+
+
+@dataclass
+class _Entry:
+    value : Any
+    path : str
+    mtime : float
+    size : int
+    weight : int
+
+
+def _weight(entry : _Entry) -> int:
+    # a compact graph grows by its networkx view once somebody asks for it
+    return entry.weight + getattr(entry.value, 'networkx_nbytes', 0)
+
+
+class ArtifactCache:
+    """
+    Process-wide cache of region artifacts keyed by (region_id, kind).
+
+    An entry is reloaded only when its file (a new matrix version is a new file), mtime or size changes.
+    When the total size of cached (non-mapped) files, plus networkx views built from cached
+    graphs, exceeds `max_bytes`, least recently used regions are evicted as a whole.
+    """
+
+    def __init__(self, max_bytes : int):
+        self.max_bytes = max_bytes
+        self._regions : OrderedDict[int, dict[str, _Entry]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks : dict[tuple[int, str], threading.Lock] = {}
+
+    def _key_lock(self, region_id : int, kind : str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault((region_id, kind), threading.Lock())
+
+    def _lookup(self, region_id : int, kind : str, file_path : str, mtime : float, size : int) -> _Entry | None:
+        with self._lock:
+            entries = self._regions.get(region_id)
+            if entries is None:
+                return None
+            self._regions.move_to_end(region_id)
+            entry = entries.get(kind)
+            if entry is not None and entry.path == file_path and entry.mtime == mtime and entry.size == size:
+                return entry
+            return None
+
+    def get(self, region_id : int, kind : str):
+        file_path = artifact_path(region_id, kind)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            self.invalidate(region_id, kind)
+            region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
+            raise FileNotFoundError(f"{ARTIFACT_NAMES[kind]} for {region_name} not found.")
+
+        entry = self._lookup(region_id, kind, file_path, stat.st_mtime, stat.st_size)
+        if entry is not None:
+            return _view(entry.value)
+
+        # one loader per key, concurrent callers wait for it instead of unpickling twice
+        with self._key_lock(region_id, kind):
+            entry = self._lookup(region_id, kind, file_path, stat.st_mtime, stat.st_size)
+            if entry is None:
+                logger.info(f'Loading {kind} for region {region_id} from {file_path}')
+                value = _freeze(_read_artifact(region_id, kind, file_path))
+                if kind in MAPPED_ARTIFACTS:
+                    weight = 0 if file_path.endswith('.npy') else int(value.memory_usage(index=True).sum())
+                else:
+                    weight = stat.st_size
+                entry = _Entry(value, file_path, stat.st_mtime, stat.st_size, weight)
+                self._store(region_id, kind, entry)
+        return _view(entry.value)
+
+    def _store(self, region_id : int, kind : str, entry : _Entry) -> None:
+        with self._lock:
+            self._regions.setdefault(region_id, {})[kind] = entry
+            self._regions.move_to_end(region_id)
+            self._evict()
+
+    def trim(self) -> None:
+        """
+        Re-apply the memory ceiling after a cached entry has grown
+        """
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._total_bytes() > self.max_bytes and len(self._regions) > 1:
+            evicted_id, _ = self._regions.popitem(last=False)
+            logger.info(f'Artifacts of region {evicted_id} evicted from cache')
+
+    def _total_bytes(self) -> int:
+        return sum(_weight(e) for entries in self._regions.values() for e in entries.values())
+
+    def invalidate(self, region_id : int | None = None, kind : str | None = None) -> None:
+        with self._lock:
+            if region_id is None:
+                self._regions.clear()
+            elif kind is None:
+                self._regions.pop(region_id, None)
+            elif region_id in self._regions:
+                self._regions[region_id].pop(kind, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_bytes': self.max_bytes,
+                'total_bytes': self._total_bytes(),
+                'regions': {region_id: sorted(entries) for region_id, entries in self._regions.items()},
+            }
+
+
+artifact_cache = ArtifactCache(ARTIFACT_CACHE_MB * 1024 * 1024)
+
+
+def load_compact_graph(region_id : int, graph_type : Literal['car', 'inter'] = 'car') -> CompactGraph:
+    return artifact_cache.get(region_id, f'{graph_type}_graph')
+
+def load_graph(region_id : int, graph_type : Literal['car', 'inter'] = 'car') -> nx.MultiDiGraph:
+    """
+    networkx view of the cached graph, for transport_frames functions that need one;
+    everything else should use load_compact_graph
+    """
+    compact = load_compact_graph(region_id, graph_type)
+    built = compact.networkx_nbytes > 0
+    graph = compact.to_networkx()
+    if not built:
+        artifact_cache.trim()
+    return graph
+
+def load_frame(region_id : int) -> nx.MultiDiGraph:
+    return artifact_cache.get(region_id, 'frame')
+
+def load_matrix(region_id : int, graph_type : Literal['car', 'inter']) -> pd.DataFrame:
+    return artifact_cache.get(region_id, f'{graph_type}_matrix')
+
+def load_matrices(region_id : int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    return load_matrix(region_id, 'car'), load_matrix(region_id, 'inter')
+
+def artifacts_version(region_id : int, kinds : list[str]) -> tuple:
+    """
+    (kind, path, mtime, size) of each artifact file, None for a missing one; changes whenever an artifact is rebuilt
+    """
+    version = []
+    for kind in kinds:
+        file_path = artifact_path(region_id, kind)
+        try:
+            stat = os.stat(file_path)
+            version.append((kind, file_path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append((kind, None))
+    return tuple(version)
@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import Counter
+from typing import Any, Callable
+import geopandas as gpd
+import pandas as pd
+import networkx as nx
+from loguru import logger
+import app.api.utils.urban_api as ua
+from app.api.utils import artifacts, layer_store
+from app.api.utils.gather import gather_services
+from app.api.utils.single_flight import SingleFlight
+
+
+class AssessmentContext:
+    """
+    Inputs of one assessment (criteria and indicators of a project) fetched and preprocessed once
+    and shared by its stages. Values are shared as is: stages must not modify them in place.
+    """
+
+    def __init__(self, region_id : int):
+        self.region_id = region_id
+        self._values : dict[str, Any] = {}
+        self._seconds : dict[str, float] = {}
+        self._reused = Counter()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def get(self, name : str, fn : Callable[[], Any]) -> Any:
+        with self._lock:
+            if name in self._values:
+                self._reused[name] += 1
+                return self._values[name]
+
+        def load():
+            start = time.perf_counter()
+            value = fn()
+            with self._lock:
+                self._values[name] = value
+                self._seconds[name] = time.perf_counter() - start
+            return value
+
+        return self._flights.do(name, load)
+
+    def territories(self) -> tuple[dict[int, gpd.GeoDataFrame], gpd.GeoDataFrame]:
+        """
+        Administrative units by level and towns as representative points
+        """
+        def load():
+            units_gdfs, towns_gdfs = ua.fetch_territories(self.region_id)
+            towns_gdfs['geometry'] = towns_gdfs['geometry'].representative_point()
+            return units_gdfs, towns_gdfs
+        return self.get('territories', load)
+
+    def layer(self, name : str) -> gpd.GeoDataFrame:
+        return self.get(f'layer:{name}', lambda: layer_store.get_layer(self.region_id, name))
+
+    def frame(self) -> nx.MultiDiGraph:
+        return self.get('frame', lambda: artifacts.load_frame(self.region_id))
+
+    def graph(self) -> nx.MultiDiGraph:
+        return self.get('graph', lambda: artifacts.load_graph(self.region_id))
+
+    def matrices(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        return self.get('matrices', lambda: artifacts.load_matrices(self.region_id))
+
+    def region_admin_center(self):
+        return self.get('region_admin_center', lambda: ua.get_region_admin_center(self.region_id))
+
+    def service_layers(self) -> dict[str, gpd.GeoDataFrame]:
+        """
+        Inputs of create_service_dict, fetched in parallel together with territories and the graph
+        """
+        def load():
+            layers, _ = gather_services(self.region_id, {
+                'territories': self.territories,
+                'region_admin_center': self.region_admin_center,
+                'graph': self.graph,
+            }, get_layer=lambda region_id, name: self.layer(name))
+            return layers
+        return self.get('service_layers', load)
+
+    def report(self) -> dict:
+        """
+        Seconds spent on each input and the estimated time saved by reusing them
+        """
+        with self._lock:
+            saved = sum(self._seconds.get(name, 0.0) * count for name, count in self._reused.items())
+            return {
+                'seconds': dict(self._seconds),
+                'reused': dict(self._reused),
+                'seconds_saved': round(saved, 3),
+            }
+
+    def log_report(self) -> None:
+        report = self.report()
+        logger.info(f'Assessment inputs for region {self.region_id}: {sum(report["seconds"].values()):.1f}s spent, '
+                    f'{report["seconds_saved"]:.1f}s saved by reuse {report["reused"]}')
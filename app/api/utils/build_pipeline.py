@@ -0,0 +1,167 @@
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from loguru import logger
+from app.api.utils.constants import REGIONS_DICT, BUILD_WORKERS, FRAME_GRADE_SOURCE
+from app.api.utils import get_graphs
+from app.api.utils import get_matrix
+from app.api.utils import graph_store, matrix_store, spatial_index, grade_grid
+from app.api.utils.single_flight import SingleFlight
+
+# per-region DAG: polygon -> graph -> (spatial index, car matrix, inter matrix, frame -> grade grid)
+STEP_DEPENDENCIES = {
+    'graph': (),
+    'spatial_index': ('graph',),
+    'car_matrix': ('graph',),
+    'inter_matrix': ('graph',),
+    'frame': ('graph',),
+    'grade_grid': ('frame',),
+}
+
+# steps prebuilt by `run`; the grade grid is only needed when frame grades come from it
+# and is otherwise left to `ensure` on demand
+STARTUP_STEPS = [step for step in STEP_DEPENDENCIES if step != 'grade_grid' or FRAME_GRADE_SOURCE == 'grid']
+
+
+@dataclass
+class StepResult:
+    region_id : int
+    step : str
+    status : str # 'missing', 'building', 'ready', 'failed' or 'skipped'
+    seconds : float = 0.0
+    error : str | None = None
+
+
+def run_step(region_id : int, step : str) -> bool:
+    if step == 'graph':
+        return get_graphs.build_graph(region_id)
+    if step == 'frame':
+        return get_graphs.build_frame(region_id)
+    if step == 'spatial_index':
+        return spatial_index.build(region_id)
+    if step == 'grade_grid':
+        return grade_grid.build(region_id)
+    if step.endswith('_matrix'):
+        return get_matrix.build_matrix(region_id, step[:-len('_matrix')])
+    raise ValueError(f'Unknown build step: {step}')
+
+def _timed_step(region_id : int, step : str) -> tuple[bool, float]:
+    start = time.perf_counter()
+    built = run_step(region_id, step)
+    return built, time.perf_counter() - start
+
+def step_exists(region_id : int, step : str) -> bool:
+    if step == 'graph':
+        return graph_store.graph_exists(region_id, 'car')
+    if step == 'frame':
+        return get_graphs.check_frame_exists(region_id)[0]
+    if step == 'spatial_index':
+        return spatial_index.index_exists(region_id)
+    if step == 'grade_grid':
+        return grade_grid.grid_exists(region_id)
+    return matrix_store.matrix_exists(region_id, step[:-len('_matrix')])
+
+
+_flights = SingleFlight()
+_states : dict[tuple[int, str], StepResult] = {}
+_states_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the web process has threads running, forking it is not safe
+            _pool = ProcessPoolExecutor(max_workers=BUILD_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _set_state(result : StepResult) -> StepResult:
+    with _states_lock:
+        _states[(result.region_id, result.step)] = result
+    return result
+
+def _build(region_id : int, step : str) -> StepResult:
+    # re-check under the flight: the artifact may have appeared while we were waiting
+    if step_exists(region_id, step):
+        return _set_state(StepResult(region_id, step, 'ready'))
+    _set_state(StepResult(region_id, step, 'building'))
+    try:
+        if multiprocessing.parent_process() is not None:
+            # already inside a worker process (e.g. a job), no nested pool
+            built, seconds = _timed_step(region_id, step)
+        else:
+            built, seconds = _process_pool().submit(_timed_step, region_id, step).result()
+    except Exception as e:
+        logger.error(f'Step {step} for region {region_id} failed: {e}')
+        return _set_state(StepResult(region_id, step, 'failed', error=str(e)))
+    if not built:
+        return _set_state(StepResult(region_id, step, 'failed', seconds, 'missing input'))
+    logger.info(f'Step {step} for region {region_id} finished in {seconds:.1f}s')
+    return _set_state(StepResult(region_id, step, 'ready', seconds))
+
+def materialize(region_id : int, step : str) -> StepResult:
+    """
+    Make sure the artifact of a step exists, building it and its dependencies if needed.
+    Concurrent callers of the same (region, step) wait for a single build.
+    """
+    if step_exists(region_id, step):
+        with _states_lock:
+            state = _states.get((region_id, step))
+        return state if state is not None and state.status == 'ready' else _set_state(StepResult(region_id, step, 'ready'))
+
+    for dependency in STEP_DEPENDENCIES[step]:
+        if materialize(region_id, dependency).status != 'ready':
+            logger.warning(f'Step {step} for region {region_id} skipped: {dependency} is not available')
+            return _set_state(StepResult(region_id, step, 'skipped', error=f'{dependency} is not available'))
+
+    return _flights.do((region_id, step), lambda: _build(region_id, step))
+
+def ensure(region_id : int, steps : list[str]) -> None:
+    """
+    On-demand materialization for request handlers. Regions that are not configured
+    are left alone, their loaders report missing artifacts as before.
+    """
+    if region_id not in REGIONS_DICT:
+        return
+    for step in steps:
+        result = materialize(region_id, step)
+        if result.status != 'ready':
+            raise RuntimeError(f'{step} for region {region_id} is not available: {result.error}')
+
+def region_status(region_ids : list[int] | None = None) -> dict[int, dict[str, str]]:
+    """
+    State of every startup step and of the on-demand steps that have been asked for
+    """
+    region_ids = list(REGIONS_DICT) if region_ids is None else region_ids
+    status = {}
+    with _states_lock:
+        for region_id in region_ids:
+            status[region_id] = {}
+            for step in STEP_DEPENDENCIES:
+                state = _states.get((region_id, step))
+                if state is None and step not in STARTUP_STEPS:
+                    # built on demand only, nothing to report until somebody asks for it
+                    continue
+                status[region_id][step] = state.status if state is not None else 'missing'
+    return status
+
+
+def run(region_ids : list[int] | None = None) -> list[StepResult]:
+    """
+    Build the missing STARTUP_STEPS artifacts of the given regions (all regions by default).
+    Every step is driven by its own thread through `materialize`, so a step starts as soon
+    as its dependencies are done; the actual work runs in the pool of BUILD_WORKERS processes.
+    """
+    region_ids = list(REGIONS_DICT) if region_ids is None else region_ids
+    steps = [(region_id, step) for region_id in region_ids for step in STARTUP_STEPS]
+    with ThreadPoolExecutor(max_workers=len(steps) or 1) as drivers:
+        futures = [drivers.submit(materialize, region_id, step) for region_id, step in steps]
+    return [f.result() for f in futures]
+
+def run_in_background(region_ids : list[int] | None = None) -> threading.Thread:
+    thread = threading.Thread(target=run, args=(region_ids,), name='build-pipeline', daemon=True)
+    thread.start()
+    return thread
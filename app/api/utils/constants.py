@@ -26,4 +26,26 @@ REGIONS_CRS = {
 
 DATA_PATH = os.path.abspath('app/data')
 
-RESPONSE_MESSAGE = 'Assessment started'
\ No newline at end of file
+RESPONSE_MESSAGE = 'Assessment started'
+
+# memory ceiling for cached graphs, frames and matrices (in megabytes)
+ARTIFACT_CACHE_MB = int(os.environ.get('ARTIFACT_CACHE_MB', 4096))
+
+# processes used to build graphs, matrices and frames of regions
+BUILD_WORKERS = int(os.environ.get('BUILD_WORKERS', 2))
+
+# processes running assessment and recalculation jobs, and how many of them may work on one region
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOBS_PER_REGION = int(os.environ.get('JOBS_PER_REGION', 1))
+
+# how accessibility matrices are routed: 'transport_frames' (availability_matrix over networkx) or 'scipy' (csgraph over the stored CSR graph)
+MATRIX_ENGINE = os.environ.get('MATRIX_ENGINE', 'transport_frames')
+
+# where service accessibility indicators come from: 'transport_frames' (its indicator helpers) or
+# 'nearest_facility' (lookups into the per-node nearest-facility fields of facility_engine)
+ACCESSIBILITY_ENGINE = os.environ.get('ACCESSIBILITY_ENGINE', 'transport_frames')
+
+# how territories are graded against the frame: 'frame' (Frame.grade_territory) or 'grid' (lookup in the precomputed grade grid)
+FRAME_GRADE_SOURCE = os.environ.get('FRAME_GRADE_SOURCE', 'frame')
+# side of a grade grid cell, in meters
+GRADE_GRID_CELL = float(os.environ.get('GRADE_GRID_CELL', 1000))
@@ -0,0 +1,121 @@
+import threading
+from typing import Literal
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from loguru import logger
+from scipy.sparse.csgraph import dijkstra
+from app.api.utils import graph_store, layer_store, spatial_index
+from app.api.utils.matrix_engine import csr_adjacency, WEIGHT
+
+# Time from every graph node to its nearest facility of a kind, in one multi-source Dijkstra
+# seeded at all facility nodes at once. It runs on the reversed graph, so the times are
+# node -> facility, as a trip to the service would be. The cost does not depend on the number
+# of origins: settlements, districts and project territories are lookups into the result.
+#
+# With ACCESSIBILITY_ENGINE=nearest_facility the `{service}_accessibility_min` indicators of
+# POINT_SERVICES are taken from these fields instead of the transport_frames helpers.
+
+# create_service_dict entries whose accessibility is the time to the nearest point object
+POINT_SERVICES = ('railway_stations', 'fuel_stations', 'local_aerodrome', 'international_aerodrome')
+
+_lock = threading.Lock()
+_reversed : dict[tuple[int, str], tuple[str, object]] = {}
+_fields : dict[tuple[int, str, str], tuple[str, np.ndarray]] = {}
+
+
+def _reversed_adjacency(region_id : int, graph_type : str, weight : str = WEIGHT):
+    version = graph_store.graph_version(region_id, graph_type)
+    with _lock:
+        cached = _reversed.get((region_id, graph_type))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    graph = graph_store.read_graph(region_id, graph_type)
+    adjacency = csr_adjacency(graph, weight)
+    adjacency = adjacency.T.tocsr() if graph.meta['directed'] else adjacency
+    with _lock:
+        _reversed[(region_id, graph_type)] = (version, adjacency)
+    return adjacency
+
+def nearest_facility_times(region_id : int, source : str, facilities : gpd.GeoDataFrame,
+                           graph_type : Literal['car', 'inter'] = 'car') -> np.ndarray:
+    """
+    Minutes from every node (in CSR order) to the closest of `facilities`, inf where none is reachable.
+    `source` names the facility set (a mirrored layer name) and keys the snapping and the cached result.
+    """
+    if facilities.empty:
+        return np.full(spatial_index.node_index(region_id, graph_type).node_ids.shape, np.inf, dtype=np.float32)
+    nodes = spatial_index.snapped(region_id, source, facilities, graph_type)['node'].to_numpy()
+    version = f'{graph_store.graph_version(region_id, graph_type)}:{spatial_index.points_version(facilities)}'
+    with _lock:
+        cached = _fields.get((region_id, graph_type, source))
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    times = dijkstra(_reversed_adjacency(region_id, graph_type), directed=True, indices=np.unique(nodes), min_only=True)
+    times = times.astype(np.float32)
+    logger.info(f'Nearest {source} for region {region_id}: {len(facilities)} facilities, {len(times)} nodes routed')
+    with _lock:
+        _fields[(region_id, graph_type, source)] = (version, times)
+    return times
+
+def times_at(region_id : int, points : gpd.GeoDataFrame, times : np.ndarray, source : str = 'settlements',
+             graph_type : Literal['car', 'inter'] = 'car') -> pd.Series:
+    """
+    Values of a per-node field at the nodes nearest to each point
+    """
+    nodes = spatial_index.snapped(region_id, source, points, graph_type)['node'].to_numpy()
+    return pd.Series(times[nodes], index=points.index)
+
+def mirrored_layers(region_id : int, layers : list[str] | None = None) -> dict[str, gpd.GeoDataFrame]:
+    """
+    Facility sets of the mirrored layers (all by default), keyed by layer name
+    """
+    return {layer: layer_store.get_layer(region_id, layer) for layer in layers or list(layer_store.LAYER_SOURCES)}
+
+def _facility_times(region_id : int, name : str, facilities : gpd.GeoDataFrame | None, graph_type : str) -> np.ndarray:
+    if facilities is None:
+        facilities = gpd.GeoDataFrame(geometry=[], crs=4326)
+    return nearest_facility_times(region_id, name, facilities, graph_type)
+
+def settlement_accessibility(region_id : int, points : gpd.GeoDataFrame, services : dict[str, gpd.GeoDataFrame],
+                             graph_type : Literal['car', 'inter'] = 'car') -> pd.DataFrame:
+    """
+    `{name}_accessibility_min` of every settlement for each facility set of `services`
+    """
+    result = pd.DataFrame(index=points.index)
+    for name, facilities in services.items():
+        times = _facility_times(region_id, name, facilities, graph_type)
+        result[f'{name}_accessibility_min'] = times_at(region_id, points, times, graph_type=graph_type)
+    return result
+
+def area_accessibility(region_id : int, points : gpd.GeoDataFrame, areas : gpd.GeoDataFrame,
+                       services : dict[str, gpd.GeoDataFrame], graph_type : Literal['car', 'inter'] = 'car') -> pd.DataFrame:
+    """
+    Median over the settlements inside each area (districts, the region), NaN for an area without reachable ones
+    """
+    values = settlement_accessibility(region_id, points, services, graph_type).replace(np.inf, np.nan)
+    joined = gpd.sjoin(gpd.GeoDataFrame(values, geometry=points.geometry, crs=points.crs),
+                       areas[['geometry']].to_crs(points.crs), predicate='within')
+    return joined.drop(columns='geometry').groupby('index_right').median(numeric_only=True).reindex(areas.index)
+
+def territory_accessibility(region_id : int, territories : gpd.GeoDataFrame, services : dict[str, gpd.GeoDataFrame],
+                            graph_type : Literal['car', 'inter'] = 'car') -> pd.DataFrame:
+    """
+    Same for arbitrary territories (projects, districts): the best value over the graph nodes inside each
+    territory, or at the node nearest to its representative point when none is inside
+    """
+    index, tree = spatial_index.node_tree(region_id, graph_type)
+    territories = territories.to_crs(index.crs)
+    polygon_positions, node_positions = tree.query(territories.geometry.values, predicate='contains')
+    fallback = index.snap(territories)[0]
+
+    result = pd.DataFrame(index=territories.index)
+    for name, facilities in services.items():
+        times = _facility_times(region_id, name, facilities, graph_type)
+        best = times[fallback].astype(np.float64)
+        if len(node_positions):
+            inside = pd.Series(times[node_positions]).groupby(polygon_positions).min()
+            best[inside.index.to_numpy()] = np.minimum(best[inside.index.to_numpy()], inside.to_numpy())
+        result[f'{name}_accessibility_min'] = best
+    return result
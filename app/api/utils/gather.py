@@ -0,0 +1,90 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable
+import geopandas as gpd
+from loguru import logger
+import app.api.utils.urban_api as ua
+from app.api.utils import layer_store
+
+SOURCE_TIMEOUT = float(os.environ.get('GATHER_SOURCE_TIMEOUT', 300))
+GATHER_WORKERS = int(os.environ.get('GATHER_WORKERS', 16))
+
+# shared and never shut down: a source that timed out may keep its thread for a while
+_executor = ThreadPoolExecutor(max_workers=GATHER_WORKERS, thread_name_prefix='gather')
+
+_NO_DEFAULT = object()
+
+
+def gather(sources : dict[str, Callable[[], Any]], timeouts : dict[str, float] | None = None,
+           defaults : dict[str, Any] | None = None) -> dict[str, Any]:
+    """
+    Run independent data sources in parallel and log the seconds spent per source.
+
+    A source that fails or exceeds its timeout
+    (SOURCE_TIMEOUT unless given in `timeouts`) falls back to its entry in `defaults`,
+    sources without a default re-raise.
+    """
+    timeouts = timeouts or {}
+    defaults = defaults or {}
+    start = time.perf_counter()
+    finished = {}
+
+    def timed(name, fn):
+        value = fn()
+        finished[name] = time.perf_counter() - start
+        return value
+
+    futures = {name: _executor.submit(timed, name, fn) for name, fn in sources.items()}
+    results, timings = {}, {}
+    for name, future in futures.items():
+        deadline = start + timeouts.get(name, SOURCE_TIMEOUT)
+        try:
+            results[name] = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+            timings[name] = finished[name]
+        except Exception as e:
+            timings[name] = time.perf_counter() - start
+            reason = 'timed out' if isinstance(e, TimeoutError) else f'failed: {e}'
+            default = defaults.get(name, _NO_DEFAULT)
+            if default is _NO_DEFAULT:
+                logger.error(f'Source {name} {reason}')
+                raise
+            logger.warning(f'Source {name} {reason}, using default')
+            results[name] = default() if callable(default) else default
+
+    slowest = max(timings, key=timings.get) if timings else None
+    logger.info(f'{len(sources)} sources gathered in {time.perf_counter() - start:.1f}s, slowest: {slowest} '
+                + ', '.join(f'{name}={seconds:.1f}s' for name, seconds in timings.items()))
+    return results
+
+
+def _empty_layer() -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(geometry=[], crs=ua.CRS)
+
+def service_sources(region_id : int, get_layer : Callable = layer_store.get_layer) -> dict[str, Callable[[], Any]]:
+    """
+    Inputs of create_service_dict keyed by its argument names
+    """
+    layer = lambda name: lambda: get_layer(region_id, name)
+    return {
+        'railway_stations': layer('train_stations'),
+        'railway_paths': lambda: ua.get_train_paths(region_id),
+        'bus_stops': layer('bus_stops'),
+        'bus_routes': lambda: ua.get_bus_routes(region_id),
+        'fuel_stations': layer('fuel_stations'),
+        'local_aerodrome': layer('airports'),
+        'international_aerodrome': lambda: ua.get_international_airports(region_id),
+        'water_objects': layer('water_objects'),
+        'nature_reserve': lambda: ua.get_protected_areas(region_id),
+    }
+
+def gather_services(region_id : int, extra : dict[str, Callable[[], Any]] | None = None,
+                    get_layer : Callable = layer_store.get_layer) -> tuple[dict[str, Any], dict[str, Any]]:
+    """
+    Service layers (an empty layer when a source fails) plus `extra` sources, which are required
+    """
+    sources = service_sources(region_id, get_layer)
+    services = list(sources)
+    sources.update(extra or {})
+    results = gather(sources, defaults={name: _empty_layer for name in services})
+    return {name: results[name] for name in services}, {name: results[name] for name in extra or {}}
@@ -1,33 +1,36 @@
-import os
 import geopandas as gpd
 import networkx as nx
 import pickle
+import numpy as np
+import pandas as pd
 from loguru import logger
 from shapely.geometry import Point
-from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, DATA_PATH
+from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, MATRIX_ENGINE
 from app.api.utils.urban_api import fetch_territories
+from app.api.utils.artifacts import load_graph
+from app.api.utils.matrix_store import matrix_path, matrix_exists, save_matrix, read_matrix, read_matrix_meta, read_matrix_points
+from app.api.utils.graph_store import graph_version
+from app.api.utils import matrix_engine
 from transport_frames.indicators.utils import availability_matrix
 
-def load_graph(region_id: int, graph_type: str):
-    graph_file = os.path.join(DATA_PATH, f'graphs/{region_id}_{graph_type}_graph.pickle')
-    if not os.path.exists(graph_file):
-        region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
-        raise FileNotFoundError(f"{graph_type.capitalize()} graph for {region_name} not found.")
-    
-    with open(graph_file, "rb") as f:
-        graph = pickle.load(f)
-    
-    return graph
-
 def check_matrix_exists(region_id: int, matrix_type: str):
-    matrix_file = os.path.join(DATA_PATH, f'matrices/{region_id}_{matrix_type}_matrix.pickle')
-    return os.path.exists(matrix_file), matrix_file
+    matrix_file = matrix_path(region_id, matrix_type)
+    return matrix_exists(region_id, matrix_type), matrix_file
 
 def load_settlement_points(region_id: int) -> gpd.GeoDataFrame:
     tuple, towns_points = fetch_territories(region_id)
     towns_points['geometry'] = towns_points['geometry'].representative_point()
     return towns_points
 
+# settlements that moved less than this (in meters) keep their rows and columns
+MOVE_TOLERANCE = 1.0
+# above this share of changed settlements a full rebuild is cheaper than 2 * changed * N routes
+INCREMENTAL_MAX_SHARE = 0.3
+
+def settlement_coordinates(points : gpd.GeoDataFrame, local_crs : int) -> pd.DataFrame:
+    projected = points.to_crs(local_crs).geometry
+    return pd.DataFrame({'x': projected.x.to_numpy(), 'y': projected.y.to_numpy()}, index=points.index)
+
 def to_pickle(data, file_path: str) -> None:
     with open(file_path, "wb") as f:
         pickle.dump(data, f)
@@ -40,21 +43,107 @@ def calculate_accessibility_matrix(graph, points, local_crs, region_id, matrix_t
         region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
         raise RuntimeError(f"Error calculating the {matrix_type} matrix for region {region_name}: {str(e)}")
 
+def route_matrix(region_id : int, graph_type : str, origins : gpd.GeoDataFrame,
+                 destinations : gpd.GeoDataFrame | None = None, engine : str | None = None) -> pd.DataFrame:
+    """
+    Origins x destinations travel times with the configured engine
+    """
+    engine = MATRIX_ENGINE if engine is None else engine
+    destinations = origins if destinations is None else destinations
+    if engine == 'scipy':
+        return matrix_engine.accessibility_matrix(region_id, graph_type, origins, destinations)
+    if engine != 'transport_frames':
+        raise ValueError(f'Unknown matrix engine: {engine}')
+    graph = load_graph(region_id, graph_type)
+    local_crs = REGIONS_CRS[region_id]
+    if destinations is origins:
+        return calculate_accessibility_matrix(graph, origins, local_crs, region_id, graph_type)
+    return availability_matrix(graph, origins, destinations, local_crs=local_crs)
+
+def route_columns(region_id : int, graph_type : str, origins : gpd.GeoDataFrame,
+                  destinations : gpd.GeoDataFrame, engine : str | None = None) -> pd.DataFrame:
+    """
+    Origins x a few destinations with the same engine as route_matrix,
+    the scipy engine routes them backwards from the destinations
+    """
+    engine = MATRIX_ENGINE if engine is None else engine
+    if engine == 'scipy':
+        return matrix_engine.times_to(region_id, graph_type, origins, destinations)
+    return route_matrix(region_id, graph_type, origins, destinations, engine)
+
+def build_matrix(region_id : int, graph_type : str) -> bool:
+    region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
+    matrix_exists, matrix_file = check_matrix_exists(region_id, graph_type)
+
+    if matrix_exists:
+        logger.info(f"{graph_type.capitalize()} matrix for {region_name} already exists.")
+        return True
+
+    logger.info(f"{graph_type.capitalize()} matrix for {region_name} not found. Creating...")
+    _full_rebuild(region_id, graph_type)
+    logger.success(f'{graph_type.capitalize()} matrix for {region_name} has been successfully created.')
+    return True
+
+def _full_rebuild(region_id : int, graph_type : str, points : gpd.GeoDataFrame | None = None) -> pd.DataFrame:
+    version = graph_version(region_id, graph_type)
+    points = load_settlement_points(region_id) if points is None else points
+    acc_matrix = route_matrix(region_id, graph_type, points)
+    save_matrix(acc_matrix, region_id, graph_type, settlement_coordinates(points, REGIONS_CRS[region_id]), version)
+    return acc_matrix
+
+def update_matrix(region_id : int, graph_type : str, full : bool = False) -> str:
+    """
+    Bring the stored matrix up to date with the current settlements.
+
+    Only rows and columns of added or moved settlements are routed, deleted ones are dropped.
+    The whole matrix is rebuilt when asked to, when the graph changed since the matrix was built
+    or when too many settlements changed. Returns 'full', 'incremental' or 'unchanged'.
+    """
+    region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
+    local_crs = REGIONS_CRS[region_id]
+    points = load_settlement_points(region_id)
+    stored_points = read_matrix_points(region_id, graph_type) if matrix_exists(region_id, graph_type) else None
+    meta = read_matrix_meta(region_id, graph_type)
+
+    reason = 'requested' if full \
+        else 'no stored points' if stored_points is None \
+        else 'graph changed' if meta.get('graph_version') != graph_version(region_id, graph_type) \
+        else None
+    if reason is not None:
+        logger.info(f'Full rebuild of the {graph_type} matrix for {region_name}: {reason}')
+        _full_rebuild(region_id, graph_type, points)
+        return 'full'
+
+    current = settlement_coordinates(points, local_crs)
+    common = current.index.intersection(stored_points.index)
+    shift = np.hypot(*(current.loc[common, ['x', 'y']].to_numpy() - stored_points.loc[common, ['x', 'y']].to_numpy()).T)
+    moved = set(common[shift > MOVE_TOLERANCE])
+    changed = [i for i in current.index if i not in stored_points.index or i in moved]
+    deleted = stored_points.index.difference(current.index)
+
+    if not changed and deleted.empty:
+        logger.info(f'{graph_type.capitalize()} matrix for {region_name} is up to date')
+        return 'unchanged'
+    if len(changed) > INCREMENTAL_MAX_SHARE * len(current):
+        logger.info(f'Full rebuild of the {graph_type} matrix for {region_name}: {len(changed)} of {len(current)} settlements changed')
+        _full_rebuild(region_id, graph_type, points)
+        return 'full'
+
+    logger.info(f'Updating the {graph_type} matrix for {region_name}: {len(changed)} added or moved, {len(deleted)} deleted')
+    matrix = read_matrix(region_id, graph_type).reindex(index=current.index, columns=current.index)
+    matrix = matrix.astype(np.float32, copy=True)
+    if changed:
+        changed_points = points.loc[changed]
+        rows = route_matrix(region_id, graph_type, changed_points, points)
+        # every settlement -> the changed ones, with the same engine as the rows
+        columns = route_columns(region_id, graph_type, points, changed_points)
+        matrix.loc[changed, :] = rows.reindex(index=changed, columns=current.index).to_numpy()
+        matrix.loc[:, changed] = columns.reindex(index=current.index, columns=changed).to_numpy()
+    save_matrix(matrix, region_id, graph_type, current, meta.get('graph_version'))
+    logger.success(f'{graph_type.capitalize()} matrix for {region_name} has been updated.')
+    return 'incremental'
+
 def process_matrix():
-    def process_calc_matrix(region_id, region_name, graph_type):
-        matrix_exists, matrix_file = check_matrix_exists(region_id, graph_type)
-
-        if matrix_exists:
-            logger.info(f"{graph_type.capitalize()} matrix for {region_name} already exists.")
-        else:
-            logger.info(f"{graph_type.capitalize()} matrix for {region_name} not found. Creating...")
-            graph = load_graph(region_id, graph_type)
-            points = load_settlement_points(region_id)
-            local_crs = REGIONS_CRS[region_id]
-            acc_matrix = calculate_accessibility_matrix(graph, points, local_crs, region_id, graph_type)
-            to_pickle(acc_matrix, matrix_file)
-            logger.success(f'{graph_type.capitalize()} matrix for {region_name} has been successfully created.')
-
-    for region_id, region_name in REGIONS_DICT.items():
-        process_calc_matrix(region_id, region_name, 'car')
-        process_calc_matrix(region_id, region_name, 'inter')
\ No newline at end of file
+    for region_id in REGIONS_DICT:
+        build_matrix(region_id, 'car')
+        build_matrix(region_id, 'inter')
@@ -0,0 +1,155 @@
+import os
+import json
+import threading
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from loguru import logger
+from transport_frames.framebuilder.frame import Frame
+from app.api.utils.constants import DATA_PATH, REGIONS_CRS, GRADE_GRID_CELL
+from app.api.utils import artifacts
+
+# Frame grade surface of a region, sampled once on a square grid in the local CRS:
+#   frames/{region_id}_grade_grid.npy        float32 (rows, cols), grade of every cell, NaN outside the region
+#   frames/{region_id}_grade_grid.meta.json  {frame_version, crs, x0, y0, cell_size, shape}
+# Every cell is graded by Frame.grade_territory, in batches, when the frame is (re)built.
+# A territory then gets the best grade among the cells it touches: grade_territory grades a polygon
+# by its best-connected part, and a cell grade is at least the grade of any part of the cell, so the
+# lookup errs upwards by at most the grade change over one cell size.
+
+BUILD_CHUNK = 5000
+
+_lock = threading.Lock()
+_grids : dict[int, 'GradeGrid'] = {}
+
+
+def grid_path(region_id : int, part : str = 'npy') -> str:
+    suffix = 'meta.json' if part == 'meta' else 'npy'
+    return os.path.join(DATA_PATH, f'frames/{region_id}_grade_grid.{suffix}')
+
+def _frame_version(region_id : int) -> list:
+    return [list(item) for item in artifacts.artifacts_version(region_id, ['frame'])]
+
+def read_meta(region_id : int) -> dict:
+    try:
+        with open(grid_path(region_id, 'meta')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def grid_exists(region_id : int) -> bool:
+    return read_meta(region_id).get('frame_version') == _frame_version(region_id)
+
+
+@dataclass
+class GradeGrid:
+    frame_version : list
+    crs : int
+    positions : np.ndarray # flat positions of the graded cells
+    grades : np.ndarray
+    tree : shapely.STRtree
+
+    def lookup(self, territories : gpd.GeoDataFrame) -> pd.Series:
+        """
+        Best grade among the cells intersecting each territory, NaN where none does
+        """
+        geometry = territories.to_crs(self.crs).geometry.values
+        territory_positions, cell_positions = self.tree.query(geometry, predicate='intersects')
+        best = pd.Series(self.grades[cell_positions]).groupby(territory_positions).max()
+        values = np.full(len(territories), np.nan)
+        values[best.index.to_numpy()] = best.to_numpy()
+        return pd.Series(values, index=territories.index)
+
+
+def _cells(x0 : float, y0 : float, cell_size : float, shape : tuple[int, int]) -> np.ndarray:
+    rows, cols = np.divmod(np.arange(shape[0] * shape[1]), shape[1])
+    xmin, ymin = x0 + cols * cell_size, y0 + rows * cell_size
+    return shapely.box(xmin, ymin, xmin + cell_size, ymin + cell_size)
+
+def _save(region_id : int, values : np.ndarray, meta : dict) -> None:
+    os.makedirs(os.path.dirname(grid_path(region_id)), exist_ok=True)
+    # the meta goes away first, so half-written values never pass as current
+    if os.path.exists(grid_path(region_id, 'meta')):
+        os.remove(grid_path(region_id, 'meta'))
+    with open(f'{grid_path(region_id)}.tmp', 'wb') as f:
+        np.save(f, values.astype(np.float32))
+    os.replace(f'{grid_path(region_id)}.tmp', grid_path(region_id))
+    with open(f'{grid_path(region_id, "meta")}.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(f'{grid_path(region_id, "meta")}.tmp', grid_path(region_id, 'meta'))
+
+def build(region_id : int, cell_size : float = GRADE_GRID_CELL) -> bool:
+    polygon_file = os.path.join(DATA_PATH, f'polygons/{region_id}_polygon_for_graph.parquet')
+    if not os.path.exists(polygon_file):
+        logger.error(f'Grade grid for region {region_id} has not been created: no region polygon')
+        return False
+    frame_version = _frame_version(region_id)
+    frame = artifacts.load_frame(region_id)
+    crs = REGIONS_CRS[region_id]
+    region = shapely.union_all(gpd.read_parquet(polygon_file).to_crs(crs).geometry.values)
+
+    xmin, ymin, xmax, ymax = region.bounds
+    shape = (max(int(np.ceil((ymax - ymin) / cell_size)), 1), max(int(np.ceil((xmax - xmin) / cell_size)), 1))
+    cells = _cells(xmin, ymin, cell_size, shape)
+    shapely.prepare(region)
+    positions = np.flatnonzero(shapely.intersects(region, cells))
+    cells = gpd.GeoDataFrame({'name': ''}, geometry=cells[positions], index=positions, crs=crs)
+
+    values = np.full(shape[0] * shape[1], np.nan, dtype=np.float32)
+    for start in range(0, len(cells), BUILD_CHUNK):
+        chunk = cells.iloc[start:start + BUILD_CHUNK]
+        graded = Frame.grade_territory(frame, chunk.copy())
+        values[chunk.index.to_numpy()] = graded['grade'].to_numpy(dtype=np.float32)
+    _save(region_id, values.reshape(shape), {
+        'frame_version': frame_version,
+        'crs': crs,
+        'x0': xmin,
+        'y0': ymin,
+        'cell_size': cell_size,
+        'shape': list(shape),
+    })
+    logger.info(f'Grade grid for region {region_id} built: {len(cells)} cells of {cell_size:.0f} m')
+    return True
+
+def grade_grid(region_id : int) -> GradeGrid:
+    meta = read_meta(region_id)
+    if meta.get('frame_version') != _frame_version(region_id):
+        raise FileNotFoundError(f"Grade grid for region {region_id} not found or outdated.")
+    with _lock:
+        grid = _grids.get(region_id)
+        if grid is None or grid.frame_version != meta['frame_version']:
+            values = np.load(grid_path(region_id)).ravel()
+            positions = np.flatnonzero(np.isfinite(values))
+            cells = _cells(meta['x0'], meta['y0'], meta['cell_size'], tuple(meta['shape']))[positions]
+            grid = GradeGrid(meta['frame_version'], meta['crs'], positions, values[positions], shapely.STRtree(cells))
+            _grids[region_id] = grid
+        return grid
+
+def grade_territory(region_id : int, territories : gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """
+    Drop-in for Frame.grade_territory over the region frame: territories with a 'grade' column.
+    Territories touching no graded cell (e.g. outside the region) are graded against the frame itself.
+    """
+    graded = territories.copy()
+    graded['grade'] = grade_grid(region_id).lookup(territories)
+    missing = graded['grade'].isna()
+    if missing.any():
+        fallback = Frame.grade_territory(artifacts.load_frame(region_id), territories[missing].copy())
+        graded.loc[missing, 'grade'] = fallback['grade'].to_numpy()
+    return graded
+
+def compare(reference : pd.Series, candidate : pd.Series, tolerance : float = 0.5) -> dict:
+    """
+    Agreement of two grade series over their common ids
+    """
+    index = reference.index.intersection(candidate.index)
+    diff = (candidate.loc[index].astype(float) - reference.loc[index].astype(float)).to_numpy()
+    return {
+        'territories': int(len(index)),
+        'max_abs_diff': float(np.abs(diff).max()) if diff.size else 0.0,
+        'mean_diff': float(diff.mean()) if diff.size else 0.0,
+        'exact': float((diff == 0).mean()) if diff.size else 1.0,
+        'within_tolerance': float((np.abs(diff) <= tolerance).mean()) if diff.size else 1.0,
+    }
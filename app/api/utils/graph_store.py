@@ -0,0 +1,287 @@
+import os
+import glob
+import json
+import pickle
+import sys
+import threading
+import uuid
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import networkx as nx
+import pyarrow as pa
+import shapely
+from shapely.geometry.base import BaseGeometry
+from typing import Literal
+from loguru import logger
+from app.api.utils.constants import DATA_PATH
+
+# A graph is stored as two uncompressed Arrow IPC files and a small json:
+#   {region_id}_{graph_type}_graph.nodes.arrow  node ids, x, y and node attributes
+#   {region_id}_{graph_type}_graph.edges.arrow  u/v node positions, key and edge attributes,
+#                                               rows sorted by u, so they form the CSR adjacency
+#   {region_id}_{graph_type}_graph.meta.json    graph attributes and column encodings
+# Arrow files are memory-mapped on read; numeric edge columns are used as typed weight arrays directly.
+
+GRAPH_PARTS = ('nodes', 'edges', 'meta')
+
+
+def graph_path(region_id : int, graph_type : Literal['car', 'inter'], part : str = 'edges') -> str:
+    extension = 'json' if part == 'meta' else 'arrow'
+    return os.path.join(DATA_PATH, f'graphs/{region_id}_{graph_type}_graph.{part}.{extension}')
+
+def legacy_graph_path(region_id : int, graph_type : Literal['car', 'inter']) -> str:
+    return os.path.join(DATA_PATH, f'graphs/{region_id}_{graph_type}_graph.pickle')
+
+def graph_exists(region_id : int, graph_type : Literal['car', 'inter']) -> bool:
+    return all(os.path.exists(graph_path(region_id, graph_type, part)) for part in GRAPH_PARTS)
+
+
+def _json_default(value):
+    # numpy values are stored as plain json numbers and lists; anything else would
+    # come back as its str() and is refused instead
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} values cannot be stored in a json attribute column')
+
+def _encode_attributes(records : list[dict]) -> tuple[pa.Table, list[str], list[str]]:
+    df = pd.DataFrame.from_records(records)
+    geometry_columns, json_columns = [], []
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        values = [v for v in df[column] if v is not None and not (isinstance(v, float) and np.isnan(v))]
+        if values and all(isinstance(v, BaseGeometry) for v in values):
+            df[column] = shapely.to_wkb(df[column].where(df[column].notna(), None).values)
+            geometry_columns.append(column)
+        elif not all(isinstance(v, str) for v in values):
+            try:
+                df[column] = [None if v is None or (isinstance(v, float) and np.isnan(v)) else json.dumps(v, default=_json_default)
+                              for v in df[column]]
+            except TypeError as e:
+                raise TypeError(f'Attribute {column!r}: {e}') from e
+            json_columns.append(column)
+    return pa.Table.from_pandas(df, preserve_index=False), geometry_columns, json_columns
+
+def _write_table(table : pa.Table, file_path : str) -> None:
+    tmp_path = f'{file_path}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, file_path)
+
+def save_graph(graph : nx.Graph, region_id : int, graph_type : Literal['car', 'inter']) -> None:
+    node_ids = list(graph.nodes)
+    position = {node: i for i, node in enumerate(node_ids)}
+    nodes, node_geometry, node_json = _encode_attributes([{'node': n, **attrs} for n, attrs in graph.nodes(data=True)])
+
+    if graph.is_multigraph():
+        edge_iter = graph.edges(keys=True, data=True)
+    else:
+        edge_iter = ((u, v, 0, attrs) for u, v, attrs in graph.edges(data=True))
+    edge_records = [{'_u': position[u], '_v': position[v], '_key': key, **attrs} for u, v, key, attrs in edge_iter]
+    edge_records.sort(key=lambda r: r['_u'])
+    edges, edge_geometry, edge_json = _encode_attributes(edge_records)
+
+    meta = {
+        'directed': graph.is_directed(),
+        'multigraph': graph.is_multigraph(),
+        'graph': {k: v for k, v in graph.graph.items()},
+        'node_geometry_columns': node_geometry,
+        'node_json_columns': node_json,
+        'edge_geometry_columns': edge_geometry,
+        'edge_json_columns': edge_json,
+        # derived artifacts (matrices) remember it to notice that the graph was rebuilt
+        'version': uuid.uuid4().hex,
+    }
+    if 'crs' in meta['graph']:
+        meta['graph']['crs'] = int(meta['graph']['crs'])
+
+    _write_table(nodes, graph_path(region_id, graph_type, 'nodes'))
+    meta_path = graph_path(region_id, graph_type, 'meta')
+    with open(f'{meta_path}.tmp', 'w') as f:
+        json.dump(meta, f, default=str)
+    os.replace(f'{meta_path}.tmp', meta_path)
+    # edges go last: the edges file is what readers and the artifact cache watch
+    _write_table(edges, graph_path(region_id, graph_type, 'edges'))
+
+
+def graph_version(region_id : int, graph_type : Literal['car', 'inter']) -> str | None:
+    try:
+        with open(graph_path(region_id, graph_type, 'meta')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if 'version' in meta:
+        return meta['version']
+    # graphs saved before versions were stamped
+    stat = os.stat(graph_path(region_id, graph_type, 'edges'))
+    return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+
+def _decode_columns(df : pd.DataFrame, geometry_columns : list[str], json_columns : list[str]) -> pd.DataFrame:
+    for column in geometry_columns:
+        df[column] = shapely.from_wkb(df[column].values)
+    for column in json_columns:
+        df[column] = [None if v is None else json.loads(v) for v in df[column]]
+    return df
+
+
+class CompactGraph:
+    """
+    Memory-mapped CSR graph.
+
+    Edge rows are sorted by source node, so `indptr`/`indices` together with any numeric
+    edge column form a CSR adjacency. `to_networkx` rebuilds a (frozen) networkx graph
+    lazily, only for transport_frames functions that still require one.
+    """
+
+    def __init__(self, nodes : pa.Table, edges : pa.Table, meta : dict):
+        self.nodes = nodes
+        self.edges = edges
+        self.meta = meta
+        self.graph = meta['graph']
+        self._nx = None
+        self._nx_nbytes = 0
+        self._nx_lock = threading.Lock()
+
+    @property
+    def crs(self) -> int | None:
+        return self.graph.get('crs')
+
+    @property
+    def node_ids(self) -> np.ndarray:
+        return self.nodes.column('node').to_numpy()
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.nodes.column('x').to_numpy()
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.nodes.column('y').to_numpy()
+
+    @property
+    def indices(self) -> np.ndarray:
+        return self.edges.column('_v').to_numpy()
+
+    @property
+    def sources(self) -> np.ndarray:
+        return self.edges.column('_u').to_numpy()
+
+    @property
+    def indptr(self) -> np.ndarray:
+        counts = np.bincount(self.sources, minlength=self.nodes.num_rows)
+        return np.concatenate([[0], np.cumsum(counts)])
+
+    def weights(self, name : str) -> np.ndarray:
+        return self.edges.column(name).to_numpy()
+
+    def number_of_nodes(self) -> int:
+        return self.nodes.num_rows
+
+    def number_of_edges(self) -> int:
+        return self.edges.num_rows
+
+    def nodes_frame(self) -> pd.DataFrame:
+        df = self.nodes.to_pandas()
+        return _decode_columns(df, self.meta['node_geometry_columns'], self.meta['node_json_columns']).set_index('node')
+
+    def edges_frame(self) -> gpd.GeoDataFrame:
+        df = _decode_columns(self.edges.to_pandas(), self.meta['edge_geometry_columns'], self.meta['edge_json_columns'])
+        node_ids = self.node_ids
+        df.insert(0, 'u', node_ids[df.pop('_u').values])
+        df.insert(1, 'v', node_ids[df.pop('_v').values])
+        df = df.rename(columns={'_key': 'key'})
+        geometry = 'geometry' if 'geometry' in self.meta['edge_geometry_columns'] else None
+        return gpd.GeoDataFrame(df, geometry=geometry, crs=self.crs if geometry else None)
+
+    def _build_networkx(self) -> nx.Graph:
+        if self.meta['multigraph']:
+            graph = nx.MultiDiGraph() if self.meta['directed'] else nx.MultiGraph()
+        else:
+            graph = nx.DiGraph() if self.meta['directed'] else nx.Graph()
+        graph.graph.update(self.graph)
+
+        def records(df):
+            return [{k: v for k, v in r.items() if v is not None and not (isinstance(v, float) and np.isnan(v))}
+                    for r in df.to_dict('records')]
+
+        nodes = self.nodes_frame()
+        graph.add_nodes_from(zip(nodes.index, records(nodes)))
+        edges = pd.DataFrame(self.edges_frame())
+        u, v, key = edges.pop('u').values, edges.pop('v').values, edges.pop('key').values
+        if self.meta['multigraph']:
+            graph.add_edges_from(zip(u, v, key, records(edges)))
+        else:
+            graph.add_edges_from(zip(u, v, records(edges)))
+        return nx.freeze(graph)
+
+    def to_networkx(self) -> nx.Graph:
+        with self._nx_lock:
+            if self._nx is None:
+                self._nx = self._build_networkx()
+                self._nx_nbytes = _networkx_nbytes(self._nx)
+        return self._nx
+
+    @property
+    def networkx_nbytes(self) -> int:
+        """
+        Estimated memory held by the networkx view, 0 until it is built
+        """
+        return self._nx_nbytes
+
+
+# per-element overhead of the networkx adjacency dicts, on top of the attribute dicts themselves
+NX_NODE_OVERHEAD = 500
+NX_EDGE_OVERHEAD = 400
+NX_SAMPLE_SIZE = 1000
+
+def _attributes_nbytes(attributes : dict) -> int:
+    size = sys.getsizeof(attributes)
+    for value in attributes.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, BaseGeometry):
+            size += shapely.get_num_coordinates(value) * 16
+    return size
+
+def _networkx_nbytes(graph : nx.Graph) -> int:
+    # attribute sizes are measured on a sample and extrapolated, walking every edge would cost as much as building the graph
+    estimate = 0
+    for count, items, overhead in ((graph.number_of_nodes(), graph.nodes(data=True), NX_NODE_OVERHEAD),
+                                   (graph.number_of_edges(), graph.edges(data=True), NX_EDGE_OVERHEAD)):
+        sample = [_attributes_nbytes(item[-1]) for _, item in zip(range(NX_SAMPLE_SIZE), items)]
+        estimate += count * (overhead + (sum(sample) // len(sample) if sample else 0))
+    return int(estimate)
+
+
+def _read_table(file_path : str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+
+def read_graph(region_id : int, graph_type : Literal['car', 'inter']) -> CompactGraph:
+    if not graph_exists(region_id, graph_type):
+        raise FileNotFoundError(f"{graph_type.capitalize()} graph for region {region_id} not found.")
+    with open(graph_path(region_id, graph_type, 'meta')) as f:
+        meta = json.load(f)
+    nodes = _read_table(graph_path(region_id, graph_type, 'nodes'))
+    edges = _read_table(graph_path(region_id, graph_type, 'edges'))
+    return CompactGraph(nodes, edges, meta)
+
+def migrate_pickles() -> list[str]:
+    """
+    One-shot conversion of pickled networkx graphs into the compact layout
+    """
+    migrated = []
+    for pickle_path in sorted(glob.glob(os.path.join(DATA_PATH, 'graphs/*_graph.pickle'))):
+        region_id, graph_type = os.path.basename(pickle_path).split('_')[:2]
+        region_id = int(region_id)
+        if not graph_exists(region_id, graph_type):
+            with open(pickle_path, 'rb') as f:
+                graph = pickle.load(f)
+            save_graph(graph, region_id, graph_type)
+            logger.success(f'{graph_type.capitalize()} graph for region {region_id} migrated from {pickle_path}')
+        os.remove(pickle_path)
+        migrated.append(pickle_path)
+    return migrated
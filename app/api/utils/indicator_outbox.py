@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime, timedelta
+from loguru import logger
+from app.api.utils.constants import DATA_PATH
+from app.api.utils import indicator_writer
+from app.api.utils.indicator_writer import IndicatorValue, WriteSummary
+
+# Computed indicator values are stored here before they are sent to Urban API, so a failed
+# delivery never requires recomputation. One row per (indicator, territory/scenario, date):
+# a newer value for the same key replaces the pending one.
+#
+# No credentials are written to disk. The caller's token is kept in the memory of the process
+# that enqueued the values (a web worker or a job process), and the row is owned by that process:
+# only its own flusher retries it, with that token. Rows outliving their owner (a restart, a crashed
+# job worker) are released and sent with the service's own URBAN_API_SERVICE_TOKEN. Rows rejected
+# with 401/403 are marked dead at once, retrying them cannot help.
+
+OUTBOX_PATH = os.path.join(DATA_PATH, 'outbox.sqlite')
+FLUSH_INTERVAL = float(os.environ.get('OUTBOX_FLUSH_INTERVAL', 30))
+FLUSH_BATCH = int(os.environ.get('OUTBOX_FLUSH_BATCH', 5000))
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 20))
+LEASE_SECONDS = 600
+KEEP_SENT_DAYS = 7
+SERVICE_TOKEN = os.environ.get('URBAN_API_SERVICE_TOKEN')
+AUTH_ERRORS = (401, 403)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    indicator_id INTEGER NOT NULL,
+    target_kind TEXT NOT NULL,
+    target_id INTEGER NOT NULL,
+    date_value TEXT NOT NULL,
+    value TEXT,
+    comment TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    leased_until REAL,
+    created_at TEXT NOT NULL,
+    sent_at TEXT,
+    owner TEXT,
+    UNIQUE (indicator_id, target_kind, target_id, date_value)
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (sent_at, attempts);
+'''
+
+_flush_lock = threading.Lock()
+_flusher : threading.Thread | None = None
+_flusher_lock = threading.Lock()
+# row id -> token of the request that enqueued it, never persisted
+_tokens : dict[int, str] = {}
+_tokens_lock = threading.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(OUTBOX_PATH, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _owner() -> str:
+    # evaluated per call: a forked or spawned process must not inherit its parent's identity
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _alive(owner : str) -> bool:
+    host, pid = owner.rsplit(':', 1)
+    if host != socket.gethostname():
+        # another host's processes are not ours to judge
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _key(value : IndicatorValue) -> tuple[str, int]:
+    if value.scenario_id is not None:
+        return 'scenario', value.scenario_id
+    return 'territory', value.territory_id
+
+def enqueue(values : list[IndicatorValue], token : str | None = None, date_value : str | None = None) -> list[int]:
+    """
+    Store values for delivery and return their row ids (to flush just them).
+    Values sent with a caller's token are retried by this process, which then runs a flusher of its own.
+    """
+    date_value = date_value or datetime.now().strftime('%Y-%m-%d')
+    now = datetime.now().isoformat()
+    owner = _owner() if token else None
+    rows = [(v.indicator_id, *_key(v), date_value, json.dumps(v.value), v.comment, now, owner) for v in values]
+    with closing(_connect()) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        row_ids = [conn.execute('''
+            INSERT INTO outbox (indicator_id, target_kind, target_id, date_value, value, comment, created_at, owner)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (indicator_id, target_kind, target_id, date_value) DO UPDATE SET
+                value = excluded.value, comment = excluded.comment, owner = excluded.owner,
+                attempts = 0, last_error = NULL, leased_until = NULL, sent_at = NULL
+            RETURNING id
+        ''', row).fetchone()[0] for row in rows]
+        conn.execute('COMMIT')
+    with _tokens_lock:
+        for row_id in row_ids:
+            if token:
+                _tokens[row_id] = token
+            else:
+                _tokens.pop(row_id, None)
+    logger.info(f'{len(rows)} indicator values stored in the outbox')
+    if token:
+        start_flusher()
+    return row_ids
+
+def _claim(conn : sqlite3.Connection, limit : int, row_ids : list[int] | None = None) -> list[tuple]:
+    # a lease keeps flushers of other workers away from the same rows,
+    # rows owned by another process wait for that process (it holds their token)
+    now = time.time()
+    return conn.execute(f'''
+        UPDATE outbox SET leased_until = ?
+        WHERE id IN (
+            SELECT id FROM outbox
+            WHERE sent_at IS NULL AND attempts < ? AND (leased_until IS NULL OR leased_until < ?)
+            AND (owner IS NULL OR owner = ?)
+            {'AND id IN (SELECT value FROM json_each(?))' if row_ids is not None else ''}
+            ORDER BY id LIMIT ?
+        )
+        RETURNING id, indicator_id, target_kind, target_id, date_value, value, comment
+    ''', (now + LEASE_SECONDS, MAX_ATTEMPTS, now, _owner(), *([json.dumps(row_ids)] if row_ids is not None else []), limit)).fetchall()
+
+def _release_orphans(conn : sqlite3.Connection) -> None:
+    """
+    Hand rows of processes that are gone (and their tokens with them) over to the service token
+    """
+    owners = [owner for (owner,) in conn.execute('SELECT DISTINCT owner FROM outbox WHERE owner IS NOT NULL AND sent_at IS NULL')]
+    for owner in owners:
+        if owner != _owner() and not _alive(owner):
+            released = conn.execute('UPDATE outbox SET owner = NULL WHERE owner = ? AND sent_at IS NULL', (owner,)).rowcount
+            logger.warning(f'{released} outbox rows of the finished process {owner} will be sent with the service token')
+
+def _forget_tokens(row_ids : list[int]) -> None:
+    with _tokens_lock:
+        for row_id in row_ids:
+            _tokens.pop(row_id, None)
+
+def _deliver(conn : sqlite3.Connection, rows : list[tuple]) -> WriteSummary:
+    summary = WriteSummary()
+    groups = defaultdict(list)
+    with _tokens_lock:
+        tokens = {row[0]: _tokens.get(row[0], SERVICE_TOKEN) for row in rows}
+    for row_id, indicator_id, target_kind, target_id, date_value, value, comment in rows:
+        value = IndicatorValue(indicator_id, json.loads(value), comment=comment,
+                               **({'scenario_id': target_id} if target_kind == 'scenario' else {'territory_id': target_id}))
+        groups[(tokens[row_id], date_value)].append((row_id, value))
+
+    for (token, date_value), group in groups.items():
+        result = indicator_writer.write([v for _, v in group], token, date_value)
+        failures = {(f['indicator_id'], f['territory_id'], f['scenario_id']): f for f in result.failed}
+        sent, failed, dead = [], [], []
+        for row_id, v in group:
+            failure = failures.get((v.indicator_id, v.territory_id, v.scenario_id))
+            if failure is None:
+                sent.append((datetime.now().isoformat(), row_id))
+            elif failure.get('status') in AUTH_ERRORS:
+                dead.append((MAX_ATTEMPTS, failure['error'], row_id))
+            else:
+                failed.append((failure['error'], row_id))
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany('UPDATE outbox SET sent_at = ?, leased_until = NULL WHERE id = ?', sent)
+        conn.executemany('UPDATE outbox SET attempts = attempts + 1, last_error = ?, leased_until = NULL WHERE id = ?', failed)
+        conn.executemany('UPDATE outbox SET attempts = ?, last_error = ?, leased_until = NULL WHERE id = ?', dead)
+        conn.execute('COMMIT')
+        _forget_tokens([row_id for *_, row_id in sent + dead])
+        if dead:
+            logger.warning(f'{len(dead)} indicator values rejected by Urban API authorization, not retried: {dead[0][1]}')
+        summary.total += result.total
+        summary.succeeded += result.succeeded
+        summary.failed.extend(result.failed)
+        summary.seconds += result.seconds
+    return summary
+
+def _summary(conn : sqlite3.Connection, row_ids : list[int], seconds : float) -> WriteSummary:
+    # state of exactly these rows, whichever flusher delivered them
+    rows = conn.execute('''
+        SELECT indicator_id, target_kind, target_id, sent_at, last_error FROM outbox
+        WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps(row_ids),)).fetchall()
+    summary = WriteSummary(total=len(rows), seconds=seconds)
+    for indicator_id, target_kind, target_id, sent_at, last_error in rows:
+        if sent_at is not None:
+            summary.succeeded += 1
+        else:
+            summary.failed.append({
+                'indicator_id': indicator_id,
+                'territory_id': target_id if target_kind == 'territory' else None,
+                'scenario_id': target_id if target_kind == 'scenario' else None,
+                'error': last_error or 'pending',
+            })
+    return summary
+
+def flush(row_ids : list[int] | None = None, limit : int = FLUSH_BATCH) -> WriteSummary:
+    """
+    Send pending values (only `row_ids` if given); delivered rows are marked as sent, failed ones stay pending.
+    With `row_ids` the summary covers exactly those rows, including ones another flusher has already sent.
+    """
+    with _flush_lock, closing(_connect()) as conn:
+        if row_ids is None:
+            _release_orphans(conn)
+            return _deliver(conn, _claim(conn, limit))
+        seconds = 0.0
+        for start in range(0, len(row_ids), limit):
+            seconds += _deliver(conn, _claim(conn, limit, row_ids[start:start + limit])).seconds
+        return _summary(conn, row_ids, seconds)
+
+def stats() -> dict[str, int]:
+    with closing(_connect()) as conn:
+        pending, dead, sent = conn.execute('''
+            SELECT
+                SUM(sent_at IS NULL AND attempts < ?),
+                SUM(sent_at IS NULL AND attempts >= ?),
+                SUM(sent_at IS NOT NULL)
+            FROM outbox
+        ''', (MAX_ATTEMPTS, MAX_ATTEMPTS)).fetchone()
+    return {'pending': pending or 0, 'dead': dead or 0, 'sent': sent or 0}
+
+def _purge_sent(days : int = KEEP_SENT_DAYS) -> None:
+    threshold = (datetime.now() - timedelta(days=days)).isoformat()
+    with closing(_connect()) as conn:
+        conn.execute('DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?', (threshold,))
+
+
+def _flush_loop(interval : float) -> None:
+    while True:
+        try:
+            # keep going while full batches are delivered, failed rows wait for the next round
+            while (summary := flush()).total == FLUSH_BATCH and not summary.failed:
+                pass
+            _purge_sent()
+        except Exception as e:
+            logger.error(f'Outbox flush failed: {e}')
+        time.sleep(interval)
+
+def start_flusher(interval : float = FLUSH_INTERVAL) -> threading.Thread:
+    """
+    Drains what previous runs (or a restart) left in the outbox and keeps draining it.
+    One flusher per process, later calls return the running one.
+    """
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None or not _flusher.is_alive():
+            if SERVICE_TOKEN is None:
+                logger.warning('URBAN_API_SERVICE_TOKEN is not set: outbox rows outliving their process will be rejected')
+            _flusher = threading.Thread(target=_flush_loop, args=(interval,), name='outbox-flusher', daemon=True)
+            _flusher.start()
+        return _flusher
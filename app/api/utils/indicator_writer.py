@@ -0,0 +1,111 @@
+import os
+import time
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from loguru import logger
+import app.api.utils.urban_api as ua
+
+CONCURRENCY = int(os.environ.get('INDICATOR_WRITER_CONCURRENCY', 8))
+BULK_SIZE = int(os.environ.get('INDICATOR_WRITER_BULK_SIZE', 500))
+
+
+@dataclass
+class IndicatorValue:
+    indicator_id : int
+    value : float | int | None
+    territory_id : int | None = None
+    scenario_id : int | None = None
+    comment : str = '-'
+
+@dataclass
+class WriteSummary:
+    total : int = 0
+    succeeded : int = 0
+    failed : list[dict] = field(default_factory=list)
+    seconds : float = 0.0
+
+
+def column_values(gdf : pd.DataFrame, columns : dict[int, tuple[str, type]]) -> dict[int, list]:
+    """
+    indicator_id -> values of its column cast to the indicator type, NaN -> None
+    """
+    result = {}
+    for indicator_id, (column, to_type) in columns.items():
+        series = gdf[column]
+        result[indicator_id] = [None if pd.isna(v) else to_type(v) for v in series.tolist()]
+    return result
+
+def territory_values(gdfs : list[pd.DataFrame], columns : dict[int, tuple[str, type]]) -> list[IndicatorValue]:
+    values = []
+    for gdf in gdfs:
+        territory_ids = gdf.index.tolist()
+        for indicator_id, indicator_values in column_values(gdf, columns).items():
+            values.extend(IndicatorValue(indicator_id, v, territory_id=t) for t, v in zip(territory_ids, indicator_values))
+    return values
+
+def scenario_values(row : pd.Series, scenario_id : int, columns : dict[int, tuple[str, type]], comments : dict[int, str] | None = None) -> list[IndicatorValue]:
+    comments = comments or {}
+    return [IndicatorValue(indicator_id, None if pd.isna(row[column]) else to_type(row[column]),
+                           scenario_id=scenario_id, comment=comments.get(indicator_id, '-'))
+            for indicator_id, (column, to_type) in columns.items()]
+
+
+def payload(value : IndicatorValue, date_value : str | None = None) -> dict:
+    if value.scenario_id is not None:
+        return ua.scenario_indicator_payload(value.indicator_id, value.scenario_id, value.value, value.comment)
+    return ua.territory_indicator_payload(value.indicator_id, value.territory_id, value.value, date_value)
+
+def _put_one(value : IndicatorValue, token : str | None, date_value : str | None):
+    # retries with backoff happen in the urban_api session
+    if value.scenario_id is not None:
+        return ua.post_scenario_indicator(value.indicator_id, value.scenario_id, value.value, token, value.comment)
+    return ua.post_territory_indicator(value.indicator_id, value.territory_id, value.value, date_value)
+
+def _put_bulk(values : list[IndicatorValue], token : str | None, date_value : str | None):
+    return ua.put_indicators_bulk([payload(v, date_value) for v in values], token)
+
+def _failure(value : IndicatorValue, error : str, status : int | None = None) -> dict:
+    return {
+        'indicator_id': value.indicator_id,
+        'territory_id': value.territory_id,
+        'scenario_id': value.scenario_id,
+        'error': error,
+        'status': status,
+    }
+
+def write(values : list[IndicatorValue], token : str | None = None, date_value : str | None = None,
+          concurrency : int = CONCURRENCY) -> WriteSummary:
+    """
+    Send indicator values with bounded concurrency, in bulk if URBAN_API_BULK_INDICATORS_PATH is set
+    """
+    start = time.perf_counter()
+    summary = WriteSummary(total=len(values))
+    if ua.BULK_INDICATORS_PATH:
+        batches = [values[i:i + BULK_SIZE] for i in range(0, len(values), BULK_SIZE)]
+        send = lambda batch: _put_bulk(batch, token, date_value)
+    else:
+        batches = [[v] for v in values]
+        send = lambda batch: _put_one(batch[0], token, date_value)
+
+    def send_batch(batch):
+        try:
+            send(batch)
+            return batch, None, None
+        except requests.HTTPError as e:
+            return batch, f'{e.response.status_code} {e.response.text[:200]}', e.response.status_code
+        except Exception as e:
+            return batch, str(e), None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch, error, status in executor.map(send_batch, batches):
+            if error is None:
+                summary.succeeded += len(batch)
+            else:
+                summary.failed.extend(_failure(v, error, status) for v in batch)
+
+    summary.seconds = time.perf_counter() - start
+    log = logger.success if not summary.failed else logger.warning
+    log(f'Indicators sent: {summary.succeeded}/{summary.total} in {summary.seconds:.1f}s, {len(summary.failed)} failed')
+    return summary
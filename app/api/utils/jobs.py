@@ -0,0 +1,230 @@
+import time
+import uuid
+import threading
+import multiprocessing
+import dataclasses
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable
+from loguru import logger
+from app.api.utils.constants import JOB_WORKERS, JOBS_PER_REGION
+from app.api.utils import build_pipeline
+
+# Long-running work (assessments, matrix recalculation) leaves the web worker: jobs run in a pool
+# of JOB_WORKERS processes, at most JOBS_PER_REGION of them per region, the rest waits in a queue.
+# Submitting a job identical to a queued or running one returns the existing job, unless the job
+# supersedes: then the older one is dropped from the queue or cancelled at its next stage boundary.
+
+HISTORY_SIZE = 1000
+
+
+@dataclass
+class Job:
+    id : str
+    kind : str
+    region_id : int
+    key : tuple
+    status : str = 'queued' # 'queued', 'running', 'done', 'failed' or 'cancelled'
+    created_at : str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    started_at : str | None = None
+    finished_at : str | None = None
+    queued_seconds : float | None = None
+    run_seconds : float | None = None
+    error : str | None = None
+    result : Any = None
+
+    def as_dict(self) -> dict:
+        record = dataclasses.asdict(self)
+        record.pop('key')
+        return record
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Passed to superseding jobs as `cancel`; shared with the worker process through a manager event
+    """
+
+    def __init__(self, event):
+        self._event = event
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self, stage : str) -> None:
+        if self._event.is_set():
+            raise JobCancelled(f'cancelled before {stage}')
+
+
+@dataclass
+class _Task:
+    fn : Callable
+    args : tuple
+    steps : list[str]
+    cancel : CancelToken | None = None
+    submitted : float = field(default_factory=time.perf_counter)
+
+
+_jobs : 'OrderedDict[str, Job]' = OrderedDict()
+_tasks : dict[str, _Task] = {}
+_active : dict[tuple, str] = {}
+_queue : list[str] = []
+_running = Counter()
+_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+_manager = None
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+def _discard_pool(pool : ProcessPoolExecutor) -> None:
+    # a worker died (OOM, segfault) and took the pool down; the next job gets a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _cancel_token() -> CancelToken:
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context('spawn').Manager()
+        return CancelToken(_manager.Event())
+
+def _forget_old() -> None:
+    finished = [job_id for job_id, job in _jobs.items() if job.status in ('done', 'failed', 'cancelled')]
+    for job_id in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+        del _jobs[job_id]
+
+
+def submit(kind : str, region_id : int, fn : Callable, *args, key : tuple | None = None, steps : list[str] | None = None,
+           supersede : bool = False) -> Job:
+    """
+    Queue `fn(*args)` (a picklable module-level function) as a job.
+    `steps` are region artifacts materialized before the job is handed to a worker.
+    With `supersede` the job replaces an active job with the same key, `fn` then gets a `cancel`
+    token and is expected to call `cancel.check(stage)` between its stages.
+    """
+    key = (kind, region_id, *args) if key is None else key
+    cancel = _cancel_token() if supersede else None
+    with _lock:
+        job_id = _active.get(key)
+        if job_id is not None and not supersede:
+            logger.info(f'Job {kind} for region {region_id} is already {_jobs[job_id].status}: {job_id}')
+            return _jobs[job_id]
+        if job_id is not None:
+            _supersede(_jobs[job_id])
+        job = Job(uuid.uuid4().hex, kind, region_id, key)
+        _jobs[job.id] = job
+        _tasks[job.id] = _Task(fn, args, steps or [], cancel)
+        _active[key] = job.id
+        _queue.append(job.id)
+        _forget_old()
+    logger.info(f'Job {kind} for region {region_id} queued: {job.id}')
+    _dispatch()
+    return job
+
+def _supersede(job : Job) -> None:
+    # called under _lock
+    task = _tasks.get(job.id)
+    if job.status == 'queued':
+        _queue.remove(job.id)
+        _tasks.pop(job.id, None)
+        job.status = 'cancelled'
+        job.error = 'superseded'
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+    elif task is not None and task.cancel is not None:
+        task.cancel.cancel()
+    logger.info(f'Job {job.kind} for region {job.region_id} superseded: {job.id}')
+
+def _dispatch() -> None:
+    with _lock:
+        started = []
+        for job_id in list(_queue):
+            if sum(_running.values()) >= JOB_WORKERS:
+                break
+            job = _jobs[job_id]
+            if _running[job.region_id] >= JOBS_PER_REGION:
+                continue
+            _queue.remove(job_id)
+            _running[job.region_id] += 1
+            job.status = 'running'
+            job.started_at = datetime.now(timezone.utc).isoformat()
+            job.queued_seconds = time.perf_counter() - _tasks[job_id].submitted
+            started.append(job)
+    for job in started:
+        threading.Thread(target=_drive, args=(job,), name=f'job-{job.id[:8]}', daemon=True).start()
+
+def _drive(job : Job) -> None:
+    task = _tasks[job.id]
+    start = time.perf_counter()
+    try:
+        build_pipeline.ensure(job.region_id, task.steps)
+        kwargs = {}
+        if task.cancel is not None:
+            task.cancel.check('start')
+            kwargs['cancel'] = task.cancel
+        pool = _process_pool()
+        try:
+            result = pool.submit(task.fn, *task.args, **kwargs).result()
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise RuntimeError('job worker process died unexpectedly')
+        if dataclasses.is_dataclass(result):
+            result = dataclasses.asdict(result)
+        _finish(job, 'done', start, result=result)
+    except JobCancelled as e:
+        _finish(job, 'cancelled', start, error=f'superseded, {e}')
+    except Exception as e:
+        logger.error(f'Job {job.kind} for region {job.region_id} failed: {e}')
+        _finish(job, 'failed', start, error=str(e))
+    _dispatch()
+
+def _finish(job : Job, status : str, start : float, result : Any = None, error : str | None = None) -> None:
+    with _lock:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+        job.run_seconds = time.perf_counter() - start
+        _running[job.region_id] -= 1
+        _tasks.pop(job.id, None)
+        if _active.get(job.key) == job.id:
+            del _active[job.key]
+    logger.info(f'Job {job.kind} for region {job.region_id} {status} in {job.run_seconds:.1f}s: {job.id}')
+
+
+def headers(job : Job) -> dict[str, str]:
+    """
+    Response headers pointing a client at the status of a submitted job (GET /jobs/{job_id})
+    """
+    return {'Location': f'/jobs/{job.id}', 'X-Job-Id': job.id}
+
+def get(job_id : str) -> Job | None:
+    with _lock:
+        return _jobs.get(job_id)
+
+def list_jobs(status : str | None = None, region_id : int | None = None) -> list[Job]:
+    with _lock:
+        return [job for job in _jobs.values()
+                if (status is None or job.status == status) and (region_id is None or job.region_id == region_id)]
+
+def stats() -> dict[str, int]:
+    with _lock:
+        return dict(Counter(job.status for job in _jobs.values()))
@@ -0,0 +1,186 @@
+import os
+import json
+import fcntl
+import time
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Callable
+import geopandas as gpd
+from loguru import logger
+from app.api.utils.constants import REGIONS_DICT, DATA_PATH
+import app.api.utils.urban_api as ua
+from app.api.utils.single_flight import SingleFlight
+
+# Local GeoParquet mirror of Urban API object layers:
+#   layers/{region_id}/{layer}.parquet
+#   layers/{region_id}/manifest.json  -> {layer: {fetched_at, count, json_columns}}
+
+LAYER_SOURCES = {
+    'bus_stops': (ua.get_physical_objects, 10),
+    'train_stations': (ua.get_physical_objects, 30),
+    'ports': (ua.get_physical_objects, 28),
+    'water_objects': (ua.get_physical_objects, 2),
+    'airports': (ua.get_service_objects, 82),
+    'fuel_stations': (ua.get_service_objects, 84),
+}
+
+REFRESH_INTERVAL = float(os.environ.get('LAYERS_REFRESH_INTERVAL', 24 * 3600))
+
+_lock = threading.Lock()
+_flights = SingleFlight()
+
+
+def _region_dir(region_id : int) -> str:
+    return os.path.join(DATA_PATH, f'layers/{region_id}')
+
+def layer_path(region_id : int, layer : str) -> str:
+    return os.path.join(_region_dir(region_id), f'{layer}.parquet')
+
+def _manifest_path(region_id : int) -> str:
+    return os.path.join(_region_dir(region_id), 'manifest.json')
+
+def read_manifest(region_id : int) -> dict:
+    try:
+        with open(_manifest_path(region_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _replace_file(file_path : str, write : Callable[[str], None]) -> None:
+    # every writer gets its own temp file, concurrent refreshes (threads or worker processes) never share one
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(file_path), suffix='.tmp', delete=False) as f:
+        tmp_path = f.name
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _update_manifest(region_id : int, layer : str, record : dict) -> None:
+    def write(tmp_path : str) -> None:
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    with _lock:
+        manifest = read_manifest(region_id)
+        manifest[layer] = record
+        _replace_file(_manifest_path(region_id), write)
+
+def encode_nested(gdf : gpd.GeoDataFrame) -> tuple[gpd.GeoDataFrame, list[str]]:
+    """
+    Copy of a frame with nested objects (types, territories) as json strings, plus the names of those columns
+    """
+    gdf = gdf.copy()
+    json_columns = []
+    for column in gdf.columns:
+        if column == gdf.geometry.name or gdf[column].dtype != object:
+            continue
+        if any(isinstance(v, (dict, list)) for v in gdf[column]):
+            gdf[column] = [None if v is None else json.dumps(v, ensure_ascii=False) for v in gdf[column]]
+            json_columns.append(column)
+    return gdf, json_columns
+
+def decode_nested(gdf : gpd.GeoDataFrame, json_columns : list[str]) -> gpd.GeoDataFrame:
+    for column in json_columns:
+        gdf[column] = [None if v is None else json.loads(v) for v in gdf[column]]
+    return gdf
+
+def refresh_layer(region_id : int, layer : str) -> gpd.GeoDataFrame:
+    """
+    Fetch a layer from Urban API and store it; concurrent refreshes of the same layer share one fetch
+    """
+    return _flights.do((region_id, layer), lambda: _refresh_layer(region_id, layer)).copy()
+
+def _refresh_layer(region_id : int, layer : str) -> gpd.GeoDataFrame:
+    fetch, type_id = LAYER_SOURCES[layer]
+    start = time.perf_counter()
+    gdf = fetch(region_id, type_id)
+    encoded, json_columns = encode_nested(gdf)
+
+    os.makedirs(_region_dir(region_id), exist_ok=True)
+    _replace_file(layer_path(region_id, layer), encoded.to_parquet)
+    _update_manifest(region_id, layer, {
+        'fetched_at': datetime.now(timezone.utc).isoformat(),
+        'count': len(gdf),
+        'json_columns': json_columns,
+    })
+    logger.info(f'Layer {layer} for region {region_id} refreshed: {len(gdf)} objects in {time.perf_counter() - start:.1f}s')
+    return gdf
+
+def refresh_region(region_id : int, layers : list[str] | None = None) -> dict[str, str]:
+    status = {}
+    for layer in layers or LAYER_SOURCES:
+        try:
+            refresh_layer(region_id, layer)
+            status[layer] = 'refreshed'
+        except Exception as e:
+            # keep serving the previous copy
+            logger.error(f'Layer {layer} for region {region_id} was not refreshed: {e}')
+            status[layer] = f'failed: {e}'
+    return status
+
+def get_layer(region_id : int, layer : str) -> gpd.GeoDataFrame:
+    """
+    Layer from the local mirror, fetched from Urban API only if it was never stored
+    """
+    file_path = layer_path(region_id, layer)
+    if not os.path.exists(file_path):
+        try:
+            return refresh_layer(region_id, layer)
+        except Exception as e:
+            logger.error(f'Layer {layer} for region {region_id} is not available: {e}')
+            return gpd.GeoDataFrame(geometry=[], crs=ua.CRS)
+    return decode_nested(gpd.read_parquet(file_path), read_manifest(region_id).get(layer, {}).get('json_columns', []))
+
+def layers_version(region_id : int) -> tuple:
+    manifest = read_manifest(region_id)
+    return tuple((layer, manifest.get(layer, {}).get('fetched_at')) for layer in LAYER_SOURCES)
+
+
+def _stale_layers(region_id : int, interval : float) -> list[str]:
+    manifest = read_manifest(region_id)
+    now = datetime.now(timezone.utc)
+    return [layer for layer in LAYER_SOURCES
+            if layer not in manifest
+            or (now - datetime.fromisoformat(manifest[layer]['fetched_at'])).total_seconds() >= interval]
+
+def _scheduler_lock():
+    """Exclusive lock on layers/scheduler.lock, so one process per deployment refreshes.
+    Returns the open lock file, or None if another process holds it. The OS drops
+    the lock when the holder exits and the next round of another worker picks it up."""
+    os.makedirs(os.path.join(DATA_PATH, 'layers'), exist_ok=True)
+    lock_file = open(os.path.join(DATA_PATH, 'layers/scheduler.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _refresh_round(interval : float) -> None:
+    for region_id in REGIONS_DICT:
+        try:
+            stale = _stale_layers(region_id, interval)
+            if stale:
+                refresh_region(region_id, stale)
+        except Exception as e:
+            logger.error(f'Layers refresh failed for region {region_id}: {e}')
+
+def _refresh_loop(interval : float) -> None:
+    lock_file = None
+    while True:
+        try:
+            lock_file = lock_file or _scheduler_lock()
+            if lock_file is not None:
+                _refresh_round(interval)
+        except Exception as e:
+            logger.error(f'Layers refresh round failed: {e}')
+        time.sleep(min(interval, 3600))
+
+def start_refresh_scheduler(interval : float = REFRESH_INTERVAL) -> threading.Thread:
+    thread = threading.Thread(target=_refresh_loop, args=(interval,), name='layers-refresh', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,118 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from loguru import logger
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra
+from app.api.utils import graph_store, spatial_index
+from app.api.utils.graph_store import CompactGraph
+
+# Many-to-many travel times straight on the CSR layout of the stored graph:
+# points are snapped to their nearest node, and multi-source Dijkstra runs over chunks of
+# origins in a process pool. Each worker maps the graph once and keeps its CSR adjacency.
+
+WEIGHT = 'time_min'
+CHUNK_SIZE = int(os.environ.get('MATRIX_CHUNK_SIZE', 64))
+MATRIX_WORKERS = int(os.environ.get('MATRIX_WORKERS', 2))
+# csgraph drops explicit zeros from sparse input, zero-time edges get this instead
+MIN_WEIGHT = 1e-9
+
+
+def csr_adjacency(graph : CompactGraph, weight : str = WEIGHT) -> csr_array:
+    """
+    Sparse adjacency of the graph, the fastest of parallel edges wins
+    """
+    u, v = graph.sources, graph.indices
+    w = graph.weights(weight).astype(np.float64)
+    valid = np.isfinite(w)
+    u, v, w = u[valid], v[valid], w[valid]
+    order = np.lexsort((w, v, u))
+    u, v, w = u[order], v[order], w[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+    n = graph.number_of_nodes()
+    return csr_array((np.maximum(w[first], MIN_WEIGHT), (u[first], v[first])), shape=(n, n))
+
+def nearest_nodes(region_id : int, graph_type : str, points : gpd.GeoDataFrame) -> np.ndarray:
+    """
+    Positions (not ids) of the graph nodes closest to each point, through the persisted node index
+    """
+    positions, _ = spatial_index.node_index(region_id, graph_type).snap(points)
+    return positions
+
+
+_worker_graph : tuple[csr_array, bool] | None = None
+
+def _init_worker(region_id : int, graph_type : str, weight : str, reverse : bool = False) -> None:
+    global _worker_graph
+    graph = graph_store.read_graph(region_id, graph_type)
+    adjacency = csr_adjacency(graph, weight)
+    if reverse and graph.meta['directed']:
+        adjacency = adjacency.T.tocsr()
+    _worker_graph = (adjacency, graph.meta['directed'])
+
+def _route_chunk(sources : np.ndarray, targets : np.ndarray) -> np.ndarray:
+    adjacency, directed = _worker_graph
+    distances = dijkstra(adjacency, directed=directed, indices=sources)
+    return distances[:, targets].astype(np.float32)
+
+
+def accessibility_matrix(region_id : int, graph_type : Literal['car', 'inter'], origins : gpd.GeoDataFrame,
+                         destinations : gpd.GeoDataFrame | None = None, weight : str = WEIGHT,
+                         workers : int = MATRIX_WORKERS, reverse : bool = False) -> pd.DataFrame:
+    """
+    Travel times (minutes) between the nearest graph nodes of origins (rows) and destinations (columns),
+    laid out like availability_matrix: indexed by the ids of both frames, inf where unreachable.
+    With `reverse` the routes run over the reversed graph, i.e. the times are destination -> origin.
+    """
+    start = time.perf_counter()
+    destinations = origins if destinations is None else destinations
+    # origins sharing a node are routed once
+    source_nodes, inverse = np.unique(nearest_nodes(region_id, graph_type, origins), return_inverse=True)
+    target_nodes = nearest_nodes(region_id, graph_type, destinations)
+    chunks = [source_nodes[i:i + CHUNK_SIZE] for i in range(0, len(source_nodes), CHUNK_SIZE)]
+
+    initargs = (region_id, graph_type, weight, reverse)
+    if workers <= 1 or len(chunks) <= 1:
+        _init_worker(*initargs)
+        blocks = [_route_chunk(chunk, target_nodes) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            blocks = list(pool.map(_route_chunk, chunks, [target_nodes] * len(chunks)))
+
+    values = np.vstack(blocks) if blocks else np.empty((0, len(target_nodes)), dtype=np.float32)
+    matrix = pd.DataFrame(values[inverse], index=origins.index, columns=destinations.index)
+    logger.info(f'{graph_type.capitalize()} matrix {matrix.shape} for region {region_id} routed in {time.perf_counter() - start:.1f}s')
+    return matrix
+
+def times_to(region_id : int, graph_type : Literal['car', 'inter'], origins : gpd.GeoDataFrame,
+             destinations : gpd.GeoDataFrame, weight : str = WEIGHT, workers : int = MATRIX_WORKERS) -> pd.DataFrame:
+    """
+    Same matrix as accessibility_matrix(origins, destinations), routed from the destinations over
+    the reversed graph: the cost follows the number of destinations instead of the number of origins
+    """
+    return accessibility_matrix(region_id, graph_type, destinations, origins, weight, workers, reverse=True).T
+
+def compare(reference : pd.DataFrame, candidate : pd.DataFrame, tolerance : float = 1.0) -> dict:
+    """
+    Agreement of two matrices over their common ids, in minutes
+    """
+    index = reference.index.intersection(candidate.index)
+    columns = reference.columns.intersection(candidate.columns)
+    a = reference.loc[index, columns].to_numpy(dtype=np.float64)
+    b = candidate.loc[index, columns].to_numpy(dtype=np.float64)
+    both = np.isfinite(a) & np.isfinite(b)
+    diff = np.abs(a - b)[both]
+    return {
+        'pairs': int(a.size),
+        'reachability_mismatches': int((np.isfinite(a) != np.isfinite(b)).sum()),
+        'max_abs_diff': float(diff.max()) if diff.size else 0.0,
+        'mean_abs_diff': float(diff.mean()) if diff.size else 0.0,
+        'within_tolerance': float((diff <= tolerance).mean()) if diff.size else 1.0,
+    }
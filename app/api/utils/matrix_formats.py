@@ -0,0 +1,150 @@
+import io
+import json
+import zipfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Iterator
+from app.api.schemes.enums import MatrixFormat
+
+# rows serialized per chunk, a chunk is the unit of memory held while streaming
+ROW_CHUNK = 256
+
+MEDIA_TYPES = {
+    MatrixFormat.json: 'application/json',
+    MatrixFormat.ndjson: 'application/x-ndjson',
+    MatrixFormat.npz: 'application/x-npz',
+    MatrixFormat.arrow: 'application/vnd.apache.arrow.stream',
+    MatrixFormat.parquet: 'application/vnd.apache.parquet',
+}
+
+
+def negotiate_format(requested : MatrixFormat | None, accept : str | None) -> MatrixFormat:
+    if requested is not None:
+        return requested
+    if accept:
+        for media_range in accept.split(','):
+            media_type = media_range.split(';')[0].strip()
+            for matrix_format, format_media_type in MEDIA_TYPES.items():
+                if media_type == format_media_type:
+                    return matrix_format
+    return MatrixFormat.json
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object collecting bytes until the generator drains them
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _row_chunks(matrix : pd.DataFrame) -> Iterator[tuple[int, int]]:
+    for start in range(0, len(matrix.index), ROW_CHUNK):
+        yield start, min(start + ROW_CHUNK, len(matrix.index))
+
+def _json_rows(values : np.ndarray) -> list[list[float | None]]:
+    # json has no NaN/inf, unreachable pairs become null;
+    # float32 goes through its shortest repr, a plain widening would print 0.6893454 as 0.6893454194068909
+    if values.dtype == np.float32:
+        rows = values.astype(str).astype(np.float64).astype(object)
+    else:
+        rows = values.astype(np.float64).astype(object)
+    rows[~np.isfinite(values)] = None
+    return rows.tolist()
+
+def stream_json(matrix : pd.DataFrame) -> Iterator[bytes]:
+    # same document as AccessibilityMatrixModel, but never built as a whole
+    values = matrix.to_numpy(copy=False)
+    yield f'{{"index":{json.dumps(matrix.index.tolist())},"columns":{json.dumps(matrix.columns.tolist())},"values":['.encode()
+    for start, stop in _row_chunks(matrix):
+        rows = json.dumps(_json_rows(values[start:stop]))[1:-1]
+        yield (',' if start else '').encode() + rows.encode()
+    yield b']}'
+
+def stream_ndjson(matrix : pd.DataFrame) -> Iterator[bytes]:
+    # first line carries the destination ids, every next line is one origin row
+    values = matrix.to_numpy(copy=False)
+    yield (json.dumps({'columns': matrix.columns.tolist()}) + '\n').encode()
+    for start, stop in _row_chunks(matrix):
+        rows = _json_rows(values[start:stop])
+        ids = matrix.index[start:stop].tolist()
+        yield ''.join(json.dumps({'id': i, 'values': row}) + '\n' for i, row in zip(ids, rows)).encode()
+
+def stream_npz(matrix : pd.DataFrame) -> Iterator[bytes]:
+    # np.load-compatible archive with values.npy, index.npy and columns.npy
+    values = matrix.to_numpy(copy=False)
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, array in (('index', np.asarray(matrix.index)), ('columns', np.asarray(matrix.columns))):
+            with archive.open(f'{name}.npy', 'w') as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+        with archive.open('values.npy', 'w', force_zip64=True) as f:
+            header = np.lib.format.header_data_from_array_1_0(np.empty((0, 0), dtype=values.dtype))
+            header['shape'] = values.shape
+            np.lib.format.write_array_header_2_0(f, header)
+            yield sink.drain()
+            for start, stop in _row_chunks(matrix):
+                f.write(np.ascontiguousarray(values[start:stop]).tobytes())
+                yield sink.drain()
+    yield sink.drain()
+
+def _arrow_schema(matrix : pd.DataFrame, dtype : np.dtype) -> pa.Schema:
+    value_type = pa.from_numpy_dtype(dtype)
+    return pa.schema([pa.field('id', pa.from_numpy_dtype(np.asarray(matrix.index).dtype))]
+                     + [pa.field(str(c), value_type) for c in matrix.columns])
+
+def _record_batches(matrix : pd.DataFrame, schema : pa.Schema) -> Iterator[pa.RecordBatch]:
+    values = matrix.to_numpy(copy=False)
+    index = np.asarray(matrix.index)
+    for start, stop in _row_chunks(matrix):
+        block = np.ascontiguousarray(values[start:stop].T)
+        arrays = [pa.array(index[start:stop])] + [pa.array(column) for column in block]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def stream_arrow(matrix : pd.DataFrame) -> Iterator[bytes]:
+    # wide table: "id" of the origin plus one column per destination id
+    schema = _arrow_schema(matrix, matrix.to_numpy(copy=False).dtype)
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _record_batches(matrix, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+def stream_parquet(matrix : pd.DataFrame) -> Iterator[bytes]:
+    # one row group per chunk, same layout as the arrow stream
+    schema = _arrow_schema(matrix, matrix.to_numpy(copy=False).dtype)
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _record_batches(matrix, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+STREAMERS = {
+    MatrixFormat.json: stream_json,
+    MatrixFormat.ndjson: stream_ndjson,
+    MatrixFormat.npz: stream_npz,
+    MatrixFormat.arrow: stream_arrow,
+    MatrixFormat.parquet: stream_parquet,
+}
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+
+def _positions(ids : pd.Index, requested : list[int] | None) -> np.ndarray:
+    if requested is None:
+        return np.arange(len(ids))
+    positions = ids.get_indexer(requested)
+    missing = [i for i, p in zip(requested, positions) if p == -1]
+    if missing:
+        raise KeyError(missing)
+    return positions
+
+def _take(matrix : pd.DataFrame, rows : np.ndarray, cols : np.ndarray) -> np.ndarray:
+    # row selection first: on a memory-mapped matrix only the requested rows are read
+    return np.asarray(matrix.to_numpy(copy=False)[rows])[:, cols]
+
+def sub_matrix(matrix : pd.DataFrame, origins : list[int] | None = None, destinations : list[int] | None = None,
+               max_time : float | None = None) -> pd.DataFrame:
+    """
+    Slice of the matrix for the given origin and destination ids, pairs slower than max_time are set to NaN
+    """
+    rows = _positions(matrix.index, origins)
+    cols = _positions(matrix.columns, destinations)
+    values = _take(matrix, rows, cols)
+    if max_time is not None:
+        values = np.where(values <= max_time, values, np.nan).astype(values.dtype)
+    return pd.DataFrame(values, index=matrix.index[rows], columns=matrix.columns[cols])
+
+def k_nearest(matrix : pd.DataFrame, origins : list[int], k : int, destinations : list[int] | None = None,
+              max_time : float | None = None, exclude_self : bool = True) -> list[dict]:
+    """
+    Per-origin k closest destinations sorted by travel time
+    """
+    rows = _positions(matrix.index, origins)
+    cols = _positions(matrix.columns, destinations)
+    values = _take(matrix, rows, cols).astype(np.float64)
+    values[~np.isfinite(values)] = np.inf
+    if max_time is not None:
+        values[values > max_time] = np.inf
+    if exclude_self:
+        values[np.asarray(matrix.index[rows])[:, None] == np.asarray(matrix.columns[cols])[None, :]] = np.inf
+
+    k = min(k, len(cols))
+    if k == 0:
+        return [{'origin': o, 'destinations': [], 'times': []} for o in matrix.index[rows].tolist()]
+    nearest = np.argpartition(values, k - 1, axis=1)[:, :k]
+    times = np.take_along_axis(values, nearest, axis=1)
+    order = np.argsort(times, axis=1)
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    times = np.take_along_axis(times, order, axis=1)
+    destination_ids = np.asarray(matrix.columns[cols])
+    result = []
+    for origin, row_nearest, row_times in zip(matrix.index[rows].tolist(), nearest, times):
+        reachable = np.isfinite(row_times)
+        result.append({
+            'origin': origin,
+            'destinations': destination_ids[row_nearest[reachable]].tolist(),
+            'times': row_times[reachable].round(3).tolist(),
+        })
+    return result
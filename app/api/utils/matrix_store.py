@@ -0,0 +1,184 @@
+import os
+import glob
+import json
+import time
+import pickle
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from typing import Literal
+from loguru import logger
+from app.api.utils.constants import DATA_PATH
+from app.api.utils import matrix_tiles
+from app.api.utils.matrix_tiles import TiledMatrix
+
+# A matrix is a directory of versions, a save never touches the live one:
+#   matrices/{region_id}_{graph_type}_matrix/CURRENT              name of the live version
+#   matrices/{region_id}_{graph_type}_matrix/{version}/values.npy   float32 values, memory-mapped on read
+#                                                     /index.npy    row ids (settlements)
+#                                                     /columns.npy  column ids (settlements)
+#                                                     /points.npy   settlement coordinates (local crs) the matrix was built for
+#                                                     /meta.json    version of the graph it was built on
+# save_matrix fills a new version directory and swaps CURRENT with a single os.replace, so a reader
+# that resolves CURRENT once always pairs ids and values of the same version. The previous version is
+# kept for readers that resolved it just before the swap, older ones are removed.
+# Readers map the values read-only, so every worker shares the same page cache.
+#
+# With MATRIX_STORAGE=tiles the values go to {version}/values.tiles instead:
+# zstd-compressed tiles of float32 or uint16 minutes (see matrix_tiles for the precision bound),
+# sub-matrix reads decompress only the tiles they touch.
+
+MATRIX_DTYPE = np.float32
+MATRIX_STORAGE = os.environ.get('MATRIX_STORAGE', 'npy')
+MATRIX_TILES_DTYPE = os.environ.get('MATRIX_TILES_DTYPE', 'uint16')
+MATRIX_RESOLUTION = float(os.environ.get('MATRIX_RESOLUTION', matrix_tiles.DEFAULT_RESOLUTION))
+CURRENT = 'CURRENT'
+
+
+def matrix_path(region_id : int, graph_type : Literal['car', 'inter']) -> str:
+    return os.path.join(DATA_PATH, f'matrices/{region_id}_{graph_type}_matrix')
+
+def version_path(region_id : int, graph_type : Literal['car', 'inter']) -> str | None:
+    """
+    Directory of the live version, None when the matrix was never saved
+    """
+    directory = matrix_path(region_id, graph_type)
+    try:
+        with open(os.path.join(directory, CURRENT)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(directory, version)
+
+def _values_file(version_dir : str) -> str:
+    tiled = os.path.join(version_dir, 'values.tiles')
+    return tiled if os.path.exists(tiled) else os.path.join(version_dir, 'values.npy')
+
+def values_path(region_id : int, graph_type : Literal['car', 'inter']) -> str:
+    version_dir = version_path(region_id, graph_type)
+    return _values_file(matrix_path(region_id, graph_type) if version_dir is None else version_dir)
+
+def legacy_matrix_path(region_id : int, graph_type : Literal['car', 'inter']) -> str:
+    return os.path.join(DATA_PATH, f'matrices/{region_id}_{graph_type}_matrix.pickle')
+
+def matrix_exists(region_id : int, graph_type : Literal['car', 'inter']) -> bool:
+    return version_path(region_id, graph_type) is not None
+
+def read_matrix_meta(region_id : int, graph_type : Literal['car', 'inter']) -> dict:
+    version_dir = version_path(region_id, graph_type)
+    if version_dir is None:
+        return {}
+    with open(os.path.join(version_dir, 'meta.json')) as f:
+        return json.load(f)
+
+def read_matrix_points(region_id : int, graph_type : Literal['car', 'inter']) -> pd.DataFrame | None:
+    version_dir = version_path(region_id, graph_type)
+    if version_dir is None or not os.path.exists(os.path.join(version_dir, 'points.npy')):
+        return None
+    index = np.load(os.path.join(version_dir, 'index.npy'))
+    return pd.DataFrame(np.load(os.path.join(version_dir, 'points.npy')), index=index, columns=['x', 'y'])
+
+def _publish(directory : str, version : str) -> str | None:
+    """
+    Point CURRENT to `version` and return the version it replaced
+    """
+    pointer = os.path.join(directory, CURRENT)
+    try:
+        with open(pointer) as f:
+            previous = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+        f.write(version)
+    os.replace(f.name, pointer)
+    return previous
+
+def _prune(directory : str, keep : set[str]) -> None:
+    # version names start with their creation time, so a version still being written sorts after the kept ones
+    oldest_kept = min(keep)
+    for name in os.listdir(directory):
+        if name not in keep and name != CURRENT and os.path.isdir(os.path.join(directory, name)) and name < oldest_kept:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+def save_matrix(matrix : pd.DataFrame, region_id : int, graph_type : Literal['car', 'inter'],
+                points : pd.DataFrame | None = None, graph_version : str | None = None) -> str:
+    """
+    `points` (x, y of every row id) and `graph_version` make later incremental updates possible
+    """
+    directory = matrix_path(region_id, graph_type)
+    os.makedirs(directory, exist_ok=True)
+    version_dir = tempfile.mkdtemp(prefix=f'{time.time_ns()}_', dir=directory)
+    np.save(os.path.join(version_dir, 'index.npy'), np.asarray(matrix.index), allow_pickle=False)
+    np.save(os.path.join(version_dir, 'columns.npy'), np.asarray(matrix.columns), allow_pickle=False)
+    if points is not None:
+        np.save(os.path.join(version_dir, 'points.npy'), points.loc[matrix.index, ['x', 'y']].to_numpy(dtype=np.float64))
+    with open(os.path.join(version_dir, 'meta.json'), 'w') as f:
+        json.dump({'graph_version': graph_version, 'size': len(matrix)}, f)
+    if MATRIX_STORAGE == 'tiles':
+        file_path = os.path.join(version_dir, 'values.tiles')
+        matrix_tiles.write_tiles(matrix.to_numpy(dtype=np.float64), file_path, MATRIX_TILES_DTYPE, MATRIX_RESOLUTION)
+    else:
+        file_path = os.path.join(version_dir, 'values.npy')
+        np.save(file_path, np.ascontiguousarray(matrix.to_numpy(dtype=MATRIX_DTYPE)), allow_pickle=False)
+
+    version = os.path.basename(version_dir)
+    previous = _publish(directory, version)
+    _prune(directory, {version} if previous is None else {version, previous})
+    return file_path
+
+_tiled : dict[tuple[int, str], tuple[str, TiledMatrix]] = {}
+_tiled_lock = threading.Lock()
+
+def open_tiled(region_id : int, graph_type : Literal['car', 'inter']) -> TiledMatrix | None:
+    """
+    Shared read-only view of a tiled matrix, opened (mapped, header parsed) once per version.
+    Callers may use it as a context manager, closing a shared view leaves the map open.
+    A replaced view is not closed explicitly, readers may still hold it; its map goes with the last of them.
+    """
+    version_dir = version_path(region_id, graph_type)
+    file_path = None if version_dir is None else os.path.join(version_dir, 'values.tiles')
+    if file_path is None or not os.path.exists(file_path):
+        with _tiled_lock:
+            _tiled.pop((region_id, graph_type), None)
+        return None
+    with _tiled_lock:
+        cached = _tiled.get((region_id, graph_type))
+        if cached is not None and cached[0] == version_dir:
+            return cached[1]
+        index = np.load(os.path.join(version_dir, 'index.npy'))
+        columns = np.load(os.path.join(version_dir, 'columns.npy'))
+        tiled = TiledMatrix(file_path, index, columns, shared=True)
+        _tiled[(region_id, graph_type)] = (version_dir, tiled)
+        return tiled
+
+def read_matrix(region_id : int, graph_type : Literal['car', 'inter']) -> pd.DataFrame:
+    tiled = open_tiled(region_id, graph_type)
+    if tiled is not None:
+        # decoded as a whole for consumers that need a full DataFrame (get_criteria, indicator_area)
+        return tiled.frame()
+    version_dir = version_path(region_id, graph_type)
+    if version_dir is None:
+        raise FileNotFoundError(f"{graph_type.capitalize()} matrix for region {region_id} not found.")
+    values = np.load(_values_file(version_dir), mmap_mode='r')
+    index = np.load(os.path.join(version_dir, 'index.npy'))
+    columns = np.load(os.path.join(version_dir, 'columns.npy'))
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+def migrate_pickles() -> list[str]:
+    """
+    One-shot conversion of pickled DataFrame matrices into the memory-mapped layout
+    """
+    migrated = []
+    for pickle_path in sorted(glob.glob(os.path.join(DATA_PATH, 'matrices/*_matrix.pickle'))):
+        region_id, graph_type = os.path.basename(pickle_path).split('_')[:2]
+        region_id = int(region_id)
+        if not matrix_exists(region_id, graph_type):
+            with open(pickle_path, 'rb') as f:
+                matrix = pickle.load(f)
+            save_matrix(matrix, region_id, graph_type)
+            logger.success(f'{graph_type.capitalize()} matrix for region {region_id} migrated from {pickle_path}')
+        os.remove(pickle_path)
+        migrated.append(pickle_path)
+    return migrated
@@ -0,0 +1,89 @@
+import os
+import copy
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+import shapely
+import geopandas as gpd
+from loguru import logger
+from app.api.utils.single_flight import SingleFlight
+
+CRITERIA_CACHE_ENTRIES = int(os.environ.get('CRITERIA_CACHE_ENTRIES', 10000))
+CRITERIA_CACHE_MB = int(os.environ.get('CRITERIA_CACHE_MB', 64))
+
+# coordinates are compared at ~1 cm, so the same polygon resent by the UI hashes the same
+GEOMETRY_GRID_SIZE = 1e-7
+
+
+def geometry_hash(gdf : gpd.GeoDataFrame) -> str:
+    """
+    Hash of the geometries in their order, insensitive to ring orientation, starting vertex and float noise
+    """
+    geometries = shapely.set_precision(gdf.to_crs(4326).geometry.values, GEOMETRY_GRID_SIZE)
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(shapely.normalize(geometries)):
+        digest.update(wkb)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU cache of computed results bounded by entry count and total pickled size.
+    Concurrent misses for the same key are computed once.
+    Keys are expected to contain the version of every input, stale entries are never hit and age out.
+    """
+
+    def __init__(self, name : str, max_entries : int, max_bytes : int):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._values : OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key : Hashable, fn : Callable[[], Any]) -> Any:
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(cached[0])
+            self.misses += 1
+
+        def load():
+            value = fn()
+            self._store(key, value)
+            return value
+
+        return copy.deepcopy(self._flights.do(key, load))
+
+    def _store(self, key : Hashable, value : Any) -> None:
+        size = len(pickle.dumps(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._values:
+                self._bytes -= self._values.pop(key)[1]
+            self._values[key] = (value, size)
+            self._bytes += size
+            while len(self._values) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._values.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._bytes = 0
+        logger.info(f'Result cache {self.name} invalidated')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._values), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+criteria_cache = ResultCache('criteria', CRITERIA_CACHE_ENTRIES, CRITERIA_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,186 @@
+import os
+import pickle
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Literal
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from scipy.spatial import cKDTree
+from loguru import logger
+from app.api.utils.constants import DATA_PATH
+from app.api.utils import graph_store, layer_store
+from app.api.utils.single_flight import SingleFlight
+
+# Per-region spatial indexes, stored next to the graph they belong to:
+#   graphs/{region_id}_{graph_type}_graph.kdtree.pickle            KD-tree over graph nodes
+#   graphs/{region_id}_{graph_type}_graph.snapped.{source}.parquet  nearest node of every settlement / layer object
+# Each file records the graph version (and the source version) it was built for and is rebuilt
+# on the first use after either of them changes.
+
+_lock = threading.Lock()
+_flights = SingleFlight()
+_node_indexes : dict[tuple[int, str], 'NodeIndex'] = {}
+_node_trees : dict[tuple[int, str], tuple[str, shapely.STRtree]] = {}
+_layer_trees : dict[tuple[int, str], tuple[str, shapely.STRtree, gpd.GeoDataFrame]] = {}
+
+
+def index_path(region_id : int, graph_type : Literal['car', 'inter'], part : str) -> str:
+    return os.path.join(DATA_PATH, f'graphs/{region_id}_{graph_type}_graph.{part}')
+
+
+@dataclass
+class NodeIndex:
+    graph_version : str
+    crs : int
+    node_ids : np.ndarray
+    tree : cKDTree
+
+    def snap(self, points : gpd.GeoDataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Positions of the nearest nodes (as in the CSR layout) and distances to them, in meters
+        """
+        geometry = points.to_crs(self.crs).geometry.representative_point()
+        distances, positions = self.tree.query(np.column_stack([geometry.x.to_numpy(), geometry.y.to_numpy()]))
+        return positions, distances
+
+
+def _build_node_index(region_id : int, graph_type : str, version : str) -> NodeIndex:
+    graph = graph_store.read_graph(region_id, graph_type)
+    index = NodeIndex(version, graph.crs, graph.node_ids, cKDTree(np.column_stack([graph.x, graph.y])))
+    file_path = index_path(region_id, graph_type, 'kdtree.pickle')
+    with open(f'{file_path}.tmp', 'wb') as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f'{file_path}.tmp', file_path)
+    logger.info(f'Node index of the {graph_type} graph for region {region_id} built: {len(index.node_ids)} nodes')
+    return index
+
+def _read_node_index(region_id : int, graph_type : str) -> NodeIndex | None:
+    try:
+        with open(index_path(region_id, graph_type, 'kdtree.pickle'), 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+def node_index(region_id : int, graph_type : Literal['car', 'inter'] = 'car') -> NodeIndex:
+    version = graph_store.graph_version(region_id, graph_type)
+    if version is None:
+        raise FileNotFoundError(f"{graph_type.capitalize()} graph for region {region_id} not found.")
+    with _lock:
+        index = _node_indexes.get((region_id, graph_type))
+    if index is not None and index.graph_version == version:
+        return index
+
+    def load() -> NodeIndex:
+        index = _read_node_index(region_id, graph_type)
+        if index is None or index.graph_version != version:
+            index = _build_node_index(region_id, graph_type, version)
+        with _lock:
+            _node_indexes[(region_id, graph_type)] = index
+        return index
+
+    # one reader or builder per graph version, other regions are not held up
+    return _flights.do(('node_index', region_id, graph_type, version), load)
+
+def node_tree(region_id : int, graph_type : Literal['car', 'inter'] = 'car') -> tuple[NodeIndex, shapely.STRtree]:
+    """
+    Node index plus an STRtree over the node points (same positions), for polygon queries;
+    the tree is kept in memory until the graph changes
+    """
+    index = node_index(region_id, graph_type)
+    with _lock:
+        cached = _node_trees.get((region_id, graph_type))
+    if cached is not None and cached[0] == index.graph_version:
+        return index, cached[1]
+
+    def build_tree() -> shapely.STRtree:
+        tree = shapely.STRtree(shapely.points(index.tree.data))
+        with _lock:
+            _node_trees[(region_id, graph_type)] = (index.graph_version, tree)
+        return tree
+
+    return index, _flights.do(('node_tree', region_id, graph_type, index.graph_version), build_tree)
+
+def index_exists(region_id : int, graph_types : tuple[str, ...] = ('car', 'inter')) -> bool:
+    """
+    Whether every stored graph of the region has an up-to-date node index (graphs that are not built need none)
+    """
+    for graph_type in graph_types:
+        version = graph_store.graph_version(region_id, graph_type) if graph_store.graph_exists(region_id, graph_type) else None
+        if version is None:
+            continue
+        with _lock:
+            index = _node_indexes.get((region_id, graph_type))
+        index = index or _read_node_index(region_id, graph_type)
+        if index is None or index.graph_version != version:
+            return False
+    return True
+
+def build(region_id : int) -> bool:
+    for graph_type in ('car', 'inter'):
+        if graph_store.graph_exists(region_id, graph_type):
+            node_index(region_id, graph_type)
+    return True
+
+
+def points_version(points : gpd.GeoDataFrame) -> str:
+    """
+    Hash of object ids and geometries
+    """
+    digest = hashlib.sha1(pd.util.hash_pandas_object(pd.Series(points.index), index=False).to_numpy().tobytes())
+    for wkb in shapely.to_wkb(points.geometry.values):
+        digest.update(wkb or b'')
+    return digest.hexdigest()
+
+def snapped(region_id : int, source : str, points : gpd.GeoDataFrame, graph_type : Literal['car', 'inter'] = 'car') -> pd.DataFrame:
+    """
+    Nearest node of every object of a source (a mirrored layer name or e.g. 'settlements'):
+    node position, node id and distance in meters, indexed like `points`
+    """
+    index = node_index(region_id, graph_type)
+    # keyed on the points themselves: another frame under the same source name must not reuse the snapping
+    version = f'{index.graph_version}:{points_version(points)}'
+    file_path = index_path(region_id, graph_type, f'snapped.{source}.parquet')
+    if os.path.exists(file_path):
+        table = pq.read_table(file_path)
+        if (table.schema.metadata or {}).get(b'version', b'').decode() == version:
+            return table.to_pandas()
+
+    positions, distances = index.snap(points)
+    result = pd.DataFrame({'node': positions, 'node_id': index.node_ids[positions], 'distance': distances}, index=points.index)
+    table = pa.Table.from_pandas(result)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), b'version': version.encode()})
+    pq.write_table(table, f'{file_path}.tmp')
+    os.replace(f'{file_path}.tmp', file_path)
+    return result
+
+
+def layer_tree(region_id : int, layer : str) -> tuple[shapely.STRtree, gpd.GeoDataFrame]:
+    """
+    STRtree over a mirrored layer, kept in memory until the layer is refreshed
+    """
+    version = layer_store.read_manifest(region_id).get(layer, {}).get('fetched_at')
+    with _lock:
+        cached = _layer_trees.get((region_id, layer))
+        if cached is not None and cached[0] == version and version is not None:
+            return cached[1], cached[2]
+    gdf = layer_store.get_layer(region_id, layer).reset_index(drop=True)
+    tree = shapely.STRtree(gdf.geometry.values)
+    with _lock:
+        _layer_trees[(region_id, layer)] = (version, tree, gdf)
+    return tree, gdf
+
+def objects_within(region_id : int, layer : str, polygons : gpd.GeoSeries) -> list[np.ndarray]:
+    """
+    Row positions of layer objects intersecting each polygon, one vectorized tree query for all of them
+    """
+    tree, gdf = layer_tree(region_id, layer)
+    polygon_positions, object_positions = tree.query(polygons.to_crs(gdf.crs).values, predicate='intersects')
+    # pairs come sorted by polygon after a stable argsort, one split gives every polygon its objects
+    order = np.argsort(polygon_positions, kind='stable')
+    bounds = np.searchsorted(polygon_positions[order], np.arange(1, len(polygons)))
+    return np.split(object_positions[order], bounds)
@@ -0,0 +1,77 @@
+import copy
+import time
+import threading
+import functools
+import pandas as pd
+from typing import Any, Callable
+from loguru import logger
+from app.api.utils.single_flight import SingleFlight
+
+_caches : dict[str, 'TTLCache'] = {}
+
+
+def _copy(value : Any) -> Any:
+    # callers freely mutate what they get (e.g. towns geometry -> representative points)
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    return copy.copy(value)
+
+
+class TTLCache:
+    """
+    Results of one function keyed by its arguments, each kept for `ttl` seconds.
+    Concurrent misses for the same key trigger a single call.
+    """
+
+    def __init__(self, name : str, ttl : float):
+        self.name = name
+        self.ttl = ttl
+        self._values : dict[tuple, tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+
+    def get(self, key : tuple, fn : Callable[[], Any]) -> Any:
+        with self._lock:
+            cached = self._values.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return _copy(cached[1])
+
+        def load():
+            value = fn()
+            with self._lock:
+                self._values[key] = (time.monotonic(), value)
+            return value
+
+        return _copy(self._flights.do(key, load))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def ttl_cache(name : str, ttl : float):
+    def decorator(fn):
+        cache = _caches[name] = TTLCache(name, ttl)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return cache.get(key, lambda: fn(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+def invalidate(name : str | None = None) -> list[str]:
+    names = list(_caches) if name is None else [name]
+    for n in names:
+        _caches[n].invalidate()
+    logger.info(f'Caches invalidated: {names}')
+    return names
+
+def cache_names() -> list[str]:
+    return list(_caches)
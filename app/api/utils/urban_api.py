@@ -1,14 +1,17 @@
 from datetime import date, datetime
+import math
 import requests
 import shapely
 import json
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 import geopandas as gpd
 import os
-import networkx as nx
-import momepy
-import pickle
-from app.api.utils.constants import REGIONS_DICT, REGIONS_CRS, DATA_PATH
+from app.api.utils.constants import REGIONS_CRS
+from app.api.utils import artifacts
+from app.api.utils.ttl_cache import ttl_cache
 
 if 'URBAN_API' in os.environ:
   URBAN_API = os.environ['URBAN_API']
@@ -21,10 +24,60 @@ POPULATION_COUNT_INDICATOR_ID = 1
 INDICATOR_VALUE_TYPE = 'real'
 INDICATOR_INFORMATION_SOURCE = 'transport_frames'
 
+TIMEOUT = float(os.environ.get('URBAN_API_TIMEOUT', 60))
+RETRIES = int(os.environ.get('URBAN_API_RETRIES', 3))
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+POOL_SIZE = int(os.environ.get('URBAN_API_POOL_SIZE', 16))
+PAGE_CONCURRENCY = int(os.environ.get('URBAN_API_PAGE_CONCURRENCY', 4))
+
+# optional endpoint accepting a list of indicator values in one request
+BULK_INDICATORS_PATH = os.environ.get('URBAN_API_BULK_INDICATORS_PATH')
+
+# reference data changes a few times a year, cached results live this long (seconds)
+REGIONS_TTL = float(os.environ.get('URBAN_API_REGIONS_TTL', 24 * 3600))
+TERRITORIES_TTL = float(os.environ.get('URBAN_API_TERRITORIES_TTL', 6 * 3600))
+TERRITORY_TYPES_TTL = float(os.environ.get('URBAN_API_TERRITORY_TYPES_TTL', 24 * 3600))
+
+# http client
+
+def _create_session() -> requests.Session:
+  # one keep-alive pool for the whole process, idempotent requests are retried with backoff
+  retry = Retry(total=RETRIES, backoff_factor=BACKOFF_FACTOR, status_forcelist=RETRY_STATUSES, raise_on_status=False)
+  adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+  session = requests.Session()
+  session.mount('http://', adapter)
+  session.mount('https://', adapter)
+  return session
+
+session = _create_session()
+
+def _auth(token : str | None) -> dict:
+  return {'Authorization': f'Bearer {token}'} if token else {}
+
+def _get(path : str, params : dict | None = None, token : str | None = None, timeout : float = TIMEOUT) -> requests.Response:
+  res = session.get(f'{URBAN_API}{path}', params=params, headers=_auth(token), timeout=timeout)
+  res.raise_for_status()
+  return res
+
+def _put(path : str, json : dict | list, token : str | None = None, timeout : float = TIMEOUT) -> requests.Response:
+  res = session.put(f'{URBAN_API}{path}', json=json, headers=_auth(token), timeout=timeout)
+  res.raise_for_status()
+  return res
+
+def _objects_to_gdf(results : list[dict]) -> gpd.GeoDataFrame:
+  if not results:
+    return gpd.GeoDataFrame(geometry=[], crs=CRS)
+  df = pd.DataFrame(results)
+  # one vectorized decode instead of a shapely call per feature
+  df['geometry'] = shapely.from_geojson([json.dumps(g) for g in df['geometry']])
+  return gpd.GeoDataFrame(df, geometry='geometry', crs=CRS)
+
 # updated territories methods
 
+@ttl_cache('territories', TERRITORIES_TTL)
 def get_territories(parent_id : int | None = None, all_levels = False, geometry : bool = False) -> pd.DataFrame | gpd.GeoDataFrame:
-  res = requests.get(URBAN_API + f'/api/v1/all_territories{"" if geometry else "_without_geometry"}', {
+  res = _get(f'/api/v1/all_territories{"" if geometry else "_without_geometry"}', {
       'parent_id': parent_id,
       'get_all_levels': all_levels
   })
@@ -48,6 +101,7 @@ def _fetch_territories(region_id : int) -> tuple[dict[int, gpd.GeoDataFrame], gp
   # fetch population
   return {level:units_gdf[units_gdf.level == level] for level in levels}, towns_gdf
 
+@ttl_cache('fetch_territories', TERRITORIES_TTL)
 def fetch_territories(region_id : int, regional_scenario_id : int | None = None, population : bool = True, geometry = True) -> tuple[dict[int, gpd.GeoDataFrame], gpd.GeoDataFrame]:
     """
     Fetch region territories for specific regional_scenario with population (optional) and geometry (optional)
@@ -74,15 +128,15 @@ def get_admin_centers(units_gdfs, towns_gdf, level : int) -> gpd.GeoDataFrame:
     return towns_gdf[towns_gdf.index.isin(admin_centers_ids)]
 
 def get_scenario_by_id(scenario_id : int, token : str):
-    res = requests.get(URBAN_API + f'/api/v1/scenarios/{scenario_id}', headers={'Authorization': f'Bearer {token}'})
+    res = _get(f'/api/v1/scenarios/{scenario_id}', token=token)
     return res.json()
 
 def get_project_by_id(project_id : int, token : str):
-    res = requests.get(URBAN_API + f'/api/v1/projects/{project_id}/territory', headers={'Authorization': f'Bearer {token}'})
+    res = _get(f'/api/v1/projects/{project_id}/territory', token=token)
     return res.json()
 
-def post_scenario_indicator(indicator_id : int, scenario_id : int, value : float, token : str, comment : str = '-'):
-    res = requests.put(URBAN_API + f'/api/v1/scenarios/indicators_values', headers={'Authorization': f'Bearer {token}'}, json={
+def scenario_indicator_payload(indicator_id : int, scenario_id : int, value : float, comment : str = '-') -> dict:
+    return {
         'indicator_id': indicator_id,
         'scenario_id': scenario_id,
         'territory_id': None,
@@ -91,48 +145,59 @@ def post_scenario_indicator(indicator_id : int, scenario_id : int, value : float
         'comment': comment,
         'information_source': INDICATOR_INFORMATION_SOURCE,
         'properties' : {}
-    })
+    }
+
+def territory_indicator_payload(indicator_id : int, territory_id : int, value : float, date_value : str | None = None) -> dict:
+    return {
+        "indicator_id": indicator_id,
+        "territory_id": territory_id,
+        "date_type": "day",
+        "date_value": date_value or datetime.now().strftime("%Y-%m-%d"),
+        "value": value,
+        "value_type": "real",
+        "information_source": INDICATOR_INFORMATION_SOURCE
+    }
+
+def post_scenario_indicator(indicator_id : int, scenario_id : int, value : float, token : str, comment : str = '-'):
+    res = _put(f'/api/v1/scenarios/indicators_values', token=token, json=scenario_indicator_payload(indicator_id, scenario_id, value, comment))
+    return res
+
+def post_territory_indicator(indicator_id : int, territory_id : int, value : float, date_value : str | None = None):
+    res = _put("/api/v1/indicator_value", json=territory_indicator_payload(indicator_id, territory_id, value, date_value))
     return res
 
-def post_territory_indicator(indicator_id : int, territory_id : int, value : float):
-    res = requests.put(
-        f"{URBAN_API}/api/v1/indicator_value",
-        json={
-          "indicator_id": indicator_id,
-          "territory_id": territory_id,
-          "date_type": "day",
-          "date_value": datetime.now().strftime("%Y-%m-%d"),
-          "value": value,
-          "value_type": "real",
-          "information_source": INDICATOR_INFORMATION_SOURCE
-      }
-    )
+def put_indicators_bulk(payloads : list[dict], token : str | None = None):
+    # BULK_INDICATORS_PATH must accept a json list of the same payloads as the single-value endpoints
+    res = _put(BULK_INDICATORS_PATH, token=token, json=payloads)
     return res
 
 # methods relocated from idu_clients:
 
 def get_country_regions(country_id : int) -> pd.DataFrame: # returns region districts
-  res = requests.get(f'{URBAN_API}/api/v1/all_territories', {
+  res = _get('/api/v1/all_territories', {
       'parent_id':country_id
   })
   return gpd.GeoDataFrame.from_features(res.json()['features'], crs=CRS).set_index('territory_id', drop=True)
 
 def get_countries_without_geometry() -> pd.DataFrame:
-  res = requests.get(f'{URBAN_API}/api/v1/all_territories_without_geometry')
+  res = _get('/api/v1/all_territories_without_geometry')
   return pd.DataFrame(res.json()).set_index('territory_id', drop=True)
 
+@ttl_cache('regions', REGIONS_TTL)
 def get_regions():
   countries = get_countries_without_geometry()
   countries_ids = countries.index
-  countries_regions = [get_country_regions(country_id) for country_id in countries_ids]
+  with ThreadPoolExecutor(max_workers=PAGE_CONCURRENCY) as executor:
+    countries_regions = list(executor.map(get_country_regions, countries_ids))
   return pd.concat(countries_regions)
 
+@ttl_cache('territory_types', TERRITORY_TYPES_TTL)
 def get_territory_types() -> pd.DataFrame:
-  res = requests.get(f'{URBAN_API}/api/v1/territory_types')
+  res = _get('/api/v1/territory_types')
   return pd.DataFrame(res.json()).set_index('territory_type_id', drop=True)
 
 def get_region_territories(region_id : int) -> dict[int, gpd.GeoDataFrame]:
-  res = requests.get(f'{URBAN_API}/api/v1/all_territories', {
+  res = _get('/api/v1/all_territories', {
       'parent_id': region_id,
       'get_all_levels': True
   })
@@ -145,49 +210,53 @@ def get_region_territories(region_id : int) -> dict[int, gpd.GeoDataFrame]:
 
 # deafult methods:
 
-def _get_physical_objects(region_id : int, pot_id : int, page : int, page_size : int =PAGE_SIZE):
-  res = requests.get(f'{URBAN_API}/api/v1/territory/{region_id}/physical_objects_with_geometry', {
+def _physical_objects_request(region_id : int, pot_id : int, page : int, page_size : int = PAGE_SIZE) -> tuple[str, dict]:
+  return f'/api/v1/territory/{region_id}/physical_objects_with_geometry', {
     'physical_object_type_id': pot_id,
     'page': page,
     'page_size': page_size,
-  })
-  return res.json()
+  }
 
-def get_physical_objects(region_id : int, pot_id : int):
-  page = 1
-  results = []
-  while True:
-    res_json = _get_physical_objects(region_id, pot_id, page, page_size=PAGE_SIZE)
-    results.extend(res_json['results'])
-    if res_json['next'] is None:
-      break
-    page += 1
-  for result in results:
-    g = result['geometry']
-    result['geometry'] = shapely.from_geojson(json.dumps(g))
-  return gpd.GeoDataFrame(results, crs=4326)
-
-def _get_service_objects(region_id : int, st_id : int, page : int, page_size : int = PAGE_SIZE):
-  res = requests.get(f'{URBAN_API}/api/v1/territory/{region_id}/services_with_geometry', {
+def _service_objects_request(region_id : int, st_id : int, page : int, page_size : int = PAGE_SIZE) -> tuple[str, dict]:
+  return f'/api/v1/territory/{region_id}/services_with_geometry', {
     'service_type_id': st_id,
     'page': page,
     'page_size': page_size,
-  })
-  return res.json()
+  }
+
+def _get_physical_objects(region_id : int, pot_id : int, page : int, page_size : int =PAGE_SIZE):
+  return _get(*_physical_objects_request(region_id, pot_id, page, page_size)).json()
+
+def _get_service_objects(region_id : int, st_id : int, page : int, page_size : int = PAGE_SIZE):
+  return _get(*_service_objects_request(region_id, st_id, page, page_size)).json()
+
+def _fetch_pages(get_page) -> list[dict]:
+  # the first page tells how many there are, the rest are fetched concurrently
+  first = get_page(1)
+  results = list(first['results'])
+  if first['next'] is None:
+    return results
+  if 'count' not in first:
+    page = 1
+    res_json = first
+    while res_json['next'] is not None:
+      page += 1
+      res_json = get_page(page)
+      results.extend(res_json['results'])
+    return results
+  pages = math.ceil(first['count'] / PAGE_SIZE)
+  with ThreadPoolExecutor(max_workers=PAGE_CONCURRENCY) as executor:
+    for res_json in executor.map(get_page, range(2, pages + 1)):
+      results.extend(res_json['results'])
+  return results
+
+def get_physical_objects(region_id : int, pot_id : int):
+  results = _fetch_pages(lambda page: _get_physical_objects(region_id, pot_id, page, page_size=PAGE_SIZE))
+  return _objects_to_gdf(results)
 
 def get_service_objects(region_id : int, st_id : int):
-  page = 1
-  results = []
-  while True:
-    res_json = _get_service_objects(region_id, st_id, page, page_size=PAGE_SIZE)
-    results.extend(res_json['results'])
-    if res_json['next'] is None:
-      break
-    page += 1
-  for result in results:
-    g = result['geometry']
-    result['geometry'] = shapely.from_geojson(json.dumps(g))
-  return gpd.GeoDataFrame(results, crs=4326)
+  results = _fetch_pages(lambda page: _get_service_objects(region_id, st_id, page, page_size=PAGE_SIZE))
+  return _objects_to_gdf(results)
 
 def get_bus_stops(region_id : int):
   try:
@@ -232,8 +301,14 @@ def get_water_objects(region_id : int):
     return gpd.GeoDataFrame(geometry=[], crs=4326)
 
 def get_bus_routes(region_id : int):
-  inter = load_inter(region_id)
-  n,e = momepy.nx_to_gdf(inter)
+  # edges are read straight from the compact graph, no networkx round trip;
+  # columns match momepy.nx_to_gdf: edge attributes plus node_start/node_end node positions
+  graph = artifacts.load_compact_graph(region_id, 'inter')
+  e = graph.edges_frame()
+  position = pd.Series(range(len(graph.node_ids)), index=graph.node_ids)
+  e['node_start'] = position[e.pop('u')].values
+  e['node_end'] = position[e.pop('v')].values
+  e = e.drop(columns='key')
   bus_routes = e[e['type']=='bus']
   return bus_routes
 
@@ -250,16 +325,3 @@ def get_international_airports(region_id : int):
 
 def get_region_admin_center(region_id : int):
   return None
-
-# Utils
-
-def load_inter(region_id: int) -> nx.Graph:
-    inter_file = os.path.join(DATA_PATH, f'graphs/{region_id}_inter_graph.pickle')
-    if not os.path.exists(inter_file):
-        region_name = REGIONS_DICT.get(region_id, f"Region ID {region_id}")
-        raise FileNotFoundError(f"Inter graph for {region_name} not found.")
-    
-    with open(inter_file, "rb") as f:
-        inter = pickle.load(f)
-
-    return inter
\ No newline at end of file
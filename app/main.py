@@ -7,13 +7,19 @@ import os
 import sys
 
 from app.api.utils.constants import DATA_PATH
-from app.api.utils import get_graphs
-from app.api.utils import get_matrix
+from app.api.utils import matrix_store
+from app.api.utils import graph_store
+from app.api.utils import build_pipeline
+from app.api.utils import layer_store
+from app.api.utils import indicator_outbox
 from app.api.routers import router_interpretation_criteria
 from app.api.routers import router_get_matrix
 from app.api.routers import router_recalculate_matrix
 from app.api.routers import router_transport_indicator
 from app.api.routers import router_transport_indicator_region
+from app.api.routers import router_status
+from app.api.routers import router_layers
+from app.api.routers import router_jobs
 
 logger.remove()
 logger.add(
@@ -43,14 +49,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(router_status.router)
 app.include_router(router_transport_indicator_region.router)
 app.include_router(router_interpretation_criteria.router)
 app.include_router(router_get_matrix.router)
 app.include_router(router_recalculate_matrix.router)
 app.include_router(router_transport_indicator.router)
+app.include_router(router_layers.router)
+app.include_router(router_jobs.router)
 
 def create_required_directories():
-        required_dirs = ['matrices', 'frames', 'graphs']
+        required_dirs = ['matrices', 'frames', 'graphs', 'layers', 'accessibility']
         for dir_name in required_dirs:
             dir_path = os.path.join(DATA_PATH, dir_name)
             if not os.path.exists(dir_path):
@@ -63,6 +72,9 @@ def create_required_directories():
 @app.on_event("startup")
 async def startup_event():
     create_required_directories()
-    get_graphs.process_graph()
-    get_matrix.process_matrix()
-    get_graphs.process_frames()
\ No newline at end of file
+    matrix_store.migrate_pickles()
+    graph_store.migrate_pickles()
+    # artifacts are built in the background, requests for a missing one build it on demand
+    build_pipeline.run_in_background()
+    layer_store.start_refresh_scheduler()
+    indicator_outbox.start_flusher()
\ No newline at end of file
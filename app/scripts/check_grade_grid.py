@@ -0,0 +1,25 @@
+import sys
+import json
+from loguru import logger
+from transport_frames.framebuilder.frame import Frame
+from app.api.utils.constants import REGIONS_DICT
+from app.api.utils.urban_api import fetch_territories
+from app.api.utils import artifacts, grade_grid
+
+# python -m app.scripts.check_grade_grid [region_id] [sample] [tolerance]
+# Grades a sample of administrative units both ways and reports how far the grid lookup deviates.
+
+if __name__ == '__main__':
+    region_id = int(sys.argv[1]) if len(sys.argv) > 1 else next(iter(REGIONS_DICT))
+    sample = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    units_gdfs, _ = fetch_territories(region_id)
+    units = units_gdfs[max(units_gdfs)]
+    territories = units.sample(min(sample, len(units)), random_state=0)[['geometry']].assign(name='')
+    reference = Frame.grade_territory(artifacts.load_frame(region_id), territories.copy())['grade']
+    reference.index = territories.index
+    candidate = grade_grid.grade_territory(region_id, territories)['grade']
+    report = grade_grid.compare(reference, candidate, tolerance)
+    logger.info(f'Region {region_id}, {len(territories)} territories: {json.dumps(report)}')
+    sys.exit(0 if report['within_tolerance'] >= 0.95 else 1)
@@ -0,0 +1,22 @@
+import sys
+import json
+from loguru import logger
+from app.api.utils.constants import REGIONS_DICT
+from app.api.utils.get_matrix import load_settlement_points, route_matrix
+from app.api.utils import matrix_engine
+
+# python -m app.scripts.check_matrix_engine [region_id] [graph_type] [sample]
+# Routes a sample of settlements with both engines and reports how far the scipy one deviates.
+
+if __name__ == '__main__':
+    region_id = int(sys.argv[1]) if len(sys.argv) > 1 else next(iter(REGIONS_DICT))
+    graph_type = sys.argv[2] if len(sys.argv) > 2 else 'car'
+    sample = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+    points = load_settlement_points(region_id)
+    origins = points.sample(min(sample, len(points)), random_state=0)
+    reference = route_matrix(region_id, graph_type, origins, points, engine='transport_frames')
+    candidate = route_matrix(region_id, graph_type, origins, points, engine='scipy')
+    report = matrix_engine.compare(reference, candidate)
+    logger.info(f'Region {region_id}, {graph_type} graph, {len(origins)} origins: {json.dumps(report)}')
+    sys.exit(0 if report['reachability_mismatches'] == 0 and report['within_tolerance'] >= 0.99 else 1)
@@ -0,0 +1,8 @@
+from loguru import logger
+from app.api.utils import matrix_store, graph_store
+
+# python -m app.scripts.migrate_artifacts
+
+if __name__ == '__main__':
+    migrated = matrix_store.migrate_pickles() + graph_store.migrate_pickles()
+    logger.info(f'{len(migrated)} pickled artifacts migrated')
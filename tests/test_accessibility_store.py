@@ -0,0 +1,43 @@
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+from app.api.utils import accessibility_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(accessibility_store, 'DATA_PATH', str(tmp_path))
+    versions = {'car': 'graph-1'}
+    monkeypatch.setattr(accessibility_store.graph_store, 'graph_version', lambda region_id, graph_type: versions[graph_type])
+    calls = []
+
+    def preprocess(towns, services, graph, local_crs):
+        calls.append(len(services['bus_stops']))
+        return towns.assign(bus_stops_accessibility_min=1.5, nearest=[{'bus_stops': [1, 2]}] * len(towns))
+
+    monkeypatch.setattr(accessibility_store, 'preprocess_service_accessibility', preprocess)
+    return versions, calls
+
+
+def _points(*xs):
+    return gpd.GeoDataFrame(geometry=[Point(x, 0) for x in xs], index=range(len(xs)), crs=32636)
+
+
+def test_accessibility_is_reused_until_an_input_changes(store):
+    versions, calls = store
+    towns = _points(0, 100)
+    services = {'bus_stops': _points(50)}
+
+    first = accessibility_store.service_accessibility(1, towns, services, None, 32636)
+    again = accessibility_store.service_accessibility(1, towns, services, None, 32636)
+    assert calls == [1]
+    assert again['bus_stops_accessibility_min'].tolist() == [1.5, 1.5]
+    assert again['nearest'].tolist() == first['nearest'].tolist() == [{'bus_stops': [1, 2]}] * 2
+
+    accessibility_store.service_accessibility(1, towns, {'bus_stops': _points(50, 70)}, None, 32636)
+    assert calls == [1, 2]
+
+    versions['car'] = 'graph-2'
+    accessibility_store.service_accessibility(1, towns, {'bus_stops': _points(50, 70)}, None, 32636)
+    assert calls == [1, 2, 2]
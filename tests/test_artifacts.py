@@ -0,0 +1,114 @@
+import os
+import pickle
+
+import networkx as nx
+import pandas as pd
+import pytest
+
+from app.api.utils import artifacts, matrix_store, graph_store
+from app.api.utils.artifacts import ArtifactCache
+
+
+def _dump(obj, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(obj, f)
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(matrix_store, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(graph_store, 'DATA_PATH', str(tmp_path))
+    (tmp_path / 'matrices').mkdir()
+    (tmp_path / 'graphs').mkdir()
+    return tmp_path
+
+
+def test_graph_is_cached_and_read_only(data_path):
+    graph = nx.MultiDiGraph(crs='32636')
+    graph.add_node(1, x=0.0, y=0.0)
+    graph.add_node(2, x=1.0, y=0.0)
+    graph.add_edge(1, 2, time_min=1.5, type='car')
+    graph_store.save_graph(graph, 1, 'car')
+
+    cache = ArtifactCache(max_bytes=10 ** 9)
+    first = cache.get(1, 'car_graph')
+    assert first is cache.get(1, 'car_graph')
+    assert first.crs == 32636
+
+    view = first.to_networkx()
+    assert view is first.to_networkx()
+    assert view.graph['crs'] == 32636
+    assert view.edges[1, 2, 0] == {'time_min': 1.5, 'type': 'car'}
+    with pytest.raises(nx.NetworkXError):
+        view.add_edge(2, 3)
+
+
+def test_networkx_view_counts_against_the_ceiling(data_path):
+    graph = nx.MultiDiGraph(crs=32636)
+    nx.add_path(graph, range(50), time_min=1.0)
+    for node in graph.nodes:
+        graph.nodes[node].update(x=float(node), y=0.0)
+    graph_store.save_graph(graph, 1, 'car')
+
+    cache = ArtifactCache(max_bytes=10 ** 9)
+    compact = cache.get(1, 'car_graph')
+    before = cache.stats()['total_bytes']
+    compact.to_networkx()
+    assert compact.networkx_nbytes > 0
+    assert cache.stats()['total_bytes'] == before + compact.networkx_nbytes
+
+
+def test_reload_on_file_change(data_path):
+    matrix_store.save_matrix(pd.DataFrame([[0.0, 1.0], [1.0, 0.0]], index=[5, 6], columns=[5, 6]), 1, 'car')
+    cache = ArtifactCache(max_bytes=10 ** 9)
+    matrix = cache.get(1, 'car_matrix')
+    assert matrix.shape == (2, 2)
+    assert matrix.loc[5, 6] == 1.0
+
+    matrix_store.save_matrix(pd.DataFrame([[0.0]], index=[5], columns=[5]), 1, 'car')
+    assert cache.get(1, 'car_matrix').shape == (1, 1)
+
+
+def test_saved_versions_replace_ids_and_values_together(data_path):
+    # one settlement deleted and one added: same shape and file size, other ids
+    matrix_store.save_matrix(pd.DataFrame([[0.0, 1.0], [1.0, 0.0]], index=[5, 6], columns=[5, 6]), 1, 'car')
+    cache = ArtifactCache(max_bytes=10 ** 9)
+    assert list(cache.get(1, 'car_matrix').index) == [5, 6]
+    first = matrix_store.version_path(1, 'car')
+
+    matrix_store.save_matrix(pd.DataFrame([[0.0, 2.0], [2.0, 0.0]], index=[5, 7], columns=[5, 7]), 1, 'car')
+    matrix = cache.get(1, 'car_matrix')
+    assert list(matrix.index) == list(matrix.columns) == [5, 7]
+    assert matrix.loc[5, 7] == 2.0
+    # the replaced version stays for readers that resolved it just before the swap
+    assert os.path.exists(first)
+
+    matrix_store.save_matrix(pd.DataFrame([[0.0]], index=[5], columns=[5]), 1, 'car')
+    assert not os.path.exists(first)
+    assert len(os.listdir(matrix_store.matrix_path(1, 'car'))) == 3
+
+
+def test_migrate_pickles(data_path):
+    _dump(pd.DataFrame([[0.0, 2.5], [2.5, 0.0]], index=[7, 8], columns=[7, 8]), str(data_path / 'matrices/1_inter_matrix.pickle'))
+    assert len(matrix_store.migrate_pickles()) == 1
+    matrix = matrix_store.read_matrix(1, 'inter')
+    assert matrix.loc[7, 8] == 2.5
+    assert not os.path.exists(data_path / 'matrices/1_inter_matrix.pickle')
+
+
+def test_lru_region_eviction(data_path):
+    for region_id in (1, 2):
+        _dump(nx.path_graph(100, create_using=nx.MultiDiGraph), str(data_path / f'frames/{region_id}_frame.pickle'))
+    size = os.path.getsize(data_path / 'frames/1_frame.pickle')
+
+    cache = ArtifactCache(max_bytes=size)
+    cache.get(1, 'frame')
+    cache.get(2, 'frame')
+    assert list(cache.stats()['regions']) == [2]
+
+
+def test_missing_artifact(data_path):
+    with pytest.raises(FileNotFoundError):
+        ArtifactCache(max_bytes=1).get(1, 'frame')
@@ -0,0 +1,84 @@
+import os
+
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from app.api.utils import facility_engine, graph_store, layer_store, matrix_engine, spatial_index
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    for module in (graph_store, spatial_index, layer_store):
+        monkeypatch.setattr(module, 'DATA_PATH', str(tmp_path))
+    (tmp_path / 'graphs').mkdir()
+    monkeypatch.setattr(facility_engine, '_reversed', {})
+    monkeypatch.setattr(facility_engine, '_fields', {})
+
+    # one-way ring 0 -> 1 -> ... -> 5 -> 0 with a two-way link 1 <-> 4 and an isolated node 6
+    graph = nx.MultiDiGraph(crs=32636)
+    for node in range(7):
+        graph.add_node(node, x=1000.0 * node, y=0.0)
+    for node in range(6):
+        graph.add_edge(node, (node + 1) % 6, time_min=1.0 + node)
+    graph.add_edge(1, 4, time_min=2.5)
+    graph.add_edge(4, 1, time_min=0.5)
+    graph_store.save_graph(graph, 1, 'car')
+    return graph
+
+
+def _points(xs):
+    return gpd.GeoDataFrame(geometry=[Point(x, 10) for x in xs], index=[100 + i for i in range(len(xs))], crs=32636)
+
+
+def test_nearest_facility_times_match_matrix_minima(graph):
+    origins = _points([1000.0 * node for node in range(7)])
+    facilities = _points([2000.0, 5000.0])
+
+    times = facility_engine.nearest_facility_times(1, 'fuel_stations', facilities)
+    expected = matrix_engine.accessibility_matrix(1, 'car', origins, facilities, workers=1).min(axis=1)
+
+    field = facility_engine.times_at(1, origins, times)
+    np.testing.assert_allclose(field.to_numpy(), expected.to_numpy(), rtol=1e-6)
+    assert np.isinf(field.iloc[6])
+    assert facility_engine.nearest_facility_times(1, 'fuel_stations', facilities) is times
+
+
+def test_territory_takes_the_best_node_inside(graph):
+    facilities = _points([5000.0])
+    territories = gpd.GeoDataFrame(geometry=[box(-100, -100, 1100, 100), box(2500, 500, 2600, 600)], crs=32636)
+
+    result = facility_engine.territory_accessibility(1, territories, {'fuel_stations': facilities})
+    times = facility_engine.nearest_facility_times(1, 'fuel_stations', facilities)
+    # nodes 0 and 1 are inside the first territory, the second one falls back to its nearest node
+    assert result['fuel_stations_accessibility_min'].tolist() == pytest.approx([min(times[0], times[1]), times[3]])
+
+
+def test_other_facilities_under_the_same_source_are_snapped_again(graph):
+    # the mirrored layer has not been refreshed in between, a different frame comes under its name
+    os.makedirs(layer_store._region_dir(1))
+    layer_store._update_manifest(1, 'fuel_stations', {'fetched_at': '2026-01-01T00:00:00'})
+    origins = _points([1000.0 * node for node in range(6)])
+    facility_engine.nearest_facility_times(1, 'fuel_stations', _points([2000.0]))
+
+    moved = _points([5000.0])
+    times = facility_engine.nearest_facility_times(1, 'fuel_stations', moved)
+    expected = matrix_engine.accessibility_matrix(1, 'car', origins, moved, workers=1).min(axis=1)
+    np.testing.assert_allclose(facility_engine.times_at(1, origins, times).to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+
+def test_area_takes_the_median_over_its_settlements(graph):
+    towns = _points([0.0, 1000.0, 2000.0, 6000.0])
+    facilities = {'fuel_stations': _points([5000.0]), 'railway_stations': None}
+    areas = gpd.GeoDataFrame(geometry=[box(-500, -500, 2500, 500), box(5500, -500, 6500, 500), box(9000, 0, 9100, 100)],
+                             index=[31, 32, 33], crs=32636)
+
+    result = facility_engine.area_accessibility(1, towns, areas, facilities)
+    times = facility_engine.settlement_accessibility(1, towns, facilities)['fuel_stations_accessibility_min']
+    assert result.loc[31, 'fuel_stations_accessibility_min'] == pytest.approx(times.iloc[:3].median())
+    # node 6 reaches nothing, an area without reachable settlements gets no value
+    assert np.isnan(result.loc[32, 'fuel_stations_accessibility_min'])
+    assert np.isnan(result.loc[33, 'fuel_stations_accessibility_min'])
+    assert result['railway_stations_accessibility_min'].isna().all()
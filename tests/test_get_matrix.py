@@ -0,0 +1,76 @@
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from app.api.utils import artifacts, get_matrix, graph_store, matrix_engine, matrix_store, spatial_index
+
+
+@pytest.fixture
+def region(tmp_path, monkeypatch):
+    for module in (artifacts, graph_store, spatial_index, matrix_store):
+        monkeypatch.setattr(module, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(artifacts, 'artifact_cache', artifacts.ArtifactCache(max_bytes=10 ** 9))
+    (tmp_path / 'graphs').mkdir()
+    (tmp_path / 'matrices').mkdir()
+    monkeypatch.setattr(get_matrix, 'INCREMENTAL_MAX_SHARE', 1.0)
+
+    # a ring of one-way streets with a two-way shortcut, so the reversed graph really differs
+    graph = nx.MultiDiGraph(crs=32636)
+    for node in range(6):
+        graph.add_node(node, x=1000.0 * node, y=0.0)
+    for node in range(6):
+        graph.add_edge(node, (node + 1) % 6, time_min=1.0 + node)
+    graph.add_edge(2, 4, time_min=0.5)
+    graph.add_edge(4, 2, time_min=0.5)
+    graph_store.save_graph(graph, 1, 'car')
+    return monkeypatch
+
+
+def _settlements(monkeypatch, xs):
+    points = gpd.GeoDataFrame(geometry=[Point(x, 5) for x in xs.values()], index=list(xs), crs=32636).to_crs(4326)
+    monkeypatch.setattr(get_matrix, 'load_settlement_points', lambda region_id: points)
+    return points
+
+
+def _fake_availability_matrix(graph, origins, destinations, local_crs):
+    # asymmetric like a real road graph: going east costs an extra half minute
+    o = origins.to_crs(local_crs).geometry.x.to_numpy()[:, None]
+    d = destinations.to_crs(local_crs).geometry.x.to_numpy()[None, :]
+    values = np.abs(d - o) / 1000 + np.where(d > o, 0.5, 0.0)
+    return pd.DataFrame(values, index=origins.index, columns=destinations.index)
+
+
+def test_incremental_update_matches_full_rebuild(region):
+    region.setattr(get_matrix, 'MATRIX_ENGINE', 'scipy')
+    region.setattr(get_matrix, 'route_matrix',
+                   lambda region_id, graph_type, origins, destinations=None: matrix_engine.accessibility_matrix(
+                       region_id, graph_type, origins, destinations, workers=1))
+    _settlements(region, {10: 0, 20: 1000, 30: 2000, 40: 3000})
+    assert get_matrix.update_matrix(1, 'car') == 'full'
+
+    # 20 moves, 30 is deleted, 50 is added
+    points = _settlements(region, {10: 0, 20: 4000, 40: 3000, 50: 5000})
+    assert get_matrix.update_matrix(1, 'car') == 'incremental'
+
+    updated = matrix_store.read_matrix(1, 'car')
+    expected = matrix_engine.accessibility_matrix(1, 'car', points, workers=1)
+    assert sorted(updated.index) == sorted(expected.index) == [10, 20, 40, 50]
+    np.testing.assert_allclose(updated.loc[expected.index, expected.columns].to_numpy(), expected.to_numpy(), rtol=1e-6)
+    assert get_matrix.update_matrix(1, 'car') == 'unchanged'
+
+
+def test_default_engine_routes_rows_and_columns_alike(region):
+    region.setattr(get_matrix, 'MATRIX_ENGINE', 'transport_frames')
+    region.setattr(get_matrix, 'availability_matrix', _fake_availability_matrix)
+    _settlements(region, {10: 0, 20: 1000, 30: 2000, 40: 3000})
+    assert get_matrix.update_matrix(1, 'car') == 'full'
+
+    points = _settlements(region, {10: 0, 20: 4000, 40: 3000, 50: 5000})
+    assert get_matrix.update_matrix(1, 'car') == 'incremental'
+    updated = matrix_store.read_matrix(1, 'car')
+
+    expected = get_matrix._full_rebuild(1, 'car', points)
+    np.testing.assert_allclose(updated.loc[expected.index, expected.columns].to_numpy(), expected.to_numpy(), rtol=1e-6)
@@ -0,0 +1,41 @@
+import math
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from shapely.geometry import Point, box
+
+from app.api.utils import grade_grid
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(grade_grid, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(grade_grid, '_frame_version', lambda region_id: [['frame', 1, 1]])
+    monkeypatch.setattr(grade_grid, '_grids', {})
+    return tmp_path
+
+
+def test_territory_gets_the_best_grade_of_the_cells_it_touches(data_path):
+    # 2 x 3 cells of 100 m, the lower right one lies outside the region
+    values = np.array([[1.0, 2.0, np.nan], [3.0, 4.5, 5.0]])
+    grade_grid._save(1, values, {'frame_version': [['frame', 1, 1]], 'crs': 32636, 'x0': 0.0, 'y0': 0.0,
+                                 'cell_size': 100.0, 'shape': [2, 3]})
+    assert grade_grid.grid_exists(1)
+
+    territories = gpd.GeoDataFrame(geometry=[box(10, 10, 150, 50), Point(250, 150).buffer(10), box(1000, 1000, 1100, 1100)],
+                                   index=[7, 8, 9], crs=32636)
+    grades = grade_grid.grade_grid(1).lookup(territories)
+
+    assert grades[7] == pytest.approx(2.0)
+    assert grades[8] == pytest.approx(5.0)
+    assert math.isnan(grades[9])
+
+
+def test_grid_of_another_frame_is_outdated(data_path, monkeypatch):
+    grade_grid._save(1, np.ones((1, 1)), {'frame_version': [['frame', 1, 1]], 'crs': 32636, 'x0': 0.0, 'y0': 0.0,
+                                          'cell_size': 100.0, 'shape': [1, 1]})
+    monkeypatch.setattr(grade_grid, '_frame_version', lambda region_id: [['frame', 2, 1]])
+    assert not grade_grid.grid_exists(1)
+    with pytest.raises(FileNotFoundError):
+        grade_grid.grade_grid(1)
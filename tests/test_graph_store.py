@@ -0,0 +1,58 @@
+import networkx as nx
+import numpy as np
+import pytest
+from shapely.geometry import LineString, Point
+
+from app.api.utils import artifacts, graph_store, urban_api
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_store, 'DATA_PATH', str(tmp_path))
+    (tmp_path / 'graphs').mkdir()
+    return tmp_path
+
+
+def _graph():
+    graph = nx.MultiDiGraph(crs=32636)
+    graph.add_node(1, x=0.0, y=0.0, name='a')
+    graph.add_node(2, x=1.0, y=0.0, name='b', degree=np.int64(3), ref=np.int64(7))
+    graph.add_node(3, x=2.0, y=0.0, ref='3a')
+    graph.add_edge(1, 2, time_min=1.5, type='bus', geometry=LineString([(0, 0), (1, 0)]),
+                   routes=['1', '2K'], lanes=np.int32(2), speed=np.float32(0.5))
+    graph.add_edge(2, 3, time_min=2.0, type='walk', geometry=LineString([(1, 0), (2, 0)]))
+    return graph
+
+
+def test_attributes_round_trip(data_path):
+    graph_store.save_graph(_graph(), 1, 'inter')
+    view = graph_store.read_graph(1, 'inter').to_networkx()
+
+    assert view.nodes[2]['degree'] == 3
+    assert 'degree' not in view.nodes[1]
+    assert view.nodes[2]['ref'] == 7 and view.nodes[3]['ref'] == '3a'
+    edge = view.edges[1, 2, 0]
+    assert edge['routes'] == ['1', '2K']
+    assert edge['lanes'] == 2
+    assert edge['speed'] == 0.5
+    assert edge['geometry'].equals(LineString([(0, 0), (1, 0)]))
+    assert 'routes' not in view.edges[2, 3, 0]
+
+
+def test_unsupported_attribute_is_rejected(data_path):
+    graph = _graph()
+    graph.edges[2, 3, 0]['stop'] = Point(1, 0)
+    graph.edges[1, 2, 0]['stop'] = 'bus stop'
+    with pytest.raises(TypeError, match="'stop'"):
+        graph_store.save_graph(graph, 1, 'inter')
+
+
+def test_bus_routes_keep_momepy_columns(data_path, monkeypatch):
+    graph_store.save_graph(_graph(), 1, 'inter')
+    monkeypatch.setattr(artifacts, 'load_compact_graph', lambda region_id, graph_type: graph_store.read_graph(region_id, graph_type))
+
+    routes = urban_api.get_bus_routes(1)
+
+    assert not {'u', 'v', 'key'} & set(routes.columns)
+    assert routes[['node_start', 'node_end']].values.tolist() == [[0, 1]]
+    assert routes.crs.to_epsg() == 32636
@@ -0,0 +1,117 @@
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.api.utils import indicator_outbox
+from app.api.utils.indicator_writer import IndicatorValue, WriteSummary
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    monkeypatch.setattr(indicator_outbox, 'OUTBOX_PATH', str(tmp_path / 'outbox.sqlite'))
+    monkeypatch.setattr(indicator_outbox, '_tokens', {})
+    monkeypatch.setattr(indicator_outbox, 'SERVICE_TOKEN', 'service')
+    monkeypatch.setattr(indicator_outbox, 'start_flusher', lambda *args, **kwargs: None)
+    return tmp_path / 'outbox.sqlite'
+
+
+class FakeWriter:
+    def __init__(self, *failures):
+        # one entry per write call: None delivers everything, (status, error) fails every value
+        self.failures = list(failures)
+        self.calls = []
+
+    def __call__(self, values, token=None, date_value=None, **kwargs):
+        self.calls.append(([v.indicator_id for v in values], token))
+        failure = self.failures.pop(0) if self.failures else None
+        if failure is None:
+            return WriteSummary(total=len(values), succeeded=len(values))
+        status, error = failure
+        return WriteSummary(total=len(values), failed=[
+            {'indicator_id': v.indicator_id, 'territory_id': v.territory_id, 'scenario_id': v.scenario_id,
+             'error': error, 'status': status} for v in values])
+
+
+def _rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT id, indicator_id, value, attempts, sent_at FROM outbox ORDER BY id').fetchall()
+
+
+def test_same_key_is_updated_in_place_and_token_is_not_stored(outbox):
+    first = indicator_outbox.enqueue([IndicatorValue(1, 1.0, scenario_id=5)], token='secret', date_value='2026-01-01')
+    second = indicator_outbox.enqueue([IndicatorValue(1, 2.0, scenario_id=5), IndicatorValue(2, 3.0, scenario_id=5)],
+                                      token='secret', date_value='2026-01-01')
+
+    assert second[0] == first[0]
+    rows = _rows(outbox)
+    assert [(r[1], r[2]) for r in rows] == [(1, '2.0'), (2, '3.0')]
+    assert b'secret' not in outbox.read_bytes()
+
+
+def test_flush_sends_only_the_given_rows_with_the_enqueuing_token(outbox, monkeypatch):
+    writer = FakeWriter()
+    monkeypatch.setattr(indicator_outbox.indicator_writer, 'write', writer)
+    indicator_outbox.enqueue([IndicatorValue(1, 1.0, territory_id=10)])
+    mine = indicator_outbox.enqueue([IndicatorValue(2, 2.0, scenario_id=5)], token='user')
+
+    summary = indicator_outbox.flush(mine)
+
+    assert writer.calls == [([2], 'user')]
+    assert (summary.total, summary.succeeded, summary.failed) == (1, 1, [])
+    assert [r[4] is not None for r in _rows(outbox)] == [False, True]
+
+
+def test_failed_rows_are_retried_and_rejected_ones_are_dead(outbox, monkeypatch):
+    writer = FakeWriter((500, '500 busy'), None)
+    monkeypatch.setattr(indicator_outbox.indicator_writer, 'write', writer)
+    row_ids = indicator_outbox.enqueue([IndicatorValue(1, 1.0, territory_id=10)])
+
+    assert indicator_outbox.flush(row_ids).failed[0]['error'] == '500 busy'
+    assert _rows(outbox)[0][3] == 1
+    assert indicator_outbox.flush(row_ids).succeeded == 1
+
+    writer.failures = [(401, '401 expired')]
+    row_ids = indicator_outbox.enqueue([IndicatorValue(2, 1.0, scenario_id=5)], token='old')
+    indicator_outbox.flush(row_ids)
+    assert indicator_outbox.stats()['dead'] == 1
+    calls = len(writer.calls)
+    indicator_outbox.flush()
+    assert len(writer.calls) == calls
+
+
+def test_expired_lease_is_claimed_again(outbox, monkeypatch):
+    indicator_outbox.enqueue([IndicatorValue(1, 1.0, territory_id=10)])
+    with indicator_outbox.closing(indicator_outbox._connect()) as conn:
+        assert len(indicator_outbox._claim(conn, 10)) == 1
+        assert indicator_outbox._claim(conn, 10) == []
+
+        now = time.time()
+        monkeypatch.setattr(indicator_outbox.time, 'time', lambda: now + indicator_outbox.LEASE_SECONDS + 1)
+        assert len(indicator_outbox._claim(conn, 10)) == 1
+
+
+def _set_owner(path, owner):
+    with sqlite3.connect(path) as conn:
+        conn.execute('UPDATE outbox SET owner = ?', (owner,))
+
+
+def test_rows_wait_for_their_owner_and_orphans_go_out_with_the_service_token(outbox, monkeypatch):
+    writer = FakeWriter()
+    monkeypatch.setattr(indicator_outbox.indicator_writer, 'write', writer)
+    indicator_outbox.enqueue([IndicatorValue(1, 1.0, scenario_id=5)], token='user')
+
+    # enqueued by another process that is still running (e.g. a job worker): its flusher sends it
+    indicator_outbox._tokens.clear()
+    _set_owner(outbox, f'{socket.gethostname()}:{os.getppid()}')
+    assert indicator_outbox.flush().total == 0
+
+    finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+    finished.wait()
+    _set_owner(outbox, f'{socket.gethostname()}:{finished.pid}')
+    assert indicator_outbox.flush().succeeded == 1
+    assert writer.calls == [([1], 'service')]
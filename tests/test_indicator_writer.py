@@ -0,0 +1,24 @@
+import requests
+
+from app.api.utils import indicator_writer
+from app.api.utils import urban_api as ua
+from app.api.utils.indicator_writer import IndicatorValue
+
+
+def _response(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b'{"detail": "rejected"}'
+    return response
+
+
+def test_rejected_puts_fail_with_their_status(monkeypatch):
+    statuses = {5: 200, 6: 403}
+    monkeypatch.setattr(ua, 'BULK_INDICATORS_PATH', None)
+    monkeypatch.setattr(ua.session, 'put', lambda url, json, **kwargs: _response(statuses[json['scenario_id']]))
+
+    summary = indicator_writer.write([IndicatorValue(1, 1.0, scenario_id=5), IndicatorValue(1, 1.0, scenario_id=6)], token='t')
+
+    assert summary.succeeded == 1
+    assert [(f['scenario_id'], f['status']) for f in summary.failed] == [(6, 403)]
+    assert summary.failed[0]['error'].startswith('403')
@@ -0,0 +1,32 @@
+from app.api.utils import jobs
+from app.api.utils.constants import RESPONSE_MESSAGE
+
+
+def _fake_submit(monkeypatch):
+    submitted = []
+
+    def submit(kind, region_id, fn, *args, key=None, **kwargs):
+        submitted.append(key)
+        return jobs.Job(f'job{len(submitted)}', kind, region_id, key)
+
+    monkeypatch.setattr(jobs, 'submit', submit)
+    return submitted
+
+
+def test_recalculation_modes_do_not_join_each_other(test_app, monkeypatch):
+    submitted = _fake_submit(monkeypatch)
+    incremental = test_app.put('/1/recalculate_matrix', params={'graph_type': 'car'})
+    full = test_app.put('/1/recalculate_matrix', params={'graph_type': 'car', 'mode': 'full'})
+
+    assert submitted[0] != submitted[1]
+    assert incremental.json()['status'] == 'in_progress'
+    assert full.json()['job_id'] == 'job2'
+    assert full.headers['location'] == '/jobs/job2'
+
+
+def test_region_assessment_keeps_its_response_body(test_app, monkeypatch):
+    _fake_submit(monkeypatch)
+    response = test_app.post('/1/transport_indicator_region')
+
+    assert response.json() == RESPONSE_MESSAGE
+    assert response.headers['x-job-id'] == 'job1'
@@ -0,0 +1,29 @@
+import os
+import time
+
+from app.api.utils import jobs
+
+
+def _crash():
+    os._exit(1)
+
+def _answer(value):
+    return value
+
+
+def _wait(job, timeout=60):
+    deadline = time.monotonic() + timeout
+    while jobs.get(job.id).status in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return jobs.get(job.id)
+
+
+def test_dead_worker_fails_its_job_and_the_pool_recovers():
+    # region ids outside REGIONS_DICT need no artifacts
+    crashed = _wait(jobs.submit('crash', 999001, _crash))
+    assert crashed.status == 'failed'
+    assert 'died' in crashed.error
+
+    answered = _wait(jobs.submit('answer', 999002, _answer, 42))
+    assert answered.status == 'done'
+    assert answered.result == 42
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+from app.api.utils import layer_store
+
+
+def test_concurrent_refreshes_share_one_fetch(tmp_path, monkeypatch):
+    monkeypatch.setattr(layer_store, 'DATA_PATH', str(tmp_path))
+    calls = []
+
+    def fetch(region_id, type_id):
+        calls.append(type_id)
+        time.sleep(0.2)
+        return gpd.GeoDataFrame({'name': ['a']}, geometry=[Point(30, 60)], crs=4326)
+
+    monkeypatch.setitem(layer_store.LAYER_SOURCES, 'bus_stops', (fetch, 10))
+    threads = [threading.Thread(target=layer_store.refresh_layer, args=(1, 'bus_stops')) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [10]
+    assert layer_store.get_layer(1, 'bus_stops')['name'].tolist() == ['a']
+    assert layer_store.read_manifest(1)['bus_stops']['count'] == 1
+    assert not list((tmp_path / 'layers/1').glob('*.tmp'))
+
+
+def test_one_scheduler_holds_the_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(layer_store, 'DATA_PATH', str(tmp_path))
+    first = layer_store._scheduler_lock()
+    assert first is not None
+    assert layer_store._scheduler_lock() is None
+    first.close()
+    second = layer_store._scheduler_lock()
+    assert second is not None
+    second.close()
+
+
+def test_refresh_round_survives_a_broken_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(layer_store, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(layer_store, 'REGIONS_DICT', {1: 'a', 2: 'b'})
+    monkeypatch.setattr(layer_store, 'LAYER_SOURCES', {'bus_stops': (None, 10)})
+    os.makedirs(layer_store._region_dir(1))
+    layer_store._update_manifest(1, 'bus_stops', {'fetched_at': 'not a date', 'count': 0})
+    refreshed = []
+    monkeypatch.setattr(layer_store, 'refresh_region', lambda region_id, layers: refreshed.append((region_id, layers)))
+
+    layer_store._refresh_round(3600)
+
+    assert refreshed == [(2, ['bus_stops'])]
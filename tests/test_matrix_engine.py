@@ -0,0 +1,61 @@
+import math
+
+import geopandas as gpd
+import networkx as nx
+import pytest
+from shapely.geometry import Point, box
+
+from app.api.utils import graph_store, matrix_engine, spatial_index
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(graph_store, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(spatial_index, 'DATA_PATH', str(tmp_path))
+    (tmp_path / 'graphs').mkdir()
+    return tmp_path
+
+
+def test_matrix_matches_networkx_shortest_paths(data_path):
+    graph = nx.MultiDiGraph(crs=32636)
+    for node, (x, y) in {1: (0, 0), 2: (100, 0), 3: (200, 0), 4: (0, 500)}.items():
+        graph.add_node(node, x=float(x), y=float(y))
+    graph.add_edge(1, 2, time_min=5.0)
+    graph.add_edge(1, 2, time_min=2.0) # parallel edge, the faster one counts
+    graph.add_edge(2, 3, time_min=1.0)
+    graph.add_edge(3, 1, time_min=4.0)
+    graph_store.save_graph(graph, 1, 'car')
+
+    points = gpd.GeoDataFrame(geometry=[Point(1, 1), Point(199, 2), Point(3, 498)], index=[10, 30, 40], crs=32636)
+    matrix = matrix_engine.accessibility_matrix(1, 'car', points, workers=1)
+
+    assert list(matrix.index) == [10, 30, 40]
+    assert list(matrix.columns) == [10, 30, 40]
+    assert matrix.loc[10, 30] == pytest.approx(3.0)
+    assert matrix.loc[30, 10] == pytest.approx(4.0)
+    assert math.isinf(matrix.loc[10, 40])
+
+
+def test_node_index_is_persisted_and_follows_the_graph(data_path):
+    graph = nx.MultiDiGraph(crs=32636)
+    graph.add_node(1, x=0.0, y=0.0)
+    graph.add_node(2, x=100.0, y=0.0)
+    graph.add_edge(1, 2, time_min=1.0)
+    graph_store.save_graph(graph, 1, 'car')
+
+    points = gpd.GeoDataFrame(geometry=[Point(90, 5)], index=[7], crs=32636)
+    assert spatial_index.snapped(1, 'settlements', points).loc[7, 'node_id'] == 2
+    assert spatial_index.index_exists(1, ('car',))
+    assert spatial_index.index_exists(1) # no inter graph, so no inter index is expected
+
+    graph_store.save_graph(graph, 1, 'car') # a rebuilt graph gets a new version
+    assert not spatial_index.index_exists(1, ('car',))
+
+
+def test_objects_within_groups_hits_by_polygon(data_path, monkeypatch):
+    layer = gpd.GeoDataFrame(geometry=[Point(5, 5), Point(50, 50), Point(6, 6), Point(500, 500)], crs=32636)
+    monkeypatch.setattr(spatial_index.layer_store, 'get_layer', lambda region_id, name: layer)
+    polygons = gpd.GeoSeries([box(40, 40, 60, 60), box(1000, 1000, 1001, 1001), box(0, 0, 10, 10)], crs=32636)
+
+    within = spatial_index.objects_within(1, 'bus_stops', polygons)
+    assert [sorted(positions.tolist()) for positions in within] == [[1], [], [0, 2]]
@@ -0,0 +1,78 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from app.api.schemes.enums import MatrixFormat
+from app.api.utils import matrix_formats
+
+
+@pytest.fixture
+def matrix(monkeypatch):
+    # several chunks, the last one partial
+    monkeypatch.setattr(matrix_formats, 'ROW_CHUNK', 2)
+    values = np.array([[0.0, 0.6893454, np.inf],
+                       [12.5, 0.0, 3.1],
+                       [np.inf, 7.25, 0.0],
+                       [1.1, 2.2, 3.3],
+                       [4.4, 5.5, 6.6]], dtype=np.float32)
+    return pd.DataFrame(values, index=[10, 11, 12, 13, 14], columns=[20, 21, 22])
+
+
+def _body(matrix_format, matrix):
+    return b''.join(matrix_formats.STREAMERS[matrix_format](matrix))
+
+def _expected_json(matrix):
+    return [[None if not np.isfinite(v) else float(str(v)) for v in row] for row in matrix.to_numpy()]
+
+
+def test_json_round_trip(matrix):
+    document = json.loads(_body(MatrixFormat.json, matrix))
+    assert document['index'] == matrix.index.tolist()
+    assert document['columns'] == matrix.columns.tolist()
+    assert document['values'] == _expected_json(matrix)
+    # float32 values keep their short form
+    assert b'0.6893454,' in _body(MatrixFormat.json, matrix)
+
+
+def test_ndjson_round_trip(matrix):
+    lines = [json.loads(line) for line in _body(MatrixFormat.ndjson, matrix).decode().splitlines()]
+    assert lines[0] == {'columns': matrix.columns.tolist()}
+    assert [line['id'] for line in lines[1:]] == matrix.index.tolist()
+    assert [line['values'] for line in lines[1:]] == _expected_json(matrix)
+
+
+def test_npz_round_trip(matrix):
+    body = _body(MatrixFormat.npz, matrix)
+    assert zipfile.is_zipfile(io.BytesIO(body))
+    archive = np.load(io.BytesIO(body), allow_pickle=False)
+    assert np.array_equal(archive['values'], matrix.to_numpy())
+    assert archive['values'].dtype == np.float32
+    assert archive['index'].tolist() == matrix.index.tolist()
+    assert archive['columns'].tolist() == matrix.columns.tolist()
+
+
+@pytest.mark.parametrize('matrix_format', [MatrixFormat.arrow, MatrixFormat.parquet])
+def test_arrow_and_parquet_round_trip(matrix, matrix_format):
+    body = _body(matrix_format, matrix)
+    if matrix_format == MatrixFormat.arrow:
+        table = pa.ipc.open_stream(body).read_all()
+    else:
+        table = pq.read_table(pa.BufferReader(body))
+        assert pq.ParquetFile(pa.BufferReader(body)).num_row_groups == 3
+    frame = table.to_pandas().set_index('id')
+    assert frame.index.tolist() == matrix.index.tolist()
+    assert frame.columns.tolist() == [str(c) for c in matrix.columns]
+    assert np.array_equal(frame.to_numpy(), matrix.to_numpy())
+    assert table.schema.field('20').type == pa.float32()
+
+
+def test_negotiate_format():
+    assert matrix_formats.negotiate_format(MatrixFormat.npz, 'application/x-ndjson') == MatrixFormat.npz
+    assert matrix_formats.negotiate_format(None, 'text/html, application/vnd.apache.arrow.stream;q=0.9') == MatrixFormat.arrow
+    assert matrix_formats.negotiate_format(None, None) == MatrixFormat.json
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.api.routers import router_get_matrix
+from app.api.utils.matrix_queries import k_nearest, sub_matrix
+
+
+@pytest.fixture
+def matrix():
+    values = np.array([[0.0, 5.0, 2.0, np.inf],
+                       [5.0, 0.0, 9.0, 1.0],
+                       [2.0, 9.0, 0.0, 4.0]], dtype=np.float32)
+    return pd.DataFrame(values, index=[1, 2, 3], columns=[1, 2, 3, 4])
+
+
+def test_sub_matrix_selects_ids_in_requested_order(matrix):
+    result = sub_matrix(matrix, [3, 1], [4, 2], max_time=4.5)
+    assert result.index.tolist() == [3, 1]
+    assert result.columns.tolist() == [4, 2]
+    assert result.dtypes.unique().tolist() == [np.float32]
+    assert result.loc[3, 4] == 4.0
+    assert np.isnan(result.loc[3, 2]) and np.isnan(result.loc[1, 4])
+
+
+def test_sub_matrix_empty_ids(matrix):
+    assert sub_matrix(matrix, [], None).shape == (0, 4)
+    assert sub_matrix(matrix, None, []).shape == (3, 0)
+
+
+def test_unknown_ids_are_reported(matrix):
+    with pytest.raises(KeyError) as error:
+        sub_matrix(matrix, [1, 7], [8])
+    assert error.value.args[0] == [7]
+    with pytest.raises(KeyError) as error:
+        k_nearest(matrix, [2], 1, destinations=[4, 9])
+    assert error.value.args[0] == [9]
+
+
+def test_k_nearest_skips_self_and_unreachable(matrix):
+    assert k_nearest(matrix, [1, 2], 2) == [
+        {'origin': 1, 'destinations': [3, 2], 'times': [2.0, 5.0]},
+        {'origin': 2, 'destinations': [4, 1], 'times': [1.0, 5.0]},
+    ]
+    assert k_nearest(matrix, [1], 2, exclude_self=False) == [{'origin': 1, 'destinations': [1, 3], 'times': [0.0, 2.0]}]
+
+
+def test_k_larger_than_columns(matrix):
+    # origin 1 cannot reach 4, and itself is excluded
+    assert k_nearest(matrix, [1], 10) == [{'origin': 1, 'destinations': [3, 2], 'times': [2.0, 5.0]}]
+    assert k_nearest(matrix, [3], 10, max_time=3) == [{'origin': 3, 'destinations': [1], 'times': [2.0]}]
+
+
+def test_k_nearest_empty_ids(matrix):
+    assert k_nearest(matrix, [], 3) == []
+    assert k_nearest(matrix, [1, 2], 3, destinations=[]) == [
+        {'origin': 1, 'destinations': [], 'times': []},
+        {'origin': 2, 'destinations': [], 'times': []},
+    ]
+
+
+def test_nearest_route_passes_exclude_self(test_app, monkeypatch, matrix):
+    monkeypatch.setattr(router_get_matrix, 'load_matrix_slice', lambda region_id, graph_type, origins, destinations: matrix)
+
+    params = {'graph_type': 'car', 'origins': [1], 'k': 1}
+    assert test_app.get('/1/get_nearest', params=params).json()[0]['destinations'] == [3]
+    assert test_app.get('/1/get_nearest', params={**params, 'exclude_self': False}).json()[0]['destinations'] == [1]
+    assert test_app.get('/1/get_nearest', params={**params, 'origins': [7]}).status_code == 404
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.api.utils import matrix_store
+from app.api.utils.matrix_tiles import TiledMatrix, write_tiles
+
+
+@pytest.mark.parametrize('dtype', ['uint16', 'float32'])
+def test_tiles_roundtrip_within_precision(tmp_path, dtype):
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 600, size=(70, 45))
+    values[3, 7] = np.inf
+    file_path = str(tmp_path / '1_car_matrix.tiles')
+    write_tiles(values, file_path, dtype, resolution=0.1, tile_size=16)
+
+    tiled = TiledMatrix(file_path, np.arange(100, 170), np.arange(200, 245))
+    decoded = tiled.read()
+    assert np.isinf(decoded[3, 7])
+    finite = np.isfinite(values)
+    assert np.abs(decoded[finite] - values[finite]).max() <= 0.05 + 1e-4
+
+    part = tiled.frame([150, 103], [244, 207])
+    assert np.array_equal(part.to_numpy(), decoded[np.ix_([50, 3], [44, 7])])
+    with pytest.raises(KeyError):
+        tiled.frame([999])
+
+
+def test_tiled_matrix_is_opened_once_per_file_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(matrix_store, 'DATA_PATH', str(tmp_path))
+    monkeypatch.setattr(matrix_store, 'MATRIX_STORAGE', 'tiles')
+    (tmp_path / 'matrices').mkdir()
+    matrix_store.save_matrix(pd.DataFrame([[0.0, 1.0], [1.0, 0.0]], index=[5, 6], columns=[5, 6]), 1, 'car')
+
+    first = matrix_store.open_tiled(1, 'car')
+    assert first is matrix_store.open_tiled(1, 'car')
+
+    matrix_store.save_matrix(pd.DataFrame([[0.0]], index=[5], columns=[5]), 1, 'car')
+    second = matrix_store.open_tiled(1, 'car')
+    assert second is not first
+    assert second.shape == (1, 1)
+    # closing the shared view must not break the other readers
+    with second:
+        pass
+    second.close()
+    assert matrix_store.open_tiled(1, 'car') is second
+    assert second.read()[0, 0] == 0.0
+
+
+def test_own_tiled_matrix_closes(tmp_path):
+    file_path = str(tmp_path / 'values.tiles')
+    write_tiles(np.zeros((2, 2)), file_path)
+    with TiledMatrix(file_path, np.arange(2), np.arange(2)) as tiled:
+        assert tiled.read().shape == (2, 2)
+    assert tiled._mmap.closed
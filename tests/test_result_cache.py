@@ -0,0 +1,25 @@
+import geopandas as gpd
+from shapely.geometry import Polygon
+from app.api.utils.result_cache import ResultCache, geometry_hash
+
+
+def test_geometry_hash_ignores_vertex_order():
+    square = Polygon([(30, 60), (30.1, 60), (30.1, 60.1), (30, 60.1)])
+    reversed_square = Polygon([(30.1, 60.1), (30.1, 60), (30, 60), (30, 60.1)])
+    assert geometry_hash(gpd.GeoDataFrame(geometry=[square], crs=4326)) == \
+        geometry_hash(gpd.GeoDataFrame(geometry=[reversed_square], crs=4326))
+
+
+def test_result_cache_lru():
+    cache = ResultCache('test', max_entries=2, max_bytes=1024 * 1024)
+    calls = []
+    compute = lambda key: cache.get(key, lambda: calls.append(key) or [key])
+
+    assert compute('a') == ['a']
+    compute('b')
+    compute('a')
+    compute('c') # evicts b, the least recently used
+    compute('a')
+    compute('b')
+    assert calls == ['a', 'b', 'c', 'b']
+    assert cache.stats()['entries'] == 2
@@ -0,0 +1,25 @@
+import threading
+import time
+
+from app.api.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.1)
+        return 'built'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('key', build))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ['built'] * 5
+    assert not flights.in_flight('key')
@@ -0,0 +1,24 @@
+from app.api.utils import build_pipeline
+from app.api.utils.constants import REGIONS_DICT
+
+
+def test_ready_ignores_on_demand_steps(test_app, monkeypatch):
+    # FRAME_GRADE_SOURCE defaults to 'frame', the grade grid is then only built on demand
+    assert 'grade_grid' not in build_pipeline.STARTUP_STEPS
+    monkeypatch.setattr(build_pipeline, '_states', {
+        (region_id, step): build_pipeline.StepResult(region_id, step, 'ready')
+        for region_id in REGIONS_DICT for step in build_pipeline.STARTUP_STEPS
+    })
+
+    response = test_app.get('/ready')
+    assert response.status_code == 200
+    body = response.json()
+    assert body['ready'] is True
+    assert all('grade_grid' not in steps for steps in body['regions'].values())
+
+    region_id = next(iter(REGIONS_DICT))
+    build_pipeline._states[(region_id, 'car_matrix')] = build_pipeline.StepResult(region_id, 'car_matrix', 'failed')
+    build_pipeline._states[(region_id, 'grade_grid')] = build_pipeline.StepResult(region_id, 'grade_grid', 'building')
+    body = test_app.get('/ready').json()
+    assert body['ready'] is False
+    assert body['regions'][str(region_id)]['grade_grid'] == 'building'